@@ -0,0 +1,34 @@
+""" asyncio driver for benchmarks/loadtest.py (Python 3.5+) """
+
+import asyncio
+from time import monotonic
+
+
+def run(provider, messages, concurrency, latencies):
+    """ Send messages with `provider.async_send`, at most `concurrency` at a time
+
+        :returns: The number of failed messages
+    """
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        errors = 0
+
+        async def send(message):
+            nonlocal errors
+            async with semaphore:
+                t0 = monotonic()
+                try:
+                    await provider.async_send(message)
+                except Exception:
+                    errors += 1
+                latencies.append(monotonic() - t0)
+
+        await asyncio.gather(*[send(m) for m in messages])
+        provider.async_api.close()
+        return errors
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
@@ -0,0 +1,214 @@
+#! /usr/bin/env python
+""" Local stand-in for the Vianett SMSC: serves the MT API, and fires /im and /status callbacks
+
+    Run it standalone:
+
+        python benchmarks/_smsc.py --port 8080 --latency 0.005 --callback-url http://localhost:5000/vianett/main
+
+    or start it in a subprocess with :func:`start_process`.
+"""
+
+import time
+import random
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from itertools import count
+
+try: # Py3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlencode
+    from urllib.request import urlopen
+except ImportError: # Py2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+    from urllib import urlencode
+    from urllib2 import urlopen
+
+
+MT_PATH = '/V3/CPA/MT/MT.ashx'
+
+
+class SmscSimulator(ThreadingMixIn, HTTPServer):
+    """ SMSC simulator
+
+        * `POST /V3/CPA/MT/MT.ashx`: accepts a message after `latency` (+ `jitter`) seconds.
+          Fails with `error_code` for a share of `error_rate` messages,
+          and with HTTP 429 when more than `throttle` messages per second arrive.
+          Accepted messages get a 'DELIVRD' status callback after `status_delay` seconds.
+        * `POST /_sim/im`, `count=N`: fires N incoming message callbacks.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_code='103', throttle=None,
+                 callback_url=None, status_delay=0.0, callback_workers=4, seed=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), SmscHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.throttle = throttle
+        self.callback_url = callback_url
+        self.status_delay = status_delay
+
+        self._random = random.Random(seed)
+        self._refnos = count(1)
+        self._lock = threading.Lock()
+        self._throttle_window = deque()  # arrival times within the last second
+
+        # Callbacks
+        self._callbacks = deque()
+        self._callbacks_cond = threading.Condition()
+        self._stopped = False
+        for i in range(callback_workers if callback_url else 0):
+            t = threading.Thread(target=self._callback_worker)
+            t.daemon = True
+            t.start()
+
+    @property
+    def host(self):
+        return '127.0.0.1:{}'.format(self.server_address[1])
+
+    def mt(self, params):
+        """ Handle an MT request
+
+            :rtype: (int, str)
+            :returns: (HTTP status, response body)
+        """
+        now = time.time()
+        with self._lock:
+            # Throttling
+            if self.throttle:
+                window = self._throttle_window
+                while window and window[0] < now - 1.0:
+                    window.popleft()
+                if len(window) >= self.throttle:
+                    return 429, 'Too Many Requests'
+                window.append(now)
+            refno = next(self._refnos)
+            failed = self._random.random() < self.error_rate
+            delay = self.latency + self._random.random() * self.jitter
+
+        time.sleep(delay)
+        if failed:
+            return 200, '<?xml version="1.0"?><ack refno="{}" errorcode="{}">Failed</ack>'.format(refno, self.error_code)
+        if self.callback_url:
+            self._callback(now + self.status_delay, '/status', {
+                'refno': refno, 'requesttype': 'notificationstatus',
+                'Status': 'DELIVRD', 'StatusDescription': 'Delivered', 'StatusCode': '0',
+            })
+        return 200, '<?xml version="1.0"?><ack refno="{}" errorcode="200">OK</ack>'.format(refno)
+
+    def im(self, n):
+        """ Fire `n` incoming message callbacks """
+        now = time.time()
+        for i in range(n):
+            self._callback(now, '/im', {
+                'refno': next(self._refnos), 'requesttype': 'mo', 'sourceaddr': '4790000000',
+                'destinationaddr': '2021', 'prefix': 'TEST', 'message': 'Hello', 'retrycount': '0',
+                'operator': '1', 'replypathid': '0',
+            })
+
+    def _callback(self, due, path, params):
+        with self._callbacks_cond:
+            self._callbacks.append((due, path, params))
+            self._callbacks_cond.notify()
+
+    def _callback_worker(self):
+        """ Thread: deliver callbacks in order """
+        while True:
+            with self._callbacks_cond:
+                while not self._callbacks and not self._stopped:
+                    self._callbacks_cond.wait()
+                if self._stopped:
+                    return
+                due, path, params = self._callbacks.popleft()
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                urlopen(self.callback_url + path + '?' + urlencode(params)).read()
+            except Exception:
+                pass  # Vianett would retry; the simulator does not
+
+    def stop(self):
+        with self._callbacks_cond:
+            self._stopped = True
+            self._callbacks_cond.notify_all()
+        self.shutdown()
+        self.server_close()
+
+
+class SmscHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are separate writes: don't wait for a delayed ACK
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'] or 0)).decode('ascii')
+        params = dict((k, v[0]) for k, v in parse_qs(body).items())
+        if self.path == MT_PATH:
+            status, text = self.server.mt(params)
+        elif self.path == '/_sim/im':
+            self.server.im(int(params.get('count', 1)))
+            status, text = 200, 'OK'
+        else:
+            status, text = 404, 'Not Found'
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _serve(conn, options):
+    """ Subprocess: run the simulator until told to stop """
+    server = SmscSimulator(**options)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    conn.send(server.host)
+    conn.recv()
+    server.stop()
+
+
+def start_process(**options):
+    """ Start the simulator in a subprocess, so that it does not eat the client's CPU time
+
+        :param options: :class:`SmscSimulator` options
+        :rtype: (str, callable)
+        :returns: (host, stop function)
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(child, options))
+    process.daemon = True
+    process.start()
+    host = parent.recv()
+
+    def stop():
+        parent.send(None)
+        process.join()
+    return host, stop
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vianett SMSC simulator')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='MT response delay, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of failed messages')
+    parser.add_argument('--error-code', default='103', help='Vianett errorcode for failed messages')
+    parser.add_argument('--throttle', type=int, default=None, help='Max messages per second, then HTTP 429')
+    parser.add_argument('--callback-url', default=None, help='Receiver URL: <prefix>/<provider-name>')
+    parser.add_argument('--status-delay', type=float, default=0.0, help='Status callback delay, seconds')
+    args = parser.parse_args()
+
+    server = SmscSimulator(args.port, args.latency, args.jitter, args.error_rate, args.error_code, args.throttle,
+                           args.callback_url, args.status_delay)
+    print('SMSC simulator on http://{}'.format(server.host))
+    server.serve_forever()
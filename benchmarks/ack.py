@@ -0,0 +1,16 @@
+#! /usr/bin/env python
+""" Benchmark: <ack> response parser, fast path vs XML parser """
+
+from timeit import timeit
+
+from smsframework_vianett.ack import parse_ack, parse_ack_xml
+
+
+RESPONSE = b'<?xml version="1.0"?><ack refno="19194091" errorcode="200">OK</ack>'
+
+
+if __name__ == '__main__':
+    n = 100000
+    for name, f in (('parse_ack (fast path)', parse_ack), ('parse_ack_xml', parse_ack_xml)):
+        t = timeit(lambda: f(RESPONSE), number=n)
+        print('{:24s}: {:10,.0f} ack/s, {:6.2f} us/ack'.format(name, n / t, t / n * 1e6))
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+""" Benchmark: concurrent status callbacks through the ASGI receiver, without a server """
+
+import sys
+import asyncio
+from time import time
+
+from smsframework import Gateway
+from smsframework_vianett import VianettProvider
+
+
+QUERY = 'refno={}&requesttype=notificationstatus&Status=DELIVRD&StatusDescription=Delivered&StatusCode=0'
+
+
+async def callback(app, i):
+    scope = {'type': 'http', 'method': 'GET', 'path': '/main/status', 'headers': [],
+             'query_string': QUERY.format(i).encode('ascii')}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status']
+
+
+def bench(n, **options):
+    """ Fire `n` callbacks at once
+
+        :returns: callbacks per second
+    """
+    gw = Gateway()
+    received = []
+    gw.onStatus += received.append
+    provider = gw.add_provider('main', VianettProvider, user='bench', password='bench', **options)
+    app = provider.make_asgi_app()
+
+    async def main():
+        return await asyncio.gather(*[callback(app, i) for i in range(n)])
+
+    start = time()
+    statuses = asyncio.run(main())
+    provider.close()
+    elapsed = time() - start
+    assert statuses == [200] * n and len(received) == n
+    return n / elapsed
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 7):
+        sys.exit(0)
+    n = 20000
+    for name, options in (('executor', {}), ('ingest', {'ingest': dict(maxsize=n)})):
+        print('ASGI {:8s}: {:8,.0f} callbacks/s, {} concurrent'.format(name, bench(n, **options), n))
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+""" Benchmark: event log writes and aggregation, against JSON lines """
+
+import os
+import json
+import shutil
+import tempfile
+from time import time
+
+from smsframework_vianett.eventlog import EventLog, EventLogReader, RECORD, STATUS, DELIVERED
+
+
+def bench_binary(path, n):
+    """ Log `n` sent messages and `n` reports, then aggregate
+
+        :returns: (events/s written, events/s aggregated, bytes per event)
+    """
+    log = EventLog(path)
+    start = time()
+    for i in range(n):
+        log.sent(i + 1, 1000000 + i, segments=1, latency=0.05)
+        log.put(_status(i))
+    log.close()
+    written = 2 * n / (time() - start)
+
+    start = time()
+    EventLogReader(path).aggregate()
+    aggregated = 2 * n / (time() - start)
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return written, aggregated, size / (2.0 * n)
+
+
+def bench_json(path, n):
+    """ The same events as JSON lines
+
+        :returns: (events/s written, bytes per event)
+    """
+    filename = os.path.join(path, 'events.json')
+    start = time()
+    with open(filename, 'w') as f:
+        for i in range(n):
+            f.write(json.dumps({'kind': 'sent', 'time': start, 'msgid': str(i + 1), 'refno': str(1000000 + i),
+                                'segments': 1, 'latency': 0.05}) + '\n')
+            f.write(json.dumps({'kind': 'status', 'time': start, 'refno': str(1000000 + i), 'ErrorCode': '200',
+                                'OperatorID': str(i % 10), 'CountryID': '47', 'CPACost': '0,50', 'NetPrice': '0.25'}) + '\n')
+    return 2 * n / (time() - start), os.path.getsize(filename) / (2.0 * n)
+
+
+def _status(i):
+    """ A packed delivery report """
+    return RECORD.pack(STATUS, DELIVERED, 0, i % 10, 47, 200, time(), float('nan'), 0, 1000000 + i, 0.5, 0.25)
+
+
+if __name__ == '__main__':
+    n = 100000
+    for name, bench in (('binary', bench_binary), ('json', bench_json)):
+        path = tempfile.mkdtemp()
+        try:
+            result = bench(path, n)
+        finally:
+            shutil.rmtree(path)
+        if name == 'binary':
+            print('EventLog binary: {:10,.0f} events/s written, {:10,.0f} events/s aggregated, {:.0f} bytes/event'.format(*result))
+        else:
+            print('JSON lines     : {:10,.0f} events/s written, {:.0f} bytes/event'.format(*result))
@@ -0,0 +1,42 @@
+#! /usr/bin/env python
+""" Benchmark: import time of the package, in fresh interpreters """
+
+import sys
+import subprocess
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+
+STATEMENTS = (
+    'pass',  # the interpreter itself
+    'import smsframework_vianett.const',
+    'import smsframework_vianett',
+    'from smsframework_vianett import VianettProvider',
+    'import smsframework_vianett.receiver',  # what make_receiver_blueprint() loads
+)
+
+
+def bench(statement, n):
+    """ Run `statement` in `n` fresh interpreters
+
+        :returns: median wall time, seconds
+    """
+    times = []
+    for i in range(n):
+        t0 = monotonic()
+        subprocess.check_call([sys.executable, '-c', statement])
+        times.append(monotonic() - t0)
+    times.sort()
+    return times[len(times) // 2]
+
+
+if __name__ == '__main__':
+    n = 15
+    base = None
+    for statement in STATEMENTS:
+        t = bench(statement, n)
+        base = t if base is None else base
+        print('{:50s}: {:7.1f} ms (+{:6.1f} ms)'.format(statement, t * 1000, (t - base) * 1000))
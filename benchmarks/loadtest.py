@@ -0,0 +1,278 @@
+#! /usr/bin/env python
+""" Load test: VianettProvider against a local SMSC simulator
+
+    Sends messages in every mode (sync, threaded, batch, async, processes), receives their status callbacks,
+    and reports throughput, latency percentiles, CPU time and memory.
+    The simulator runs in a subprocess, so the figures are the client's only.
+    In the 'processes' mode, CPU time is the parent process's only: the workers send.
+
+    For CI, fail on regressions:
+
+        python benchmarks/loadtest.py --min-throughput 500 --max-p99 50
+"""
+
+import sys
+import json
+import socket
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try: # Py3
+    from time import monotonic, process_time
+except ImportError: # Py2
+    from time import time as monotonic, clock as process_time
+
+try: # Py3.4+
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try: # Unix
+    import resource
+except ImportError:
+    resource = None
+
+try: # Py3
+    from urllib.request import urlopen
+except ImportError: # Py2
+    from urllib2 import urlopen
+
+from flask import Flask
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+
+import _smsc
+
+
+MODES = ('sync', 'threaded', 'batch', 'async', 'processes')
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Receiver(object):
+    """ The provider's receiver blueprint, served over HTTP for the simulator's callbacks """
+
+    def __init__(self, gateway):
+        app = Flask(__name__)
+        gateway.receiver_blueprints_register(app, prefix='/vianett/')
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.url = 'http://127.0.0.1:{}/vianett/main'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class Counter(object):
+    """ Counts events, and remembers the first and the last one """
+
+    def __init__(self):
+        self.n = 0
+        self.first = self.last = None
+        self._lock = threading.Lock()
+
+    def __call__(self, obj):
+        now = monotonic()
+        with self._lock:
+            self.n += 1
+            self.first = self.first or now
+            self.last = now
+
+    def wait(self, n, timeout):
+        deadline = monotonic() + timeout
+        while self.n < n and monotonic() < deadline:
+            time.sleep(0.01)
+
+    def rate(self):
+        if self.n < 2:
+            return 0.0
+        return self.n / max(self.last - self.first, 1e-9)
+
+
+def free_port():
+    """ Reserve a free local port for the simulator: the provider needs its address before it starts """
+    s = socket.socket()
+    try:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of sorted values """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def drive(mode, provider, messages, concurrency):
+    """ Send messages in a mode
+
+        :returns: (latencies, errors)
+    """
+    latencies = []
+    errors = 0
+
+    if mode == 'sync':
+        for message in messages:
+            t0 = monotonic()
+            try:
+                provider.gateway.send(message)
+            except Exception:
+                errors += 1
+            latencies.append(monotonic() - t0)
+
+    elif mode == 'threaded':
+        def send(message):
+            t0 = monotonic()
+            try:
+                provider.gateway.send(message)
+                return monotonic() - t0, 0
+            except Exception:
+                return monotonic() - t0, 1
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for latency, failed in executor.map(send, messages):
+                latencies.append(latency)
+                errors += failed
+
+    elif mode in ('batch', 'processes'):
+        started = {}
+        def records():
+            for message in messages:
+                started[id(message)] = monotonic()
+                yield message
+        for message, result in provider.send_many(records(), concurrency=concurrency, ordered=False):
+            latencies.append(monotonic() - started.pop(id(message)))
+            errors += isinstance(result, Exception)
+
+    elif mode == 'async':
+        import _aio
+        errors = _aio.run(provider, messages, concurrency, latencies)
+
+    return latencies, errors
+
+
+def run(mode, args):
+    """ Run one mode against a fresh simulator and provider
+
+        :rtype: dict
+    """
+    gw = Gateway()
+    port = free_port()
+    provider = gw.add_provider('main', VianettProvider, user='bench', password='bench',
+                               endpoints=['127.0.0.1:{}'.format(port)],
+                               keepalive=dict(size=args.concurrency), async_pool=dict(max_connections=args.concurrency),
+                               metrics=True,
+                               processes=dict(concurrency=args.concurrency) if mode == 'processes' else None)
+    receiver = Receiver(gw)  # after the provider: its blueprint has the provider's routes
+    statuses, messages_in = Counter(), Counter()
+    gw.onStatus += statuses
+    gw.onReceive += messages_in
+
+    host, stop = _smsc.start_process(
+        port=port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle=args.throttle,
+        callback_url=receiver.url, status_delay=0.0,
+    )
+
+    messages = [OutgoingMessage('+4790000000', 'Load test message #{}'.format(i)) for i in range(args.messages)]
+    concurrency = 1 if mode == 'sync' else args.concurrency
+
+    # Send
+    if tracemalloc is not None:
+        tracemalloc.start()
+    cpu0, t0 = process_time(), monotonic()
+    latencies, errors = drive(mode, provider, messages, concurrency)
+    elapsed, cpu = monotonic() - t0, process_time() - cpu0
+    peak = 0
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # Receive: status callbacks, and incoming messages
+    statuses.wait(args.messages - errors, args.callback_timeout)
+    urlopen('http://{}/_sim/im'.format(host), b'count=' + str(args.incoming).encode('ascii')).read()
+    messages_in.wait(args.incoming, args.callback_timeout)
+
+    stop()
+    receiver.close()
+    provider.close()
+    assert statuses.n and messages_in.n, 'No callbacks arrived: is the receiver serving the provider?'
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'messages': args.messages,
+        'errors': errors,
+        'concurrency': concurrency,
+        'elapsed': elapsed,
+        'throughput': args.messages / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'cpu_s': cpu,
+        'cpu_us_per_msg': cpu / args.messages * 1e6,
+        'peak_alloc_mb': peak / 1048576.0,
+        'maxrss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 if resource else 0.0,
+        'statuses': statuses.n,
+        'statuses_per_s': statuses.rate(),
+        'incoming': messages_in.n,
+        'incoming_per_s': messages_in.rate(),
+        'responses': provider.metrics.responses_total.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VianettProvider load test against a local SMSC simulator')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated: ' + ', '.join(MODES))
+    parser.add_argument('--messages', type=int, default=1000, help='Messages per mode')
+    parser.add_argument('--incoming', type=int, default=200, help='Incoming message callbacks per mode')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.002, help='Simulated SMSC latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.001, help='Simulated SMSC latency jitter, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='Share of messages the SMSC fails')
+    parser.add_argument('--throttle', type=int, default=None, help='SMSC rate limit, messages per second')
+    parser.add_argument('--callback-timeout', type=float, default=30.0, help='Max wait for callbacks, seconds')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines')
+    parser.add_argument('--min-throughput', type=float, default=None, help='Fail if any mode is slower, msg/s')
+    parser.add_argument('--max-p99', type=float, default=None, help='Fail if any mode has a higher p99, ms')
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(',') if m]
+    if 'async' in modes and sys.version_info < (3, 5):
+        modes.remove('async')
+
+    failed = []
+    for mode in modes:
+        result = run(mode, args)
+        if args.json:
+            print(json.dumps(result, sort_keys=True))
+        else:
+            print('{mode:9s}: {throughput:8,.0f} msg/s, p50 {p50_ms:6.2f} ms, p90 {p90_ms:6.2f} ms, p99 {p99_ms:6.2f} ms, '
+                  'cpu {cpu_us_per_msg:6.1f} us/msg, peak {peak_alloc_mb:5.1f} MB, errors {errors}; '
+                  'callbacks: {statuses_per_s:6,.0f} status/s, {incoming_per_s:6,.0f} im/s'.format(**result))
+        if args.min_throughput is not None and result['throughput'] < args.min_throughput:
+            failed.append('{}: throughput {:.0f} < {:.0f} msg/s'.format(mode, result['throughput'], args.min_throughput))
+        if args.max_p99 is not None and result['p99_ms'] > args.max_p99:
+            failed.append('{}: p99 {:.2f} > {:.2f} ms'.format(mode, result['p99_ms'], args.max_p99))
+        if result['statuses'] < args.messages - result['errors'] or result['incoming'] < args.incoming:
+            failed.append('{}: lost callbacks'.format(mode))
+
+    for f in failed:
+        print('FAIL ' + f)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+#! /usr/bin/env python
+""" Benchmark: api_request overhead with metrics disabled vs enabled """
+
+from timeit import timeit
+
+from smsframework_vianett.api import VianettHttpApi
+from smsframework_vianett.metrics import Metrics
+
+
+RESPONSE = b'<?xml version="1.0"?><ack refno="19194091" errorcode="200">OK</ack>'
+
+
+if __name__ == '__main__':
+    n = 100000
+    for name, metrics in (('disabled', None), ('enabled', Metrics())):
+        api = VianettHttpApi('kolypto', '1234', metrics=metrics)
+        api._api_request = lambda method, **params: RESPONSE
+        t = timeit(lambda: api.api_request('MT'), number=n)
+        print('metrics {:9s}: {:10,.0f} req/s, {:6.2f} us/req'.format(name, n / t, t / n * 1e6))
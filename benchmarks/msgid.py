@@ -0,0 +1,31 @@
+#! /usr/bin/env python
+""" Benchmark: msgid generator throughput """
+
+import threading
+from time import time
+
+from smsframework_vianett.msgid import SnowflakeMsgidGenerator
+
+
+def bench(gen, n, threads):
+    """ Generate `n` ids in each of `threads` threads
+
+        :returns: ids per second
+    """
+    def worker():
+        for i in range(n):
+            gen()
+
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    start = time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return n * threads / (time() - start)
+
+
+if __name__ == '__main__':
+    gen = SnowflakeMsgidGenerator()
+    for threads in (1, 4, 16):
+        print('SnowflakeMsgidGenerator, {:2d} threads: {:10,.0f} ids/s'.format(threads, bench(gen, 200000 // threads, threads)))
@@ -0,0 +1,29 @@
+#! /usr/bin/env python
+""" Benchmark: destination normalization, with and without the cache """
+
+import random
+from time import time
+
+from smsframework_vianett.numbers import NumberNormalizer
+
+
+def bench(normalizer, numbers):
+    """ Normalize all `numbers`
+
+        :returns: numbers per second
+    """
+    start = time()
+    for number in numbers:
+        normalizer.destination(number)
+    return len(numbers) / (time() - start)
+
+
+if __name__ == '__main__':
+    # A campaign: 1000 recipients, messaged 100 times each
+    recipients = ['+47 {:03d} {:05d}'.format(random.randint(400, 999), i) for i in range(1000)]
+    numbers = recipients * 100
+    random.shuffle(numbers)
+
+    for name, cache_size in (('uncached', 0), ('cached', 10000)):
+        normalizer = NumberNormalizer(cache_size=cache_size)
+        print('NumberNormalizer {:8s}: {:10,.0f} numbers/s'.format(name, bench(normalizer, numbers)))
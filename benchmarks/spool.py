@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+""" Benchmark: spool write throughput: one writer vs concurrent writers (group commit) vs enqueue_many """
+
+import os
+import shutil
+import tempfile
+import threading
+from time import time
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+
+
+def provider(path, synchronous):
+    gw = Gateway()
+    p = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                        spool=dict(path=path, synchronous=synchronous))
+    p.api.sendmsg = lambda to, text, **params: '1'
+    return p
+
+
+def one_writer(p, n):
+    for i in range(n):
+        p.spool.enqueue(OutgoingMessage('+123456', 'hey'))
+
+
+def many_writers(p, n, threads=16):
+    ts = [threading.Thread(target=one_writer, args=(p, n // threads)) for i in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+
+def batch(p, n, size=100):
+    for i in range(n // size):
+        p.spool.enqueue_many([OutgoingMessage('+123456', 'hey') for j in range(size)])
+
+
+if __name__ == '__main__':
+    n = 2000
+    tmp = tempfile.mkdtemp()
+    try:
+        for synchronous in ('FULL', 'NORMAL'):
+            for name, f in (('1 writer', one_writer), ('16 writers', many_writers), ('enqueue_many(100)', batch)):
+                p = provider(os.path.join(tmp, '{}-{}.db'.format(synchronous, name)), synchronous)
+                t0 = time()
+                f(p, n)
+                t = time() - t0
+                p.close()
+                print('{:6s} {:18s}: {:10,.0f} msg/s'.format(synchronous, name, n / t))
+    finally:
+        shutil.rmtree(tmp)
@@ -1 +1,37 @@
-from .provider import VianettProvider
+""" Vianett provider for smsframework
+
+    Public names are imported lazily, on first access (PEP 562):
+    `import smsframework_vianett.const` does not load `smsframework`, `urllib` or the API client.
+"""
+
+import sys
+from importlib import import_module
+
+#: Public name -> module that defines it
+_lazy = {
+    'VianettProvider': '.provider',
+    'VianettHttpApi': '.api',
+    'VianettApiError': '.api',
+    'parse_ack': '.ack',
+    'Ack': '.ack',
+}
+
+__all__ = sorted(_lazy)
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        try:
+            module = _lazy[name]
+        except KeyError:
+            raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+        value = getattr(import_module(module, __name__), name)
+        globals()[name] = value  # next time, no __getattr__()
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_lazy))
+else:  # no module __getattr__: import eagerly
+    from .provider import VianettProvider
+    from .api import VianettHttpApi, VianettApiError
+    from .ack import parse_ack, Ack
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import hashlib
+import threading
+from bisect import bisect
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+from .api import VianettApiError, send_many
+from .breaker import is_endpoint_failure
+
+
+class Account(object):
+    """ An account in the :class:`AccountPool`: its API client and its health """
+
+    __slots__ = ('name', 'api', 'inflight', 'sent', 'failed', 'errors', 'ejected_until', 'ejections')
+
+    def __init__(self, name, api):
+        #: Account name: the username
+        self.name = name
+        #: API client
+        self.api = api
+        #: Requests in progress
+        self.inflight = 0
+        #: Statistics: messages sent, and failed
+        self.sent = self.failed = 0
+        #: Consecutive failures
+        self.errors = 0
+        #: Monotonic time when the ejected account comes back, if ejected
+        self.ejected_until = 0.0
+        #: Statistics: the number of times the account was ejected
+        self.ejections = 0
+
+    @property
+    def ejected(self):
+        """ Is the account out of rotation?
+
+            :rtype: bool
+        """
+        return self.ejected_until > monotonic()
+
+    def __repr__(self):
+        return '{}({!r}, inflight={}, ejected={})'.format(self.__class__.__name__, self.name, self.inflight, self.ejected)
+
+
+class AccountPool(object):
+    """ Several Vianett accounts behind one API client interface
+
+        Every message goes to one account, chosen by the `routing` strategy:
+
+        * 'round-robin': accounts take turns
+        * 'least-loaded': the account with the fewest requests in progress
+        * 'hash': consistent hashing by destination: a destination always goes to the same account,
+          and adding or removing an account moves only its share of destinations
+
+        An account that fails `eject_after` times in a row (connection errors, HTTP 5xx, or `eject_codes`)
+        is ejected for `eject_time` seconds: its messages go to the other accounts.
+        When it comes back, one more failure ejects it again. When every account is ejected, all of them are used.
+
+        Has the same sending methods as :class:`smsframework_vianett.api.VianettHttpApi`. Thread-safe.
+    """
+
+    ROUTING = ('round-robin', 'least-loaded', 'hash')
+
+    def __init__(self, accounts, routing='round-robin', eject_after=5, eject_time=30.0, eject_codes=(), replicas=100):
+        """ Create a pool
+
+            :type accounts: list[Account]
+            :param accounts: Accounts, with their API clients
+            :type routing: str
+            :param routing: Routing strategy: 'round-robin', 'least-loaded', 'hash'
+            :type eject_after: int
+            :param eject_after: Eject an account after this many consecutive failures
+            :type eject_time: float
+            :param eject_time: How long an ejected account stays out, seconds
+            :type eject_codes: collections.Iterable
+            :param eject_codes: Vianett `errorcode`s that count as account failures: e.g., authentication errors
+            :type replicas: int
+            :param replicas: 'hash' routing: points per account on the hash ring
+        """
+        assert accounts, 'No accounts'
+        assert routing in self.ROUTING, 'Unsupported routing: {}'.format(routing)
+        self.accounts = list(accounts)
+        self.routing = routing
+        self.eject_after = eject_after
+        self.eject_time = eject_time
+        self.eject_codes = frozenset(str(c) for c in eject_codes)
+
+        self._next = 0
+        self._lock = threading.Lock()
+
+        # Hash ring: sorted point hashes, and their accounts
+        ring = sorted(((_hash(u'{}#{}'.format(account.name, i)), account)
+                       for account in self.accounts for i in range(replicas)), key=lambda point: point[0])
+        self._ring_keys = [h for h, account in ring]
+        self._ring = [account for h, account in ring]
+
+    #region Routing
+
+    def _healthy(self, account, now):
+        return account.ejected_until <= now
+
+    def choose(self, dst):
+        """ Choose an account for a message, and count it in progress
+
+            Every chosen account must be released with :meth:`release`
+
+            :param dst: Destination number
+            :rtype: Account
+        """
+        now = monotonic()
+        with self._lock:
+            if self.routing == 'hash':
+                account = self._choose_hash(dst, now)
+            else:
+                account = self._choose_next(now)
+            account.inflight += 1
+            return account
+
+    def _choose_next(self, now):
+        """ 'round-robin' and 'least-loaded' routing """
+        accounts = self.accounts
+        n = len(accounts)
+        start = self._next
+        self._next = (start + 1) % n
+
+        best = None
+        for i in range(n):
+            account = accounts[(start + i) % n]
+            if not self._healthy(account, now):
+                continue
+            if self.routing == 'round-robin':
+                return account
+            if best is None or account.inflight < best.inflight:
+                best = account
+        return best or accounts[start]  # everyone is ejected
+
+    def _choose_hash(self, dst, now):
+        """ 'hash' routing: the first healthy account clockwise from the destination """
+        ring = self._ring
+        i = bisect(self._ring_keys, _hash(dst))
+        for j in range(len(ring)):
+            account = ring[(i + j) % len(ring)]
+            if self._healthy(account, now):
+                return account
+        return ring[i % len(ring)]  # everyone is ejected
+
+    def release(self, account, e=None):
+        """ Report the result of a request, and update the account's health
+
+            :type account: Account
+            :type e: Exception | None
+            :param e: The error, if any
+        """
+        failure = e is not None and (is_endpoint_failure(e) or
+                                     isinstance(e, VianettApiError) and str(e.code) in self.eject_codes)
+        with self._lock:
+            account.inflight -= 1
+            if e is None:
+                account.sent += 1
+            else:
+                account.failed += 1
+            if not failure:
+                account.errors = 0
+                return
+            account.errors += 1
+            if account.errors >= self.eject_after:
+                account.ejected_until = monotonic() + self.eject_time
+                account.ejections += 1
+
+    #endregion
+
+    def new_msgid(self):
+        """ Generate a message reference id
+
+            :rtype: str
+        """
+        return self.accounts[0].api.new_msgid()
+
+    def sendmsg(self, to, text, **params):
+        """ Send SMS message with one of the accounts
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.sendmsg`
+        """
+        account = self.choose(to)
+        try:
+            refno = account.api.sendmsg(to, text, **params)
+        except BaseException as e:
+            self.release(account, e)
+            raise
+        self.release(account)
+        return refno
+
+    def sendmsg_many(self, messages, concurrency=4, ordered=True):
+        """ Send many SMS messages concurrently
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.sendmsg_many`
+        """
+        return send_many(self.sendmsg, messages, concurrency, ordered)
+
+    def api_request(self, method, **params):
+        """ Make a custom request with the first account
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.api_request`
+        """
+        return self.accounts[0].api.api_request(method, **params)
+
+    def close(self):
+        """ Close persistent connections of every account """
+        for account in self.accounts:
+            account.api.close()
+
+
+def _hash(key):
+    """ 64-bit hash of a string, stable across processes
+
+        :rtype: int
+    """
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+    return struct.unpack('>Q', hashlib.md5(key).digest()[:8])[0]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+
+class Ack(object):
+    """ Vianett API response: `<ack refno=".." errorcode="..">text</ack>`
+
+        Compact, but behaves like the dict that the API used to return: `ack['refno']` works.
+    """
+
+    __slots__ = ('refno', 'errorcode', 'text', 'extra')
+
+    def __init__(self, refno, errorcode, text=None, extra=None):
+        #: Vianett message reference number
+        self.refno = refno
+        #: Error code: '200' is ok
+        self.errorcode = errorcode
+        #: Response text, if any
+        self.text = text
+        #: Other attributes, if any: dict | None
+        self.extra = extra
+
+    def keys(self):
+        keys = ['refno', 'errorcode', 'text']
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def __getitem__(self, key):
+        if key in Ack.__slots__[:3]:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        """ Convert to a dict
+
+            :rtype: dict
+        """
+        return {key: self[key] for key in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, Ack):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{cls}(refno={refno!r}, errorcode={errorcode!r}, text={text!r})'.format(
+            cls=self.__class__.__name__, refno=self.refno, errorcode=self.errorcode, text=self.text)
+
+
+#: Fast path: the usual <ack> shape, without entities or extra attributes
+_ACK_RE = r'\s*(?:<\?xml[^>]*\?>\s*)?<ack\s+refno="([^"&<]*)"\s+errorcode="([^"&<]*)"\s*(?:/>|>([^<&]*)</ack>)\s*\Z'
+_ack_re_str = re.compile(_ACK_RE)
+_ack_re_bytes = re.compile(_ACK_RE.encode('ascii'))
+
+
+def parse_ack(response):
+    """ Parse an API response
+
+        Responses of the known shape are parsed with a regular expression;
+        anything else falls back to the XML parser.
+
+        :type response: bytes | str
+        :rtype: Ack
+        :raises AssertionError: Invalid response
+    """
+    if isinstance(response, bytes):
+        m = _ack_re_bytes.match(response)
+        if m is not None:
+            refno, errorcode, text = m.groups()
+            try:
+                return Ack(refno.decode('utf-8'), errorcode.decode('utf-8'), text.decode('utf-8') if text else None)
+            except UnicodeDecodeError:
+                return parse_ack_xml(response)
+    else:
+        m = _ack_re_str.match(response)
+        if m is not None:
+            refno, errorcode, text = m.groups()
+            return Ack(refno, errorcode, text or None)
+    return parse_ack_xml(response)
+
+
+def parse_ack_xml(response):
+    """ Parse an API response with the XML parser
+
+        :type response: bytes | str
+        :rtype: Ack
+        :raises AssertionError: Invalid response
+    """
+    from xml.etree import ElementTree
+
+    try:
+        root = ElementTree.fromstring(response)
+    except ElementTree.ParseError as e:
+        raise AssertionError('Failed to parse response: {}: {}'.format(str(e), response))
+    assert root.tag == 'ack', 'Invalid response: {}'.format(response)
+    assert 'errorcode' in root.attrib, 'Invalid response: {}'.format(response)
+
+    attrib = dict(root.attrib)
+    return Ack(attrib.pop('refno', None), attrib.pop('errorcode'), root.text, attrib or None)
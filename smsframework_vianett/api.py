@@ -1,16 +1,28 @@
 # -*- coding: utf-8 -*-
 
-from xml.etree import ElementTree
-from datetime import datetime
+import socket
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 try: # Py3
-    from urllib.request import urlopen, Request
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+try: # Py3
+    from urllib.request import urlopen, Request, HTTPError, URLError
     from urllib.parse import urlencode
+    from http.client import HTTPException
 except ImportError: # Py2
-    from urllib2 import urlopen, Request
+    from urllib2 import urlopen, Request, HTTPError, URLError
     from urllib import urlencode
+    from httplib import HTTPException
 
-from . import const
+from . import encoding
+from .msgid import default_generator
+from .numbers import default_normalizer
+from .ack import parse_ack
+from .breaker import CircuitBreaker, CircuitOpenError, ConnectError, Endpoint, is_endpoint_failure
 
 
 class VianettApiError(RuntimeError):
@@ -20,16 +32,47 @@ class VianettApiError(RuntimeError):
         super(VianettApiError, self).__init__(message)
 
 
-class VianettHttpApi(object):
-    """ Vianett HTTP API client """
+class VianettApiBase(object):
+    """ Vianett HTTP API: the part that does not depend on the transport
 
-    def __init__(self, user, password, https=False):
+        Prepares requests and parses responses for :class:`VianettHttpApi`
+        and :class:`smsframework_vianett.async_api.AsyncVianettHttpApi`
+    """
+
+    #: API methods: paths
+    _methods = {
+        'MT': '/V3/CPA/MT/MT.ashx',  # Outgoing message
+    }
+
+    def __init__(self, user, password, https=False, limiter=None, retry=None, msgid_generator=None, max_segments=None,
+                 metrics=None, endpoints=None, breaker=None, numbers=None, events=None):
         """ Create an authenticated client
 
             :param user: Authentication: username
             :param password: Authentication: password
             :type https: bool
             :param https: Use HTTPS protocol for requests?
+            :type limiter: smsframework_vianett.ratelimit.RateLimiter | None
+            :param limiter: Rate limiter for requests
+            :type retry: smsframework_vianett.retry.RetryPolicy | None
+            :param retry: Retry policy for sending messages
+            :type msgid_generator: callable | None
+            :param msgid_generator: Function that generates a unique `msgid` for every message.
+                Default: :data:`smsframework_vianett.msgid.default_generator`
+            :type max_segments: int | None
+            :param max_segments: Reject messages longer than this many SMS segments locally. Default: no limit
+            :type metrics: smsframework_vianett.metrics.Metrics | None
+            :param metrics: Collect request metrics. Default: disabled
+            :type endpoints: list[str] | None
+            :param endpoints: API hosts, in the order of preference. Default: the Vianett SMSC
+            :type breaker: bool | dict | None
+            :param breaker: Use a circuit breaker for every endpoint?
+                `True`, or a dict of :class:`CircuitBreaker` options. Default: no
+            :type numbers: smsframework_vianett.numbers.NumberNormalizer | None
+            :param numbers: Normalizes and validates destinations and senders.
+                Default: :data:`smsframework_vianett.numbers.default_normalizer`
+            :type events: smsframework_vianett.eventlog.EventLog | None
+            :param events: Log sent messages. Default: disabled
         """
         self._auth = dict(
             username=user,
@@ -40,29 +83,284 @@ class VianettHttpApi(object):
         #: Provider API endpoint
         self._hostname = 'smsc.vianett.no'
 
-    def _api_request(self, method, **params):
-        """ Make an API request and return the result
+        #: Rate limiter, if any
+        self.limiter = limiter
 
-            :rtype: str
+        #: Retry policy, if any
+        self.retry = retry
+
+        #: Message id generator
+        self.msgid_generator = msgid_generator or default_generator
+
+        #: Max message length, SMS segments
+        self.max_segments = max_segments
+
+        #: Request metrics, if enabled
+        self.metrics = metrics
+
+        #: Number normalizer
+        self.numbers = numbers or default_normalizer
+
+        #: Event log, if enabled
+        self.events = events
+
+        #: API endpoints, in the order of preference
+        self.endpoints = [
+            Endpoint(host, breaker=CircuitBreaker(**(breaker if isinstance(breaker, dict) else {})) if breaker else None)
+            for host in endpoints or [self._hostname]
+        ]
+
+    def _prepare_request(self, method, params):
+        """ Prepare an API request
+
+            :rtype: (str, bytes)
+            :returns: (path, POST body)
         """
-        url = {
-            'MT': '{schema}://{host}/V3/CPA/MT/MT.ashx',  # Outgoing message
-        }[method]
+        path = self._methods[method]
 
-        # Prepare the request
-        url = url.format(
-            schema='https' if self._https else 'http',
-            host=self._hostname,
-        )
         data = {}
         data.update(self._auth)
         data.update(params)
-        post = urlencode(data)
+        return path, urlencode(data).encode('ascii')
+
+    def _parse_response(self, response):
+        """ Parse an API response
+
+            :type response: bytes
+            :rtype: smsframework_vianett.ack.Ack
+            :raises AssertionError: Invalid response
+            :raises VianettApiError: Vianett error
+        """
+        ack = parse_ack(response)
+
+        # Error?
+        if ack.errorcode != '200':
+            raise VianettApiError(ack.errorcode, ack.text)
+
+        # Okay
+        return ack
+
+    def _parse_measured(self, response):
+        """ Parse an API response, and record the metrics
+
+            :type response: bytes
+            :rtype: smsframework_vianett.ack.Ack
+        """
+        metrics = self.metrics
+        t0 = monotonic()
+        try:
+            ack = self._parse_response(response)
+        except VianettApiError as e:
+            metrics.responses_total.inc(e.code)
+            raise
+        except AssertionError:
+            metrics.responses_total.inc('invalid')
+            raise
+        finally:
+            metrics.parse_seconds.observe(monotonic() - t0)
+        metrics.responses_total.inc(ack.errorcode)
+        return ack
+
+    def _available_endpoints(self):
+        """ Endpoints to try, in the order of preference: skips open circuits
+
+            :rtype: collections.Iterator
+        """
+        for endpoint in self.endpoints:
+            if endpoint.breaker is None or endpoint.breaker.allow():
+                yield endpoint
+
+    @staticmethod
+    def _endpoint_result(endpoint, e=None):
+        """ Report the result of a request to the endpoint's circuit breaker
+
+            :type endpoint: Endpoint
+            :type e: Exception | None
+            :param e: The error, if any
+            :rtype: bool
+            :returns: Can the request be repeated on the next endpoint?
+        """
+        if endpoint.breaker is not None:
+            if e is not None and is_endpoint_failure(e):
+                endpoint.breaker.failure()
+            else:
+                endpoint.breaker.success()
+        return isinstance(e, ConnectError)
+
+    @staticmethod
+    def _transport_error_code(e):
+        """ Get the `responses_total` metric label for a transport error """
+        if isinstance(e, HTTPError):
+            return 'http_{}'.format(e.code)
+        if isinstance(e, URLError):
+            return 'connection'
+        return 'error'
+
+    def new_msgid(self):
+        """ Generate a message reference id
+
+            :rtype: str
+        """
+        return self.msgid_generator()
+
+    def _sendmsg_params(self, to, text, params):
+        """ Prepare `MT` request parameters for :meth:`VianettHttpApi.sendmsg`
+
+            :rtype: dict
+        """
+        # Length
+        if self.max_segments is not None:
+            segments = encoding.plan(text).segments
+            assert segments <= self.max_segments, \
+                'Message is too long: {} SMS segments, max {}'.format(segments, self.max_segments)
+
+        # Params
+        params.update(
+            tel=self.numbers.destination(to),
+            msg=text
+        )
+
+        # msgid
+        if 'msgid' not in params:
+            params['msgid'] = self.new_msgid()
+
+        # Sender
+        if params.get('SenderAddress'):
+            sender, sender_type = self.numbers.sender(params['SenderAddress'])
+            params['SenderAddress'] = sender
+            if sender_type is not None:
+                params.setdefault('SenderAddressType', sender_type)
+
+        return params
+
+    def _log_sent(self, params, t0, refno=None, e=None):
+        """ Log a sent message to the event log, if enabled
+
+            :type params: dict
+            :param params: `MT` request parameters
+            :type t0: float
+            :param t0: Monotonic time when the request started
+        """
+        if self.events is not None:
+            self.events.sent(params['msgid'], refno, encoding.plan(params['msg']).segments, monotonic() - t0, e)
+
+    def _report(self, e=None):
+        """ Report the result of a request to the rate limiter
+
+            :type e: Exception | None
+            :param e: The error, if any
+        """
+        if self.limiter is None:
+            return
+        if e is None:
+            self.limiter.report()
+        elif isinstance(e, (HTTPError, VianettApiError)):
+            self.limiter.report(e.code)
+
+
+class VianettHttpApi(VianettApiBase):
+    """ Vianett HTTP API client """
+
+    def __init__(self, user, password, https=False, keepalive=None, limiter=None, retry=None, msgid_generator=None,
+                 max_segments=None, metrics=None, endpoints=None, breaker=None, connect_timeout=None, read_timeout=None,
+                 numbers=None, events=None):
+        """ Create an authenticated client
+
+            :param user: Authentication: username
+            :param password: Authentication: password
+            :type https: bool
+            :param https: Use HTTPS protocol for requests?
+            :type keepalive: bool | dict | None
+            :param keepalive: Reuse connections across requests?
+                `True` to use a connection pool with default settings,
+                or a dict of :class:`HttpConnectionPool` options: `size`, `idle_timeout`, `max_requests`, `timeout`, `ssl_context`.
+                Default: a new connection for every request
+            :type limiter: smsframework_vianett.ratelimit.RateLimiter | None
+            :param limiter: Rate limiter for requests
+            :type retry: smsframework_vianett.retry.RetryPolicy | None
+            :param retry: Retry policy for sending messages
+            :type msgid_generator: callable | None
+            :param msgid_generator: Function that generates a unique `msgid` for every message
+            :type max_segments: int | None
+            :param max_segments: Reject messages longer than this many SMS segments locally
+            :type metrics: smsframework_vianett.metrics.Metrics | None
+            :param metrics: Collect request metrics
+            :type endpoints: list[str] | None
+            :param endpoints: API hosts, in the order of preference.
+                When a host can't be connected to, the request goes to the next one
+            :type breaker: bool | dict | None
+            :param breaker: Use a circuit breaker for every endpoint? `True`, or a dict of :class:`CircuitBreaker` options
+            :type connect_timeout: float | None
+            :param connect_timeout: Timeout for connecting, seconds
+            :type read_timeout: float | None
+            :param read_timeout: Timeout for the response, seconds
+            :type numbers: smsframework_vianett.numbers.NumberNormalizer | None
+            :param numbers: Normalizes and validates destinations and senders
+            :type events: smsframework_vianett.eventlog.EventLog | None
+            :param events: Log sent messages
+        """
+        super(VianettHttpApi, self).__init__(user, password, https, limiter, retry, msgid_generator, max_segments,
+                                             metrics, endpoints, breaker, numbers, events)
+        self.read_timeout = read_timeout
+
+        # Connection pools: for persistent connections, a separate connect timeout, and failover.
+        # Otherwise, a new connection through urlopen() for every request
+        if keepalive or connect_timeout is not None or len(self.endpoints) > 1:
+            from .pool import HttpConnectionPool
+            options = dict(keepalive if isinstance(keepalive, dict) else {}, metrics=metrics)
+            if not keepalive:
+                options['size'] = 0  # don't keep connections
+            if connect_timeout is not None:
+                options['connect_timeout'] = connect_timeout
+            if read_timeout is not None:
+                options['timeout'] = read_timeout
+            for endpoint in self.endpoints:
+                endpoint.pool = HttpConnectionPool(endpoint.host, https, **options)
+
+    def _api_request(self, method, **params):
+        """ Make an API request and return the result
+
+            :rtype: str
+        """
+        path, post = self._prepare_request(method, params)
+
+        error = None
+        for endpoint in self._available_endpoints():
+            try:
+                response = self._endpoint_request(endpoint, path, post)
+            except Exception as e:
+                if not self._endpoint_result(endpoint, e):
+                    raise
+                error = e  # not sent: try the next endpoint
+                continue
+            self._endpoint_result(endpoint)
+            return response
+        raise error or CircuitOpenError('All Vianett API endpoints are unavailable')
+
+    def _endpoint_request(self, endpoint, path, post):
+        """ Make a request to an endpoint
+
+            :type endpoint: Endpoint
+            :rtype: bytes
+        """
+        # Request: pooled
+        if endpoint.pool is not None:
+            return endpoint.pool.request('POST', path, post, {'Content-Type': 'application/x-www-form-urlencoded'})
 
         # Request
+        url = '{schema}://{host}{path}'.format(
+            schema='https' if self._https else 'http',
+            host=endpoint.host,
+            path=path,
+        )
         req = Request(url, post)
-        res = urlopen(req)
-        return res.read()
+        try:
+            res = urlopen(req) if self.read_timeout is None else urlopen(req, timeout=self.read_timeout)
+            return res.read()
+        except URLError:
+            raise  # HTTPError too: Py3 URLError is a socket.error
+        except (socket.error, HTTPException) as e:
+            raise URLError(e)  # timed out or disconnected while reading the response
 
     def api_request(self, method, **params):
         """ Make a custom request to Vianett and get the response object.
@@ -72,34 +370,55 @@ class VianettHttpApi(object):
             :type method: str
             :param method: Method name to call
             :param params: Method parameters to send
-            :rtype: dict
+            :rtype: smsframework_vianett.ack.Ack
+            :returns: The response: works like a dict with 'refno', 'errorcode', 'text' keys
             :raises HTTPError: Http error code
             :raises URLError: Connection failed
             :raises AssertionError: Invalid response
             :raises VianettApiError: Vianett error
         """
-        response = self._api_request(method, **params)
+        if self.limiter is not None:
+            self.limiter.acquire(params.get('Priority'))
 
-        # Parse
         try:
-            root = ElementTree.fromstring(response)
-        except ElementTree.ParseError as e:
-            raise AssertionError('Failed to parse response: {}: {}'.format(str(e), response))
-        assert root.tag == 'ack', 'Invalid response: {}'.format(response)
+            if self.metrics is None:
+                ret = self._parse_response(self._api_request(method, **params))
+            else:
+                ret = self._parse_measured(self._api_request_measured(method, params))
+        except (HTTPError, VianettApiError) as e:
+            self._report(e)
+            raise
+        self._report()
+        return ret
 
-        # Error?
-        if root.attrib['errorcode'] != '200':
-            raise VianettApiError(root.attrib['errorcode'], root.text)
+    def _api_request_measured(self, method, params):
+        """ Make an API request, and record the metrics
 
-        # Okay
-        ret = root.attrib
-        ret['text'] = root.text
-        return ret
+            :rtype: bytes
+        """
+        metrics = self.metrics
+        metrics.inflight_requests.inc()
+        t0 = monotonic()
+        try:
+            return self._api_request(method, **params)
+        except Exception as e:
+            metrics.responses_total.inc(self._transport_error_code(e))
+            raise
+        finally:
+            metrics.request_seconds.observe(monotonic() - t0)
+            metrics.inflight_requests.dec()
+
+    def close(self):
+        """ Close persistent connections, if any """
+        for endpoint in self.endpoints:
+            if endpoint.pool is not None:
+                endpoint.pool.close()
 
     def sendmsg(self, to, text, **params):
         """ Send SMS message
 
             See :meth:`VianettHttpApi.api_request` for the list of raised exceptions.
+            With a retry policy, failed attempts are retried with the same `msgid`.
 
             :param to: Destination number, digits only
             :param text: Message text: str or unicode.
@@ -113,20 +432,79 @@ class VianettHttpApi(object):
             :rtype: str
             :returns: Message id
         """
-        # Params
-        params.update(
-            tel=to,
-            msg=text
-        )
-
-        # msgid
-        if 'msgid' not in params:
-            params['msgid'] = datetime.now().strftime('%Y%m%d%H%M%S')
-
-        # Sender
-        if 'SenderAddress' in params and params['SenderAddress'].lstrip('+').isdigit() == False:
-            params['SenderAddressType'] = const.SenderAddressType.ALPHANUMERIC
+        params = self._sendmsg_params(to, text, params)
 
         # Send it, response
-        res = self.api_request('MT', **params)
+        t0 = monotonic()
+        try:
+            if self.retry is not None:
+                res = self.retry.call(self.api_request, 'MT', **params)
+            else:
+                res = self.api_request('MT', **params)
+        except Exception as e:
+            self._log_sent(params, t0, e=e)
+            raise
+        self._log_sent(params, t0, res['refno'])
         return res['refno']
+
+    def sendmsg_many(self, messages, concurrency=4, ordered=True):
+        """ Send many SMS messages concurrently
+
+            Messages are sent by a pool of `concurrency` threads.
+            No more than `2*concurrency` messages are in progress at any time,
+            so `messages` can be a lazy iterable of any size.
+
+            A failed message does not abort the batch: its exception is reported as the result.
+
+            :type messages: collections.Iterable
+            :param messages: Iterable of `(to, text, params)` tuples: arguments for :meth:`sendmsg`
+            :type concurrency: int
+            :param concurrency: The number of messages to send in parallel
+            :type ordered: bool
+            :param ordered: Report results in input order? Otherwise, in completion order.
+            :rtype: collections.Iterator
+            :returns: Iterator of `(index, result)` tuples,
+                where `index` is the message index in `messages`,
+                and `result` is the message id, or an exception raised by :meth:`sendmsg`
+        """
+        return send_many(self.sendmsg, messages, concurrency, ordered)
+
+
+def send_many(sendmsg, messages, concurrency=4, ordered=True):
+    """ Send many SMS messages concurrently with a `sendmsg()` function
+
+        Implements :meth:`VianettHttpApi.sendmsg_many`; see its arguments.
+    """
+    def _send(to, text, params):
+        try:
+            return sendmsg(to, text, **params)
+        except Exception as e:
+            return e
+
+    messages = enumerate(messages)
+    window = 2 * concurrency
+    inflight = {}  # future -> index
+    completed = {}  # index -> result, waiting for its turn (ordered mode)
+    next_index = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            # Fill the window
+            for index, (to, text, params) in islice(messages, window - len(inflight) - len(completed)):
+                inflight[executor.submit(_send, to, text, params)] = index
+            if not inflight:
+                break
+
+            # Collect results
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = inflight.pop(future)
+                if ordered:
+                    completed[index] = future.result()
+                else:
+                    yield index, future.result()
+
+            # Report in order
+            while next_index in completed:
+                yield next_index, completed.pop(next_index)
+                next_index += 1
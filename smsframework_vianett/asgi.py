@@ -0,0 +1,144 @@
+""" ASGI receiver: an alternative to the Flask blueprint, for asyncio servers. Requires Python 3.5+ """
+
+import asyncio
+import logging
+from functools import partial
+from time import monotonic
+from urllib.parse import parse_qsl
+
+from . import callbacks
+
+logger = logging.getLogger(__name__)
+
+#: Content type of acks: the same as Flask's
+_HTML = 'text/html; charset=utf-8'
+
+
+class ReceiverApp(object):
+    """ ASGI app that receives Vianett callbacks for a provider
+
+        Serves the same routes as :mod:`smsframework_vianett.receiver`, with the same responses:
+        '<prefix>/im', '<prefix>/status', '<prefix>/metrics'. Mount it at any prefix: routes are matched by the last path segment.
+
+        The event loop only parses and acks requests. Gateway handlers run in `executor` threads,
+        unless the provider has an ingest queue: then, callbacks are queued and acked right away.
+    """
+
+    def __init__(self, provider, executor=None, max_pending=None):
+        """ Create the app
+
+            :type provider: smsframework_vianett.provider.VianettProvider
+            :type executor: concurrent.futures.Executor | None
+            :param executor: Executor for gateway handlers. Default: the event loop's default executor
+            :type max_pending: int | None
+            :param max_pending: Max number of callbacks waiting for the executor.
+                More get HTTP 503, and Vianett retries them later. Default: no limit
+        """
+        self.provider = provider
+        self.executor = executor
+        self.max_pending = max_pending
+
+        #: Callbacks waiting for the executor
+        self.pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        assert scope['type'] == 'http', 'Unsupported ASGI scope: {}'.format(scope['type'])
+
+        status, body, content_type = await self._route(scope)
+        data = body.encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type.encode('ascii')),
+                        (b'content-length', str(len(data)).encode('ascii'))],
+        })
+        await send({'type': 'http.response.body', 'body': data if scope['method'] != 'HEAD' else b''})
+
+    async def _route(self, scope):
+        """ Handle a request
+
+            :rtype: (int, str, str)
+            :returns: (HTTP status, response body, content type)
+        """
+        route = scope['path'].rstrip('/').rpartition('/')[2]
+        metrics = self.provider.metrics
+        if route not in ('im', 'status', 'metrics') or route == 'metrics' and metrics is None:
+            return 404, 'Not Found', _HTML
+        if scope['method'] not in ('GET', 'HEAD'):
+            return 405, 'Method Not Allowed', _HTML
+        if route == 'metrics':
+            return 200, metrics.prometheus(), 'text/plain; version=0.0.4'
+
+        t0 = monotonic()
+        try:
+            status, body = await self._callback(route, _query(scope['query_string']))
+        finally:
+            if metrics is not None:
+                metrics.received_total.inc(route)
+                metrics.receive_seconds.observe(monotonic() - t0)
+        return status, body, _HTML
+
+    async def _callback(self, kind, req):
+        """ Handle a callback: see :mod:`smsframework_vianett.callbacks`
+
+            :rtype: (int, str)
+            :returns: (HTTP status, response body)
+        """
+        provider = self.provider
+        try:
+            obj = callbacks.decode(provider, kind, req)
+
+            # Process it
+            ingest = provider.ingest
+            if ingest is not None and ingest.overflow == 'block':
+                action = await self._run(callbacks.accept, provider, kind, req, obj)  # may wait for the queue
+            else:
+                action = callbacks.accept(provider, kind, req, obj)
+            if action == callbacks.REJECTED:
+                body, status = callbacks.OVERLOADED
+                return status, body
+            if action == callbacks.PROCESS:
+                if self.max_pending is not None and self.pending >= self.max_pending:
+                    body, status = callbacks.OVERLOADED
+                    return status, body
+                self.pending += 1
+                try:
+                    await self._run(callbacks.process, provider, kind, obj)
+                finally:
+                    self.pending -= 1
+            callbacks.processed(provider, kind, req)
+        except Exception:
+            logger.exception('Vianett {} callback failed: {}'.format(kind, req))
+            return 500, 'Internal Server Error'  # Vianett will retry later
+
+        # Ack
+        return 200, callbacks.ack(kind, obj)
+
+    def _run(self, f, *args):
+        """ Run a blocking function in the executor """
+        return asyncio.get_event_loop().run_in_executor(self.executor, partial(f, *args))
+
+    async def _lifespan(self, receive, send):
+        """ Lifespan protocol: nothing to start or stop: the provider is closed by its owner """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def _query(query_string):
+    """ Parse a query string into a dict, like Flask's `request.args.to_dict()`: the first value of every argument
+
+        :type query_string: bytes
+        :rtype: dict
+    """
+    req = {}
+    for k, v in parse_qsl(query_string.decode('utf-8', 'replace'), keep_blank_values=True):
+        req.setdefault(k, v)
+    return req
+
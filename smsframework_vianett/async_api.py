@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+""" asyncio client for the Vianett HTTP API (Python 3.5+) """
+
+import ssl
+import asyncio
+from io import BytesIO
+from time import monotonic
+from itertools import islice
+from collections import deque
+from email.message import Message
+from urllib.request import HTTPError, URLError
+
+from .api import VianettApiBase, VianettApiError
+from .accounts import AccountPool
+from .breaker import ConnectError, CircuitOpenError
+
+
+class _ServerDisconnected(Exception):
+    """ Server has closed the connection without a response """
+
+
+class _Connection(object):
+    """ A keep-alive connection: a pair of streams """
+
+    __slots__ = ('reader', 'writer', 'requests', 'last_used')
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.requests = 0
+        self.last_used = asyncio.get_event_loop().time()
+
+    def is_stale(self):
+        """ Did the server close this idle connection? """
+        return self.reader.at_eof() or self.writer.transport.is_closing()  # StreamWriter.is_closing() is Py3.7+
+
+    def close(self):
+        try:
+            self.writer.close()
+        except RuntimeError:
+            pass  # its event loop is closed
+
+
+class AsyncConnectionPool(object):
+    """ Pool of persistent HTTP/1.1 keep-alive connections to a single host, for asyncio
+
+        Works like :class:`smsframework_vianett.pool.HttpConnectionPool`,
+        but the number of open connections is limited by `max_connections`:
+        requests beyond that wait for a free connection.
+
+        Connections belong to an event loop: when the pool is used from another loop,
+        e.g. after a second `asyncio.run()`, the connections of the previous one are dropped.
+    """
+
+    def __init__(self, host, https=False, size=100, max_connections=100, idle_timeout=30.0, max_requests=1000,
+                 timeout=None, ssl_context=None, metrics=None, connect_timeout=None):
+        """ Create a connection pool
+
+            :type host: str
+            :param host: Hostname to connect to, optionally with ':port'
+            :type https: bool
+            :param https: Use TLS?
+            :type size: int
+            :param size: Max number of idle connections to keep
+            :type max_connections: int
+            :param max_connections: Max number of connections open at the same time
+            :type idle_timeout: float
+            :param idle_timeout: Close connections that were idle for longer than this, seconds
+            :type max_requests: int | None
+            :param max_requests: Close connections that have served this many requests. `None`: unlimited
+            :type timeout: float | None
+            :param timeout: Timeout for a request, seconds. `None`: no timeout
+            :type ssl_context: ssl.SSLContext | None
+            :param ssl_context: Custom TLS context. Default: system defaults with certificate validation
+            :type metrics: smsframework_vianett.metrics.Metrics | None
+            :param metrics: Record connection times. With asyncio, the TLS handshake is a part of `connect_seconds`
+            :type connect_timeout: float | None
+            :param connect_timeout: Timeout for connecting, including the TLS handshake, seconds. `None`: no timeout
+        """
+        self.host, _, port = host.partition(':')
+        self.port = int(port) if port else (443 if https else 80)
+        self.https = https
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics
+
+        self._ssl_context = (ssl_context or ssl.create_default_context()) if https else None
+        self._idle = deque()
+        self._max_connections = max_connections
+        self._semaphore = None  # created lazily: must belong to the running loop
+        self._loop = None  # the loop of the idle connections and the semaphore
+
+    async def _checkout(self):
+        """ Get an idle connection, or open a new one
+
+            :rtype: _Connection
+        """
+        now = asyncio.get_event_loop().time()
+        while self._idle:
+            conn = self._idle.pop()
+            if now - conn.last_used > self.idle_timeout or conn.is_stale():
+                conn.close()
+                continue
+            return conn
+
+        t0 = monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                self.host, self.port,
+                ssl=self._ssl_context,
+                server_hostname=self.host if self.https else None
+            ), self.connect_timeout)
+        except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+            raise ConnectError(e)
+        if self.metrics is not None:
+            self.metrics.connect_seconds.observe(monotonic() - t0)
+        return _Connection(reader, writer)
+
+    def _checkin(self, conn):
+        """ Return a connection to the pool """
+        conn.last_used = asyncio.get_event_loop().time()
+        if len(self._idle) < self.size:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def _roundtrip(self, conn, request):
+        """ Send a request and read the response
+
+            :rtype: (int, str, email.message.Message, bytes, bool)
+            :returns: (status, reason, headers, body, will_close)
+        """
+        conn.writer.write(request)
+        await conn.writer.drain()
+
+        # Status line
+        line = await conn.reader.readline()
+        if not line:
+            raise _ServerDisconnected()
+        version, status, reason = (line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+
+        # Headers
+        headers = Message()
+        while True:
+            line = await conn.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip()] = value.strip()
+
+        # Body
+        connection = (headers.get('Connection') or '').lower()
+        will_close = connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive')
+        if 'chunked' in (headers.get('Transfer-Encoding') or '').lower():
+            chunks = []
+            while True:
+                size = int((await conn.reader.readline()).split(b';', 1)[0], 16)
+                if size == 0:
+                    # Trailers
+                    while (await conn.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await conn.reader.readexactly(size))
+                await conn.reader.readexactly(2)
+            body = b''.join(chunks)
+        elif headers.get('Content-Length') is not None:
+            body = await conn.reader.readexactly(int(headers['Content-Length']))
+        else:
+            body = await conn.reader.read()
+            will_close = True
+
+        return int(status), reason, headers, body, will_close
+
+    async def request(self, method, path, body=b'', headers=None):
+        """ Make a request over a pooled connection
+
+            A reused connection may turn out to be closed by the server: then, the request is retried once
+            on a fresh connection. This only happens when the server has provably not responded to it.
+
+            :rtype: bytes
+            :returns: Response body
+            :raises HTTPError: Http error code
+            :raises ConnectError: Connection failed before the request was sent
+            :raises URLError: Connection failed
+        """
+        loop = asyncio.get_event_loop()
+        if loop is not self._loop:
+            self.close()  # connections of another loop
+            self._semaphore = asyncio.Semaphore(self._max_connections)
+            self._loop = loop
+
+        # Request
+        lines = ['{} {} HTTP/1.1'.format(method, path), 'Host: {}'.format(self.host), 'Content-Length: {}'.format(len(body))]
+        lines.extend('{}: {}'.format(k, v) for k, v in (headers or {}).items())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        async with self._semaphore:
+            while True:
+                conn = await self._checkout()
+                reused = conn.requests > 0
+                try:
+                    status, reason, res_headers, data, will_close = await asyncio.wait_for(
+                        self._roundtrip(conn, request), self.timeout)
+                except (_ServerDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                    conn.close()
+                    if reused:
+                        continue
+                    raise URLError(e)
+                except (OSError, ssl.SSLError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                    conn.close()
+                    raise URLError(e)
+                except BaseException:
+                    conn.close()  # cancelled: the connection is in an unknown state
+                    raise
+                break
+
+            # Return the connection
+            conn.requests += 1
+            if will_close or (self.max_requests is not None and conn.requests >= self.max_requests):
+                conn.close()
+            else:
+                self._checkin(conn)
+
+        # Error?
+        if status >= 400:
+            url = '{schema}://{host}:{port}{path}'.format(schema='https' if self.https else 'http', host=self.host, port=self.port, path=path)
+            raise HTTPError(url, status, reason, res_headers, BytesIO(data))
+        return data
+
+    def close(self):
+        """ Close all idle connections """
+        while self._idle:
+            self._idle.pop().close()
+
+
+async def _acquire(limiter, priority):
+    """ Wait for a slot from a :class:`smsframework_vianett.ratelimit.RateLimiter` without blocking the event loop """
+    delay = limiter.reserve(priority)
+    if delay > 0:
+        with limiter.queued():
+            await asyncio.sleep(delay)
+
+
+async def _retry(policy, f, *args, **kwargs):
+    """ Await a coroutine function, retrying it with a :class:`smsframework_vianett.retry.RetryPolicy` """
+    policy.budget.deposit()
+    attempt = 1
+    while True:
+        try:
+            return await f(*args, **kwargs)
+        except Exception as e:
+            delay = policy.next_delay(attempt, e)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+class AsyncVianettHttpApi(VianettApiBase):
+    """ Vianett HTTP API client for asyncio
+
+        Mirrors :class:`smsframework_vianett.api.VianettHttpApi`, but all requests are coroutines.
+        Connections are always reused: see :class:`AsyncConnectionPool`.
+    """
+
+    def __init__(self, user, password, https=False, limiter=None, retry=None, msgid_generator=None, max_segments=None,
+                 metrics=None, endpoints=None, breaker=None, connect_timeout=None, read_timeout=None, numbers=None,
+                 events=None, **pool):
+        """ Create an authenticated client
+
+            :param user: Authentication: username
+            :param password: Authentication: password
+            :type https: bool
+            :param https: Use HTTPS protocol for requests?
+            :type limiter: smsframework_vianett.ratelimit.RateLimiter | None
+            :param limiter: Rate limiter for requests
+            :type retry: smsframework_vianett.retry.RetryPolicy | None
+            :param retry: Retry policy for sending messages
+            :type msgid_generator: callable | None
+            :param msgid_generator: Function that generates a unique `msgid` for every message
+            :type max_segments: int | None
+            :param max_segments: Reject messages longer than this many SMS segments locally
+            :type metrics: smsframework_vianett.metrics.Metrics | None
+            :param metrics: Collect request metrics
+            :type endpoints: list[str] | None
+            :param endpoints: API hosts, in the order of preference
+            :type breaker: bool | dict | None
+            :param breaker: Use a circuit breaker for every endpoint?
+            :type connect_timeout: float | None
+            :param connect_timeout: Timeout for connecting, seconds
+            :type read_timeout: float | None
+            :param read_timeout: Timeout for the response, seconds. Same as the `timeout` pool option
+            :type numbers: smsframework_vianett.numbers.NumberNormalizer | None
+            :param numbers: Normalizes and validates destinations and senders
+            :type events: smsframework_vianett.eventlog.EventLog | None
+            :param events: Log sent messages
+            :param pool: Options for :class:`AsyncConnectionPool`: `max_connections`, `size`, `idle_timeout`, `max_requests`, `timeout`, `ssl_context`
+        """
+        super(AsyncVianettHttpApi, self).__init__(user, password, https, limiter, retry, msgid_generator,
+                                                  max_segments, metrics, endpoints, breaker, numbers, events)
+        if read_timeout is not None:
+            pool['timeout'] = read_timeout
+        for endpoint in self.endpoints:
+            endpoint.pool = AsyncConnectionPool(endpoint.host, https, metrics=metrics, connect_timeout=connect_timeout,
+                                                **pool)
+
+    async def _api_request(self, method, **params):
+        """ Make an API request and return the result
+
+            Fails over to the next endpoint when an endpoint can't be connected to.
+
+            :rtype: bytes
+        """
+        path, post = self._prepare_request(method, params)
+
+        error = None
+        for endpoint in self._available_endpoints():
+            try:
+                response = await endpoint.pool.request('POST', path, post,
+                                                       {'Content-Type': 'application/x-www-form-urlencoded'})
+            except Exception as e:
+                if not self._endpoint_result(endpoint, e):
+                    raise
+                error = e  # not sent: try the next endpoint
+                continue
+            except BaseException:
+                if endpoint.breaker is not None:
+                    endpoint.breaker.cancel()  # cancelled: no result
+                raise
+            self._endpoint_result(endpoint)
+            return response
+        raise error or CircuitOpenError('All Vianett API endpoints are unavailable')
+
+    async def api_request(self, method, **params):
+        """ Make a custom request to Vianett and get the response object.
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.api_request`
+        """
+        if self.limiter is not None:
+            await _acquire(self.limiter, params.get('Priority'))
+
+        try:
+            if self.metrics is None:
+                ret = self._parse_response(await self._api_request(method, **params))
+            else:
+                ret = self._parse_measured(await self._api_request_measured(method, params))
+        except (HTTPError, VianettApiError) as e:
+            self._report(e)
+            raise
+        self._report()
+        return ret
+
+    async def _api_request_measured(self, method, params):
+        """ Make an API request, and record the metrics
+
+            :rtype: bytes
+        """
+        metrics = self.metrics
+        metrics.inflight_requests.inc()
+        t0 = monotonic()
+        try:
+            return await self._api_request(method, **params)
+        except Exception as e:
+            metrics.responses_total.inc(self._transport_error_code(e))
+            raise
+        finally:
+            metrics.request_seconds.observe(monotonic() - t0)
+            metrics.inflight_requests.dec()
+
+    def close(self):
+        """ Close persistent connections """
+        for endpoint in self.endpoints:
+            endpoint.pool.close()
+
+    async def sendmsg(self, to, text, **params):
+        """ Send SMS message
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.sendmsg`
+        """
+        params = self._sendmsg_params(to, text, params)
+
+        # Send it, response
+        t0 = monotonic()
+        try:
+            if self.retry is not None:
+                res = await _retry(self.retry, self.api_request, 'MT', **params)
+            else:
+                res = await self.api_request('MT', **params)
+        except Exception as e:
+            self._log_sent(params, t0, e=e)
+            raise
+        self._log_sent(params, t0, res['refno'])
+        return res['refno']
+
+    async def sendmsg_many(self, messages, concurrency=4, ordered=True):
+        """ Send many SMS messages concurrently
+
+            See :func:`send_many`
+        """
+        return await send_many(self.sendmsg, messages, concurrency, ordered)
+
+
+class AsyncAccountPool(AccountPool):
+    """ :class:`smsframework_vianett.accounts.AccountPool` of :class:`AsyncVianettHttpApi` clients """
+
+    async def sendmsg(self, to, text, **params):
+        """ Send SMS message with one of the accounts
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.sendmsg`
+        """
+        account = self.choose(to)
+        try:
+            refno = await account.api.sendmsg(to, text, **params)
+        except BaseException as e:
+            self.release(account, e)
+            raise
+        self.release(account)
+        return refno
+
+    async def sendmsg_many(self, messages, concurrency=4, ordered=True):
+        """ Send many SMS messages concurrently with the accounts
+
+            See :func:`send_many`
+        """
+        return await send_many(self.sendmsg, messages, concurrency, ordered)
+
+    async def api_request(self, method, **params):
+        """ Make a custom request with the first account """
+        return await self.accounts[0].api.api_request(method, **params)
+
+
+async def send_many(sendmsg, messages, concurrency=4, ordered=True):
+    """ Send many SMS messages concurrently with a `sendmsg()` coroutine function
+
+        The asyncio counterpart of :func:`smsframework_vianett.api.send_many`:
+        no more than `concurrency` messages are in progress at any time, so `messages` can be a lazy iterable.
+        A failed message does not abort the batch: its exception is reported as the result.
+
+        :type messages: collections.Iterable
+        :param messages: Iterable of `(to, text, params)` tuples: arguments for `sendmsg()`
+        :type concurrency: int
+        :param concurrency: The number of messages to send in parallel
+        :type ordered: bool
+        :param ordered: Report results in input order? Otherwise, in completion order.
+        :rtype: list
+        :returns: List of `(index, result)` tuples,
+            where `index` is the message index in `messages`,
+            and `result` is the message id, or an exception raised by `sendmsg()`
+    """
+    async def _send(index, to, text, params):
+        try:
+            return index, await sendmsg(to, text, **params)
+        except Exception as e:
+            return index, e
+
+    messages = enumerate(messages)
+    inflight = set()
+    results = []
+
+    while True:
+        # Fill the window
+        for index, (to, text, params) in islice(messages, concurrency - len(inflight)):
+            inflight.add(asyncio.ensure_future(_send(index, to, text, params)))
+        if not inflight:
+            break
+
+        # Collect results
+        done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+        results.extend(task.result() for task in done)
+
+    if ordered:
+        results.sort(key=lambda r: r[0])
+    return results
+
+async def async_send(provider, message):
+    """ Send a message with the provider's asyncio client
+
+        Implements :meth:`smsframework_vianett.provider.VianettProvider.async_send`
+    """
+    from .provider import translate_error
+
+    params = provider._message_params(message)
+    try:
+        message.msgid = await provider.async_api.sendmsg(message.dst, message.body, **params)
+    except (AssertionError, URLError, VianettApiError) as e:
+        raise translate_error(e)
+    provider._sent(message, params['msgid'])
+    message.provider = provider.name
+    provider.gateway.onSend(message)
+    return message
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from time import sleep
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+from smsframework.lib.events import EventHook
+
+logger = logging.getLogger(__name__)
+
+
+class BatchEventHook(EventHook):
+    """ Event hook that knows whether anyone is subscribed """
+
+    def __init__(self):
+        super(BatchEventHook, self).__init__()
+        self._count = 0
+
+    def __iadd__(self, handler):
+        self._count += 1
+        return super(BatchEventHook, self).__iadd__(handler)
+
+    def __isub__(self, handler):
+        ret = super(BatchEventHook, self).__isub__(handler)
+        self._count -= 1
+        return ret
+
+    def __len__(self):
+        return self._count
+
+    __bool__ = __nonzero__ = lambda self: self._count > 0
+
+
+class PartialBatchError(Exception):
+    """ Raised by a flush function when only some items of a batch have failed: only they are retried """
+
+    def __init__(self, items, error):
+        """ Report failed items
+
+            :type items: list
+            :param items: The items that have failed
+            :type error: Exception
+            :param error: The error, e.g. the last one
+        """
+        self.items = items
+        self.error = error
+        super(PartialBatchError, self).__init__('{} items failed: {}'.format(len(items), error))
+
+
+class MicroBatcher(object):
+    """ Collects items into micro-batches
+
+        A batch is flushed when it has `max_size` items, or when its first item has waited for `max_delay` seconds.
+        Batches are flushed by a background thread.
+        A failed flush is retried, with exponential backoff; when all retries fail,
+        the batch goes to `on_failure`, so it can be saved somewhere else.
+        A flush that raises :class:`PartialBatchError` only has the failed items retried.
+    """
+
+    def __init__(self, flush, max_size=100, max_delay=1.0, retries=3, retry_delay=0.5, on_failure=None):
+        """ Create the batcher and start its thread
+
+            :type flush: callable
+            :param flush: Function that processes a batch: flush(list)
+            :type max_size: int
+            :param max_size: Max number of items in a batch
+            :type max_delay: float
+            :param max_delay: Max time an item waits for its batch, seconds
+            :type retries: int
+            :param retries: Flush a failed batch again this many times
+            :type retry_delay: float
+            :param retry_delay: Delay before the first retry, seconds. Doubles with every retry
+            :type on_failure: callable | None
+            :param on_failure: Function that gets a batch that could not be flushed: on_failure(list, exception).
+                Default: log the error, and drop the batch
+        """
+        self.flush = flush
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_failure = on_failure
+
+        #: Statistics: the number of flushes retried, and batches that failed all retries
+        self.retried = self.failed = 0
+
+        self._items = []
+        self._deadline = None
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, name='vianett-batcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, item):
+        """ Add an item to the current batch """
+        with self._cond:
+            assert not self._closed, 'Batcher is closed'
+            if not self._items:
+                self._deadline = monotonic() + self.max_delay
+            self._items.append(item)
+            if len(self._items) == 1 or len(self._items) >= self.max_size:
+                self._cond.notify()  # new deadline, or a full batch
+
+    def _take(self):
+        """ Wait for a batch
+
+            :rtype: list | None
+            :returns: The batch, or `None` when closed
+        """
+        with self._cond:
+            while True:
+                if self._items and (self._closed or len(self._items) >= self.max_size or monotonic() >= self._deadline):
+                    batch, self._items = self._items[:self.max_size], self._items[self.max_size:]
+                    self._deadline = monotonic() + self.max_delay
+                    return batch
+                if self._closed:
+                    return None
+                self._cond.wait(None if not self._items else max(0, self._deadline - monotonic()))
+
+    def _run(self):
+        """ Thread: flush batches """
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """ Flush a batch, with retries """
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                sleep(delay)
+                delay *= 2
+            try:
+                self.flush(batch)
+                return
+            except PartialBatchError as e:
+                batch, error = e.items, e.error
+                logger.error('Failed to process {} items of a batch: {}'.format(len(batch), error))
+                continue
+            except Exception as e:
+                error = e
+                logger.exception('Failed to process a batch of {} items'.format(len(batch)))
+
+        # Give up
+        self.failed += 1
+        if self.on_failure is not None:
+            try:
+                self.on_failure(batch, error)
+            except Exception:
+                logger.exception('Failed to save a failed batch of {} items'.format(len(batch)))
+
+    def close(self, timeout=None):
+        """ Flush the remaining items, and stop the thread """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
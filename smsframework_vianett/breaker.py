@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+try: # Py3
+    from urllib.request import URLError, HTTPError
+except ImportError: # Py2
+    from urllib2 import URLError, HTTPError
+
+
+class ConnectError(URLError):
+    """ Failed to connect, or to send the request: the server has surely not processed it """
+
+
+class CircuitOpenError(URLError):
+    """ No endpoint is available: all circuits are open
+
+        A :class:`URLError`, so it's handled like a connection error, only without waiting for a timeout.
+    """
+
+
+class CircuitBreaker(object):
+    """ Circuit breaker for an API endpoint
+
+        * Closed: requests go through. When at least `failure_rate` of the requests in the last `window` seconds fail
+          (and there were at least `min_requests` of them), the circuit opens.
+        * Open: requests fail fast. After `open_timeout` seconds, the circuit goes half-open.
+        * Half-open: up to `probes` requests go through. A success closes the circuit; a failure opens it again.
+
+        Thread-safe.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_rate=0.5, min_requests=10, window=10.0, open_timeout=30.0, probes=1):
+        """ Create a closed circuit
+
+            :type failure_rate: float
+            :param failure_rate: Open the circuit when this share of requests fails, 0..1
+            :type min_requests: int
+            :param min_requests: Don't open the circuit with fewer requests in the window
+            :type window: float
+            :param window: Sliding window for the failure rate, seconds
+            :type open_timeout: float
+            :param open_timeout: How long the circuit stays open before probing, seconds
+            :type probes: int
+            :param probes: Max number of requests in flight when half-open
+        """
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_timeout = open_timeout
+        self.probes = probes
+
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._probes = 0
+        self._buckets = deque()  # [second, successes, failures]; the oldest first
+        self._lock = threading.Lock()
+
+        #: Statistics: how many times the circuit has opened
+        self.opened = 0
+        #: Statistics: requests rejected by an open circuit
+        self.rejected = 0
+
+    @property
+    def state(self):
+        """ Current state: CLOSED, OPEN, HALF_OPEN """
+        with self._lock:
+            return self._current_state(monotonic())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now >= self._opened_at + self.open_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self):
+        """ Can a request go through?
+
+            Every allowed request must be followed by :meth:`success`, :meth:`failure`, or :meth:`cancel`.
+
+            :rtype: bool
+        """
+        with self._lock:
+            state = self._current_state(monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._probes < self.probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        """ Report a successful request """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._buckets.clear()
+            elif self._state == self.CLOSED:
+                self._bucket(monotonic())[1] += 1
+
+    def failure(self):
+        """ Report a failed request """
+        now = monotonic()
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open(now)
+            elif self._state == self.CLOSED:
+                self._bucket(now)[2] += 1
+                successes = failures = 0
+                for _, s, f in self._buckets:
+                    successes += s
+                    failures += f
+                total = successes + failures
+                if total >= self.min_requests and failures >= self.failure_rate * total:
+                    self._open(now)
+
+    def cancel(self):
+        """ Report an allowed request that was cancelled before it had a result """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._buckets.clear()
+        self.opened += 1
+
+    def _bucket(self, now):
+        """ Get the bucket for the current second, dropping the ones out of the window """
+        second = int(now)
+        buckets = self._buckets
+        while buckets and buckets[0][0] <= second - self.window:
+            buckets.popleft()
+        if not buckets or buckets[-1][0] != second:
+            buckets.append([second, 0, 0])
+        return buckets[-1]
+
+
+class Endpoint(object):
+    """ An API host with its connections and its circuit breaker """
+
+    __slots__ = ('host', 'pool', 'breaker')
+
+    def __init__(self, host, pool=None, breaker=None):
+        #: Hostname, optionally with ':port'
+        self.host = host
+        #: Connection pool, if any
+        self.pool = pool
+        #: Circuit breaker, if any
+        self.breaker = breaker
+
+    def __repr__(self):
+        return '{}({!r}, {})'.format(self.__class__.__name__, self.host,
+                                     self.breaker.state if self.breaker else 'no breaker')
+
+
+def is_endpoint_failure(e):
+    """ Does the error mean the endpoint is unhealthy?
+
+        Connection errors and server errors are; client errors and Vianett errors are not.
+
+        :type e: Exception
+        :rtype: bool
+    """
+    if isinstance(e, HTTPError):
+        return e.code >= 500
+    return isinstance(e, URLError)
+
@@ -0,0 +1,83 @@
+""" Receiver steps shared by the Flask blueprint (:mod:`.receiver`) and the ASGI app (:mod:`.asgi`)
+
+    Every callback goes through the same steps:
+
+    1. :func:`decode` the request arguments (raises `AssertionError` on invalid requests)
+    2. :func:`accept` it: skip duplicates, or put it into the ingest queue
+    3. if accepted for processing, :func:`process` it: hand it over to the gateway (may block: gateway handlers)
+    4. :func:`processed`: remember it for deduplication
+    5. respond with :func:`ack`, or with :data:`OVERLOADED` when the ingest queue is full
+"""
+
+from .decode import decode_message, decode_status
+
+#: accept(): process the callback now
+PROCESS = 'process'
+#: accept(): nothing more to do: a duplicate, or queued
+DONE = 'done'
+#: accept(): the ingest queue is full: respond with OVERLOADED, and Vianett will retry later
+REJECTED = 'rejected'
+
+#: Response for when the ingest queue is full: (body, HTTP status)
+OVERLOADED = ('<?xml version="1.0"?><ack errorcode="503">Queue is full</ack>', 503)
+
+
+def decode(provider, kind, req):
+    """ Decode a callback
+
+        :type provider: smsframework_vianett.provider.VianettProvider
+        :type kind: str
+        :param kind: Callback type: 'im', 'status'
+        :type req: dict
+        :param req: Request arguments
+        :rtype: smsframework.data.IncomingMessage | smsframework.data.MessageStatus
+        :raises AssertionError: Invalid request
+    """
+    if kind == 'im':
+        return decode_message(req, provider.use_prefix)
+    return decode_status(req)
+
+
+def accept(provider, kind, req, obj):
+    """ Deduplicate, or queue a decoded callback
+
+        :rtype: str
+        :returns: PROCESS, DONE, or REJECTED
+    """
+    dedup = provider.dedup
+    if dedup is not None and dedup.seen(kind, req):
+        return DONE  # already processed
+    if provider.ingest is not None:
+        return DONE if provider.ingest.put(kind, req, obj) else REJECTED
+    return PROCESS
+
+
+def process(provider, kind, obj):
+    """ Hand a callback over to the gateway
+
+        Exceptions propagate: respond with HTTP 500, and Vianett will happily retry later
+    """
+    if kind == 'im':
+        provider._receive_message(obj)
+    else:
+        provider._receive_status(obj)
+
+
+def processed(provider, kind, req):
+    """ Remember a handled callback for deduplication
+
+        Status reports waiting in the status batcher are remembered once their batch is delivered:
+        see :meth:`VianettProvider._receive_status_batch`
+    """
+    if provider.dedup is not None and not (kind == 'status' and provider.status_batcher is not None):
+        provider.dedup.remember(kind, req)
+
+
+def ack(kind, obj):
+    """ Ack response body for a handled callback
+
+        :rtype: str
+    """
+    if kind == 'im':
+        return '<ack refno="{msgid}" errorcode="0" />'.format(msgid=obj.msgid)
+    return '<?xml version="1.0"?><ack refno="1234" errorcode="0" />'
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+import logging
+import threading
+from time import time
+from datetime import datetime
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SentMessage(object):
+    """ A sent message, as remembered by the correlation index """
+
+    __slots__ = ('msgid', 'refno', 'dst', 'sent', 'meta')
+
+    def __init__(self, msgid, refno, dst, sent, meta=None):
+        #: Our message id
+        self.msgid = msgid
+        #: Vianett reference number
+        self.refno = refno
+        #: Destination number
+        self.dst = dst
+        #: Send time: unix timestamp
+        self.sent = sent
+        #: The original `OutgoingMessage.meta`
+        self.meta = meta
+
+    def __eq__(self, other):
+        return isinstance(other, SentMessage) and all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}(msgid={!r}, refno={!r}, dst={!r}, sent={!r})'.format(
+            self.__class__.__name__, self.msgid, self.refno, self.dst, self.sent)
+
+
+class MemoryCorrelationBackend(object):
+    """ In-memory index of sent messages, bounded by size and age (TTL) """
+
+    def __init__(self, maxsize=100000, ttl=86400):
+        """ Create the index
+
+            :type maxsize: int
+            :param maxsize: Max number of messages to remember
+            :type ttl: float
+            :param ttl: Forget messages after this many seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._refnos = OrderedDict()  # refno -> SentMessage; the oldest first
+        self._msgids = {}  # msgid -> refno
+        self._lock = threading.Lock()
+
+    def add(self, sent):
+        """ Remember a sent message
+
+            :type sent: SentMessage
+        """
+        with self._lock:
+            old = self._refnos.pop(sent.refno, None)
+            if old is not None:
+                self._msgids.pop(old.msgid, None)
+            self._refnos[sent.refno] = sent
+            self._msgids[sent.msgid] = sent.refno
+
+            # Evict: expired messages and the oldest ones
+            expired = time() - self.ttl
+            while self._refnos:
+                oldest = next(iter(self._refnos.values()))
+                if oldest.sent >= expired and len(self._refnos) <= self.maxsize:
+                    break
+                del self._refnos[oldest.refno]
+                self._msgids.pop(oldest.msgid, None)
+
+    def get(self, refno):
+        """ Find a message by refno
+
+            :rtype: SentMessage | None
+        """
+        sent = self._refnos.get(refno)
+        if sent is None or sent.sent < time() - self.ttl:
+            return None
+        return sent
+
+    def find(self, msgid):
+        """ Find a message by our msgid
+
+            :rtype: SentMessage | None
+        """
+        refno = self._msgids.get(msgid)
+        return None if refno is None else self.get(refno)
+
+    def __len__(self):
+        return len(self._refnos)
+
+
+def _dumps(meta):
+    """ Serialize message metadata: values that aren't JSON become strings, and non-string keys are skipped
+
+        :rtype: str
+    """
+    try:
+        return json.dumps(meta, default=str, skipkeys=True)
+    except ValueError:  # circular reference
+        return 'null'
+
+
+class SqliteCorrelationBackend(object):
+    """ Index of sent messages in an SQLite database: survives restarts, and can be shared between processes
+
+        Reads go through a memory-mapped database file.
+    """
+
+    def __init__(self, path, ttl=86400, mmap_size=64 * 1024 * 1024, evict_every=1000):
+        """ Open the index
+
+            :type path: str
+            :param path: Path to the SQLite database
+            :type ttl: float
+            :param ttl: Forget messages after this many seconds
+            :type mmap_size: int
+            :param mmap_size: Memory-map this many bytes of the database
+            :type evict_every: int
+            :param evict_every: Delete expired messages once per this many writes
+        """
+        self.ttl = ttl
+        self.evict_every = evict_every
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA mmap_size={:d}'.format(mmap_size))
+        self._db.execute('''CREATE TABLE IF NOT EXISTS correlation (
+            refno TEXT PRIMARY KEY,
+            msgid TEXT NOT NULL,
+            dst TEXT NOT NULL,
+            sent REAL NOT NULL,
+            meta TEXT
+        )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS correlation_msgid ON correlation (msgid)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS correlation_sent ON correlation (sent)')
+        self._db.commit()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def add(self, sent):
+        """ Remember a sent message
+
+            :type sent: SentMessage
+        """
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO correlation VALUES (?, ?, ?, ?, ?)',
+                             (sent.refno, sent.msgid, sent.dst, sent.sent, _dumps(sent.meta)))
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._db.execute('DELETE FROM correlation WHERE sent < ?', (time() - self.ttl,))
+
+    def _select(self, where, value):
+        with self._lock:
+            row = self._db.execute('SELECT msgid, refno, dst, sent, meta FROM correlation WHERE {}=? AND sent >= ?'
+                                   .format(where), (value, time() - self.ttl)).fetchone()
+        if row is None:
+            return None
+        return SentMessage(row[0], row[1], row[2], row[3], json.loads(row[4]))
+
+    def get(self, refno):
+        """ Find a message by refno
+
+            :rtype: SentMessage | None
+        """
+        return self._select('refno', refno)
+
+    def find(self, msgid):
+        """ Find a message by our msgid
+
+            :rtype: SentMessage | None
+        """
+        return self._select('msgid', msgid)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM correlation').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class Correlator(object):
+    """ Links status reports to the messages we sent
+
+        Sent messages are indexed by our `msgid` and by Vianett's `refno`.
+        Status reports come with the `refno`: :meth:`enrich` adds the original message and the delivery latency.
+    """
+
+    def __init__(self, backend=None, maxsize=100000, ttl=86400, path=None):
+        """ Create the correlator
+
+            :type backend: MemoryCorrelationBackend | SqliteCorrelationBackend | None
+            :param backend: Message index. Default: in SQLite at `path`, or in memory with `maxsize` and `ttl`
+            :type maxsize: int
+            :param maxsize: Max number of messages to remember in memory
+            :type ttl: float
+            :param ttl: Forget messages after this many seconds
+            :type path: str | None
+            :param path: Path to an SQLite database
+        """
+        if backend is None:
+            backend = SqliteCorrelationBackend(path, ttl) if path else MemoryCorrelationBackend(maxsize, ttl)
+        self.backend = backend
+
+        #: Statistics: statuses matched to a sent message
+        self.hits = 0
+        #: Statistics: statuses of unknown messages
+        self.misses = 0
+        #: Statistics: sent messages that failed to be remembered
+        self.errors = 0
+
+    def sent(self, msgid, refno, dst, meta=None, sent=None):
+        """ Remember a sent message
+
+            The message is already sent: errors are logged, and not raised, so that it's not sent again.
+
+            :type msgid: str
+            :param msgid: Our message id
+            :type refno: str
+            :param refno: Vianett reference number
+            :type dst: str
+            :param dst: Destination number
+            :type meta: dict | None
+            :param meta: Message metadata
+            :type sent: float | None
+            :param sent: Send time, unix timestamp. Default: now
+        """
+        try:
+            self.backend.add(SentMessage(msgid, refno, dst, sent or time(), meta))
+        except Exception:
+            self.errors += 1
+            logger.exception('Failed to remember sent message {} (refno {})'.format(msgid, refno))
+
+    def get(self, refno):
+        """ Find a sent message by refno
+
+            :rtype: SentMessage | None
+        """
+        return self.backend.get(refno)
+
+    def find(self, msgid):
+        """ Find a sent message by our msgid
+
+            :rtype: SentMessage | None
+        """
+        return self.backend.find(msgid)
+
+    def enrich(self, status):
+        """ Add the original message to a status report
+
+            Sets `status.meta['sent']` to the :class:`SentMessage`,
+            and `status.meta['latency']` to the seconds between sending and the report.
+
+            :type status: smsframework.data.MessageStatus
+            :rtype: bool
+            :returns: Whether the message was found
+        """
+        sent = self.backend.get(status.msgid)
+        if sent is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+
+        rtime = status.rtime or datetime.utcnow()
+        if status.meta is None:
+            status.meta = {}
+        status.meta['sent'] = sent
+        status.meta['latency'] = max(0.0, (rtime - _EPOCH).total_seconds() - sent.sent)
+        return True
+
+    def close(self):
+        """ Close the backend """
+        if hasattr(self.backend, 'close'):
+            self.backend.close()
+
+
+_EPOCH = datetime(1970, 1, 1)
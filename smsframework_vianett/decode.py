@@ -0,0 +1,194 @@
+from datetime import datetime
+
+try: # Py3
+    from collections.abc import MutableMapping
+except ImportError: # Py2
+    from collections import MutableMapping
+
+from smsframework.data import IncomingMessage
+from smsframework.data import MessageStatus, MessageAccepted, MessageDelivered, MessageExpired, MessageError
+
+
+def decode_message(req, use_prefix=True, rtime=None):
+    """ Decode an incoming message request
+
+        :type req: dict
+        :param req: Request arguments
+        :type use_prefix: bool
+        :param use_prefix: Keep the prefix separate from the body? See :class:`VianettProvider`
+        :type rtime: datetime | None
+        :param rtime: Received time. Default: now
+        :rtype: IncomingMessage
+        :raises AssertionError: Invalid request
+    """
+    # Check
+    for n in ('sourceaddr', 'message', 'refno', 'destinationaddr', 'prefix', 'retrycount', 'operator', 'replypathid'):
+        assert n in req, 'Vianett message with missing "{}" field: {}'.format(n, req)
+
+    # Prefixes
+    prefix, body = req['prefix'], req['message']
+    if not use_prefix:
+        body = ' '.join(filter(lambda x: x, (prefix, body)))
+        prefix = ''
+
+    # IncomingMessage
+    return IncomingMessage(
+        src=req['sourceaddr'],
+        body=body,
+        msgid=req['refno'],
+        dst=req['destinationaddr'],
+        rtime=rtime or datetime.utcnow(),
+        meta = {
+            'prefix': prefix,
+            'retrycount': req['retrycount'],
+            'operator': req['operator'],
+            'replypathid': req['replypathid']
+        }
+    )
+
+
+class StatusMeta(MutableMapping):
+    """ Status report fields: `MessageStatus.meta`
+
+        Works like a dict, but known Vianett fields are stored in slots, which takes less memory.
+        Unknown fields go to an extra dict.
+    """
+
+    #: Known Vianett fields
+    FIELDS = (
+        'refno', 'requesttype', 'now', 'username', 'password',
+        # notificationstatus
+        'Status', 'StatusDescription', 'StatusCode',
+        # mtstatus
+        'errorcode', 'msgok', 'ErrorCode', 'ErrorDescription', 'Msg', 'SentDate',
+        'OperatorID', 'CountryID', 'CampaignID', 'Cut', 'CPAContentCost', 'CPACost', 'CPARevenue',
+        'NetPrice', 'ConsumerPrice', 'PriceGroup', 'Tel', 'FromAlpha', 'sno',
+    )
+
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, req=None):
+        self._extra = None
+        for k, v in (req or {}).items():
+            if k in _STATUS_META_FIELDS:
+                setattr(self, k, v)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[k] = v
+
+    def __getitem__(self, key):
+        if key in _STATUS_META_FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _STATUS_META_FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _STATUS_META_FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, dict(self))
+
+
+_STATUS_META_FIELDS = frozenset(StatusMeta.FIELDS)
+
+
+#: notificationstatus: Status -> MessageStatus class
+NOTIFICATION_STATUSES = {
+    'ENROUTE': MessageAccepted,
+    'ACCEPTD': MessageAccepted,
+    'BUFFERD': MessageAccepted,
+    'DELIVRD': MessageDelivered,
+    'EXPIRED': MessageExpired,
+    'DELETED': MessageError,
+    'UNDELIV': MessageError,
+    'REJECTD': MessageError,
+    'UNKNOWN': MessageStatus,
+}
+
+
+def _require(meta, *fields):
+    """ Check that the status report has all the fields """
+    for n in fields:
+        assert hasattr(meta, n), 'Vianett status with missing "{}" field: {}'.format(n, meta)
+
+
+def _decode_notificationstatus(meta, rtime):
+    """ Decode 'notificationstatus': sent to phone """
+    _require(meta, 'Status', 'StatusDescription', 'StatusCode')
+    status = NOTIFICATION_STATUSES.get(meta.Status, MessageStatus)(meta.refno, rtime=rtime, meta=meta)
+    status.status_code = meta.StatusCode
+    status.status = meta.Status + ': ' + meta.StatusDescription
+    return status
+
+
+def _decode_mtstatus(meta, rtime):
+    """ Decode 'mtstatus': delivered to the terminal """
+    if hasattr(meta, 'ErrorCode'):
+        # Advanced
+        _require(meta, 'ErrorDescription', 'Status', 'Msg')
+        status = (MessageDelivered if meta.ErrorCode == '200' else MessageError)(meta.refno, rtime=rtime, meta=meta)
+        status.status_code = meta.ErrorCode
+        status.status = meta.ErrorDescription + ': ' + meta.Status + ': ' + meta.Msg
+    else:
+        # Simple
+        _require(meta, 'errorcode')
+        status = (MessageDelivered if meta.errorcode == '0' else MessageError)(meta.refno, rtime=rtime, meta=meta)
+        status.status_code = meta.errorcode
+        status.status = meta.errorcode + ' and ' + getattr(meta, 'msgok', '?')
+    return status
+
+
+#: requesttype -> decoder
+STATUS_DECODERS = {
+    'notificationstatus': _decode_notificationstatus,
+    'mtstatus': _decode_mtstatus,
+}
+
+
+def decode_status(req, rtime=None):
+    """ Decode a status report request
+
+        :type req: dict
+        :param req: Request arguments
+        :type rtime: datetime | None
+        :param rtime: Received time. Default: now
+        :rtype: smsframework.data.MessageStatus
+        :raises AssertionError: Invalid request
+    """
+    meta = StatusMeta(req)
+    _require(meta, 'requesttype', 'refno')
+    decoder = STATUS_DECODERS.get(meta.requesttype)
+    assert decoder is not None, 'Vianett status with an unsupported `requesttype`: {}'.format(req)
+    return decoder(meta, rtime)
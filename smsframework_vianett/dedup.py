@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+
+class MemoryDedupBackend(object):
+    """ In-memory store of seen keys, bounded by size (LRU) and age (TTL)
+
+        Implement the same two methods, `contains()` and `add()`, to share keys between processes:
+        e.g., in Redis or memcached.
+    """
+
+    def __init__(self, maxsize=100000, ttl=3600):
+        """ Create the store
+
+            :type maxsize: int
+            :param maxsize: Max number of keys to remember
+            :type ttl: float
+            :param ttl: Forget keys after this many seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._keys = OrderedDict()  # key -> expiration time; the oldest first
+        self._lock = threading.Lock()
+
+    def contains(self, key):
+        """ Has the key been seen?
+
+            :type key: str
+            :rtype: bool
+        """
+        with self._lock:
+            expires = self._keys.get(key)
+            if expires is None:
+                return False
+            if expires < monotonic():
+                del self._keys[key]
+                return False
+            return True
+
+    def add(self, key):
+        """ Remember a key
+
+            :type key: str
+        """
+        now = monotonic()
+        with self._lock:
+            self._keys.pop(key, None)
+            self._keys[key] = now + self.ttl
+
+            # Evict: expired keys and the oldest ones
+            while self._keys:
+                oldest, expires = next(iter(self._keys.items()))
+                if expires >= now and len(self._keys) <= self.maxsize:
+                    break
+                del self._keys[oldest]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class Deduplicator(object):
+    """ Detects repeated requests from Vianett
+
+        Vianett retries a callback that has failed, and can report the same status more than once.
+        A request is a duplicate if a request of the same type has already been processed
+        for the same `refno`, and, for status reports, with the same status.
+        Different statuses of the same message are not duplicates: e.g., 'ACCEPTD' then 'DELIVRD'.
+    """
+
+    def __init__(self, backend=None, maxsize=100000, ttl=3600):
+        """ Create the deduplicator
+
+            :type backend: MemoryDedupBackend | None
+            :param backend: Key store. Default: an in-memory store with `maxsize` and `ttl`
+            :type maxsize: int
+            :param maxsize: Max number of keys to remember in memory
+            :type ttl: float
+            :param ttl: Forget keys after this many seconds
+        """
+        self.backend = backend or MemoryDedupBackend(maxsize, ttl)
+
+        #: Statistics: duplicates found
+        self.hits = 0
+        #: Statistics: new requests
+        self.misses = 0
+
+    @staticmethod
+    def key(kind, req):
+        """ Get the key for a request
+
+            :type kind: str
+            :param kind: Request type: 'im', 'status'
+            :type req: dict
+            :param req: Request arguments
+            :rtype: str
+        """
+        if kind == 'im':
+            return 'im:{}'.format(req.get('refno'))
+        return 'status:{}:{}:{}'.format(
+            req.get('requesttype'), req.get('refno'),
+            req.get('Status') or req.get('ErrorCode') or req.get('errorcode')
+        )
+
+    def seen(self, kind, req):
+        """ Has this request been processed already?
+
+            :rtype: bool
+        """
+        if self.backend.contains(self.key(kind, req)):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def remember(self, kind, req):
+        """ Remember a processed request """
+        self.backend.add(self.key(kind, req))
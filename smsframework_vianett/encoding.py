@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+""" SMS encoding and segmentation planner """
+
+from __future__ import unicode_literals
+
+#: GSM 03.38 basic character set: 1 septet each (except ESC, which is not for text)
+GSM_BASIC = (
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà'
+)
+
+#: GSM 03.38 extension table: 2 septets each (ESC + char)
+GSM_EXTENSION = '\f^{}\\[~]|€'
+
+GSM_CHARS = frozenset(GSM_BASIC + GSM_EXTENSION)
+
+GSM7 = 'GSM-7'
+UCS2 = 'UCS-2'
+
+#: Encoding -> (units in a single message, units in a part of a concatenated message)
+SEGMENT_LIMITS = {
+    GSM7: (160, 153),
+    UCS2: (70, 67),
+}
+
+
+class SegmentPlan(object):
+    """ How a text is going to be sent """
+
+    __slots__ = ('encoding', 'units', 'segments')
+
+    def __init__(self, encoding, units):
+        #: Encoding: GSM7 | UCS2
+        self.encoding = encoding
+        #: Length in encoding units: GSM septets, or UTF-16 code units
+        self.units = units
+        #: The number of SMS segments
+        single, part = SEGMENT_LIMITS[encoding]
+        self.segments = 1 if units <= single else -(-units // part)
+
+    def __repr__(self):
+        return '{cls}({encoding}, units={units}, segments={segments})'.format(
+            cls=self.__class__.__name__, encoding=self.encoding, units=self.units, segments=self.segments)
+
+
+def _units(ch, encoding):
+    """ Length of a character in encoding units """
+    if encoding == GSM7:
+        return 2 if ch in GSM_EXTENSION else 1
+    return 2 if ord(ch) > 0xFFFF else 1
+
+
+def plan(text):
+    """ Plan the encoding and segmentation of a text
+
+        Linear: one pass to classify the characters, and one to count the double-width ones.
+
+        :type text: str | unicode
+        :rtype: SegmentPlan
+    """
+    if GSM_CHARS.issuperset(text):
+        return SegmentPlan(GSM7, len(text) + sum(text.count(ch) for ch in GSM_EXTENSION))
+    # UTF-16 code units: characters outside the BMP take two
+    return SegmentPlan(UCS2, len(text) + sum(1 for ch in text if ord(ch) > 0xFFFF))
+
+
+def plan_many(texts):
+    """ Plan many texts at once
+
+        Identical texts (e.g., a campaign) are planned only once.
+
+        :type texts: collections.Iterable
+        :rtype: list[SegmentPlan]
+    """
+    plans = {}
+    ret = []
+    for text in texts:
+        p = plans.get(text)
+        if p is None:
+            p = plans[text] = plan(text)
+        ret.append(p)
+    return ret
+
+
+def split(text):
+    """ Split a text into parts that fit in one segment each
+
+        Never splits an extension character or a surrogate pair.
+
+        :type text: str | unicode
+        :rtype: list
+    """
+    p = plan(text)
+    if p.segments == 1:
+        return [text]
+
+    limit = SEGMENT_LIMITS[p.encoding][1]
+    parts, start, units = [], 0, 0
+    for i, ch in enumerate(text):
+        n = _units(ch, p.encoding)
+        if units + n > limit:
+            parts.append(text[start:i])
+            start, units = i, 0
+        units += n
+    parts.append(text[start:])
+    return parts
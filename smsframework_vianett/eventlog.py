@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import mmap
+import math
+import struct
+import hashlib
+from time import time
+from collections import namedtuple
+
+from smsframework.data import MessageAccepted, MessageDelivered, MessageExpired, MessageError
+
+from .batch import MicroBatcher
+
+
+#region Records
+
+#: Record kinds
+SENT = 1  # MT request, success or failure
+STATUS = 2  # Status report
+
+#: Record states
+OK = 0  # SENT: accepted by Vianett
+FAILED = 1  # SENT: failed
+ACCEPTED = 2  # STATUS: MessageAccepted
+DELIVERED = 3  # STATUS: MessageDelivered
+EXPIRED = 4  # STATUS: MessageExpired
+ERROR = 5  # STATUS: MessageError
+UNKNOWN = 6  # STATUS: any other MessageStatus
+
+#: Final states of a message
+FINAL = frozenset((DELIVERED, EXPIRED, ERROR))
+
+#: Fixed-size record, 64 bytes, little-endian:
+#: kind, state, segments, operator, country, code, time, latency, msgid, refno, cost, net_price
+RECORD = struct.Struct('<BBHIIiddQQdd')
+
+#: A decoded record.
+#: Unknown numbers are 0, unknown codes are -1, unknown prices and latencies are NaN.
+#: Ids that aren't 64-bit unsigned integers are stored as their hash: see :func:`id_key`
+Event = namedtuple('Event', ('kind', 'state', 'segments', 'operator', 'country', 'code', 'time', 'latency',
+                             'msgid', 'refno', 'cost', 'net_price'))
+
+#: Segment file header: magic, version, record size
+HEADER = struct.Struct('<4sHH')
+MAGIC = b'VNEL'
+VERSION = 1
+
+#: Segment file name
+SEGMENT_NAME = 'events-{:08d}.log'
+_SEGMENT_RE = re.compile(r'^events-(\d{8})\.log$')
+
+NAN = float('nan')
+
+#: MessageStatus class -> state
+_STATUS_STATES = (
+    (MessageDelivered, DELIVERED),
+    (MessageExpired, EXPIRED),
+    (MessageError, ERROR),
+    (MessageAccepted, ACCEPTED),
+)
+
+
+def _int(value, default=0, bits=64, signed=False):
+    """ Integer from a Vianett field; `default` if missing, not a number, or out of range """
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    low, high = (-(1 << bits - 1), 1 << bits - 1) if signed else (0, 1 << bits)
+    return value if low <= value < high else default
+
+
+def id_key(value):
+    """ Record field for a message id: `msgid` or `refno`
+
+        Numeric ids are stored as they are. Others, like UUIDs, are stored as a 64-bit hash:
+        look them up with `event.msgid == id_key(msgid)`. 0 if missing
+
+        :type value: str | int | None
+        :rtype: int
+    """
+    if value is None or value == '':
+        return 0
+    key = _int(value, None)
+    if key is None:
+        if not isinstance(value, bytes):
+            value = u'{}'.format(value).encode('utf-8')
+        key = struct.unpack('<Q', hashlib.sha1(value).digest()[:8])[0]
+    return key
+
+
+def _float(value):
+    """ Price from a Vianett field: '0,50' or '0.50'; NaN if missing """
+    try:
+        return float(value.replace(',', '.'))
+    except (AttributeError, ValueError):
+        return NAN
+
+
+def error_code(e):
+    """ Record code of a failed request: Vianett `errorcode`, HTTP status, or -1
+
+        :type e: Exception
+        :rtype: int
+    """
+    return _int(getattr(e, 'code', None), -1, 32, True)
+
+
+def sent_record(msgid, refno=None, segments=0, latency=NAN, e=None, code=None, now=None):
+    """ Pack a SENT record
+
+        :param msgid: Our message id
+        :param refno: Vianett message id, if sent
+        :type segments: int
+        :param segments: The number of SMS segments
+        :type latency: float
+        :param latency: Request time, seconds
+        :type e: Exception | None
+        :param e: The error, if failed
+        :param code: Error code, if it's not in `e`
+        :rtype: bytes
+    """
+    if code is not None:
+        code = _int(code, -1, 32, True)
+    elif e is not None:
+        code = error_code(e)
+    return RECORD.pack(SENT, OK if e is None else FAILED, min(segments, 0xFFFF), 0, 0,
+                       -1 if code is None else code, now or time(), latency, id_key(msgid), id_key(refno), NAN, NAN)
+
+
+def status_record(status, now=None):
+    """ Pack a STATUS record
+
+        :type status: smsframework.data.MessageStatus
+        :rtype: bytes
+    """
+    state = UNKNOWN
+    for cls, s in _STATUS_STATES:
+        if isinstance(status, cls):
+            state = s
+            break
+    meta = status.meta or {}
+    return RECORD.pack(STATUS, state, 0, _int(meta.get('OperatorID'), bits=32), _int(meta.get('CountryID'), bits=32),
+                       _int(status.status_code, -1, 32, True), now or time(), NAN, 0, id_key(status.msgid),
+                       _float(meta.get('CPACost')), _float(meta.get('NetPrice')))
+
+#endregion
+
+
+#region Writer
+
+class EventLog(object):
+    """ Compact, append-only log of sent messages and status reports
+
+        Every event is a fixed-size binary record (:data:`RECORD`, 64 bytes), with pricing fields that otherwise
+        stay buried in `meta`. Records are buffered and written in groups by a background thread,
+        into segment files in a directory: a new segment is started when the current one reaches `segment_size`,
+        and on every open, so a segment never continues after a crash.
+        Read them with :class:`EventLogReader`, even while they're being written.
+    """
+
+    def __init__(self, path, segment_size=64 * 1024 * 1024, max_segments=None, buffer_size=1000, flush_interval=1.0):
+        """ Open the log, and start its writer thread
+
+            :type path: str
+            :param path: Directory for the segment files. Created if missing
+            :type segment_size: int
+            :param segment_size: Start a new segment when the current one is this large, bytes
+            :type max_segments: int | None
+            :param max_segments: Delete the oldest segments beyond this many. Default: keep them all
+            :type buffer_size: int
+            :param buffer_size: Max number of records in a write
+            :type flush_interval: float
+            :param flush_interval: Max time a record waits to be written, seconds
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        segments = list_segments(path)
+        self._seq = _segment_seq(segments[-1]) if segments else 0
+        self._file = None
+        self._size = 0
+        self._open_segment()
+
+        self._batcher = MicroBatcher(self._write, max_size=buffer_size, max_delay=flush_interval,
+                                     retries=0)  # a retry would write some of the records twice
+
+    def _open_segment(self):
+        """ Start a new segment """
+        self._seq += 1
+        self._file = open(os.path.join(self.path, SEGMENT_NAME.format(self._seq)), 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._size = HEADER.size
+
+        # Retention
+        if self.max_segments is not None:
+            for old in list_segments(self.path)[:-self.max_segments]:
+                os.remove(old)
+
+    def _write(self, records):
+        """ Batcher thread: write records to the segments """
+        while records:
+            if self._size >= self.segment_size:
+                self._file.close()
+                self._open_segment()
+            n = max(1, (self.segment_size - self._size) // RECORD.size)
+            chunk, records = records[:n], records[n:]
+            data = b''.join(chunk)
+            self._file.write(data)
+            self._size += len(data)
+        self._file.flush()
+
+    def put(self, record):
+        """ Log a packed record
+
+            :type record: bytes
+        """
+        self._batcher.put(record)
+
+    def sent(self, msgid, refno=None, segments=0, latency=NAN, e=None, code=None):
+        """ Log a sent message, or a failed request. See :func:`sent_record` """
+        self.put(sent_record(msgid, refno, segments, latency, e, code))
+
+    def status(self, status):
+        """ Log a status report
+
+            :type status: smsframework.data.MessageStatus
+        """
+        self.put(status_record(status))
+
+    def close(self, timeout=None):
+        """ Write the buffered records, and close the log """
+        self._batcher.close(timeout)
+        self._file.close()
+
+#endregion
+
+
+#region Reader
+
+def list_segments(path):
+    """ List the segment files in a directory, the oldest first
+
+        :rtype: list[str]
+    """
+    names = sorted(name for name in os.listdir(path) if _SEGMENT_RE.match(name))
+    return [os.path.join(path, name) for name in names]
+
+
+def _segment_seq(filename):
+    return int(_SEGMENT_RE.match(os.path.basename(filename)).group(1))
+
+
+class Aggregate(object):
+    """ Status report statistics for a group of messages """
+
+    __slots__ = ('reports', 'delivered', 'failed', 'cost', 'net_price', 'latency_sum', 'latency_count')
+
+    def __init__(self):
+        #: Status reports
+        self.reports = 0
+        #: Messages delivered
+        self.delivered = 0
+        #: Messages expired or failed
+        self.failed = 0
+        #: Total `CPACost`
+        self.cost = 0.0
+        #: Total `NetPrice`
+        self.net_price = 0.0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    @property
+    def delivery_rate(self):
+        """ Delivered messages / messages with a final status
+
+            :rtype: float | None
+        """
+        final = self.delivered + self.failed
+        return self.delivered / float(final) if final else None
+
+    @property
+    def latency(self):
+        """ Mean time from sending to the final status, seconds. Only for messages sent while logging
+
+            :rtype: float | None
+        """
+        return self.latency_sum / self.latency_count if self.latency_count else None
+
+    def __repr__(self):
+        return '{}(reports={}, delivery_rate={}, latency={}, cost={}, net_price={})'.format(
+            self.__class__.__name__, self.reports, self.delivery_rate, self.latency, self.cost, self.net_price)
+
+
+class EventLogReader(object):
+    """ Streams and aggregates the records of an :class:`EventLog`
+
+        Segments are memory-mapped, and records are decoded one at a time:
+        memory use does not depend on the size of the log.
+    """
+
+    def __init__(self, path):
+        """ Open a log directory
+
+            :type path: str
+            :param path: Directory with the segment files
+        """
+        self.path = path
+
+    def _segment(self, filename):
+        """ Records of a segment file
+
+            :rtype: collections.Iterator
+            :raises ValueError: Not a segment file, or a different record format
+        """
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= HEADER.size:
+                return
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, version, record_size = HEADER.unpack_from(m, 0)
+                if magic != MAGIC or record_size != RECORD.size:
+                    raise ValueError('Not an event log segment: {}'.format(filename))
+                end = size - (size - HEADER.size) % RECORD.size  # a record being written
+                for offset in range(HEADER.size, end, RECORD.size):
+                    yield Event._make(RECORD.unpack_from(m, offset))
+            finally:
+                m.close()
+
+    def __iter__(self):
+        """ All records, the oldest first
+
+            :rtype: collections.Iterator
+        """
+        for filename in list_segments(self.path):
+            for event in self._segment(filename):
+                yield event
+
+    def events(self, kind=None, since=None):
+        """ Records of a kind, since a time
+
+            :type kind: int | None
+            :param kind: SENT, STATUS, or `None` for all
+            :type since: float | None
+            :param since: UNIX time
+            :rtype: collections.Iterator
+        """
+        for event in self:
+            if (kind is None or event.kind == kind) and (since is None or event.time >= since):
+                yield event
+
+    def aggregate(self, by='operator', since=None):
+        """ Status report statistics: delivery rate, latency and cost, by operator or country
+
+            Latency is matched by `refno` between SENT and STATUS records:
+            only the messages still waiting for a final status are kept in memory.
+
+            :type by: str
+            :param by: Group by: 'operator', 'country'
+            :type since: float | None
+            :param since: UNIX time
+            :rtype: dict
+            :returns: { OperatorID or CountryID: Aggregate }
+        """
+        assert by in ('operator', 'country'), 'Unknown grouping: {}'.format(by)
+        groups = {}
+        waiting = {}  # refno -> sent time
+
+        for event in self.events(since=since):
+            if event.kind == SENT:
+                if event.state == OK and event.refno:
+                    waiting[event.refno] = event.time
+                continue
+
+            key = getattr(event, by)
+            agg = groups.get(key)
+            if agg is None:
+                agg = groups[key] = Aggregate()
+            agg.reports += 1
+            if not math.isnan(event.cost):
+                agg.cost += event.cost
+            if not math.isnan(event.net_price):
+                agg.net_price += event.net_price
+
+            if event.state in FINAL:
+                if event.state == DELIVERED:
+                    agg.delivered += 1
+                else:
+                    agg.failed += 1
+                sent = waiting.pop(event.refno, None)
+                if sent is not None:
+                    agg.latency_sum += event.time - sent
+                    agg.latency_count += 1
+        return groups
+
+#endregion
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import json
+import logging
+import threading
+from time import time
+from datetime import datetime
+from collections import OrderedDict
+
+try: # Py3
+    from queue import Queue, Full, Empty
+except ImportError: # Py2
+    from Queue import Queue, Full, Empty
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue(object):
+    """ Bounded queue between the receiver and the gateway callbacks
+
+        The receiver puts validated requests into the queue and acks them right away,
+        while a pool of worker threads hands them over to the gateway.
+
+        With a `journal`, every request is written to an append-only file before it's acked,
+        and marked as done once processed. Requests that were not processed before the process died
+        are replayed on the next start. The journal is compacted on start, and every `compact_every` done requests,
+        so it stays as small as the backlog.
+    """
+
+    def __init__(self, handler, maxsize=10000, workers=4, overflow='reject', block_timeout=1.0,
+                 journal=None, fsync=False, compact_every=10000):
+        """ Create the queue and start the workers
+
+            :type handler: callable
+            :param handler: Function that processes a request: handler(kind, req, obj, rtime)
+                `kind` is the request type ('im', 'status'), `req` is the dict of request arguments,
+                `obj` is the decoded object (or `None` for replayed requests), `rtime` is the received time.
+            :type maxsize: int
+            :param maxsize: Max number of requests waiting in the queue
+            :type workers: int
+            :param workers: The number of worker threads
+            :type overflow: str
+            :param overflow: What to do when the queue is full:
+                'reject': reject the request right away: Vianett will retry it later;
+                'block': wait for `block_timeout` seconds, then reject
+            :type block_timeout: float
+            :param block_timeout: Timeout for the 'block' overflow policy, seconds
+            :type journal: str | None
+            :param journal: Path to the journal file. Default: no journal: requests are lost if the process dies
+            :type fsync: bool
+            :param fsync: Sync the journal to disk on every request?
+                Without it, requests survive a crash of the process, but not of the OS.
+            :type compact_every: int | None
+            :param compact_every: Rewrite the journal with just the pending requests after this many are done.
+                `None`: only on start
+        """
+        assert overflow in ('reject', 'block'), 'Unsupported overflow policy: {}'.format(overflow)
+        self.handler = handler
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.fsync = fsync
+        self.compact_every = compact_every
+
+        #: Statistics: the number of requests accepted, rejected, processed, failed
+        self.accepted = self.rejected = self.processed = self.failed = 0
+        #: Statistics: the number of times the journal was compacted while running
+        self.compactions = 0
+
+        self._queue = Queue(maxsize)
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # Journal
+        self._journal = None
+        self._journal_path = journal
+        self._seq = 0
+        self._pending = OrderedDict()  # id -> journaled request record, not done yet
+        self._done_early = set()  # ids marked as done before their request record was written: see put()
+        self._done_count = 0  # 'done' records since the last compaction
+        pending = []
+        if journal is not None:
+            pending = self._open_journal(journal)
+
+        # Workers
+        self._workers = [threading.Thread(target=self._worker, name='vianett-ingest-{}'.format(i))
+                         for i in range(workers)]
+        for t in self._workers:
+            t.daemon = True
+            t.start()
+
+        # Replay
+        for id, kind, req, rtime in pending:
+            self._queue.put((id, kind, req, None, rtime))
+
+    @property
+    def depth(self):
+        """ The number of requests waiting in the queue
+
+            :rtype: int
+        """
+        return self._queue.qsize()
+
+    #region Journal
+
+    def _open_journal(self, path):
+        """ Open the journal: compact it, and return the requests that weren't processed
+
+            :rtype: list
+            :returns: [ (id, kind, req, rtime) ]
+        """
+        records, done = [], set()
+        if os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn write
+                    if 'done' in rec:
+                        done.add(rec['done'])  # can go before the request record: see put()
+                    else:
+                        records.append(rec)
+
+        # Compact: rewrite the pending records
+        records = [rec for rec in records if rec['id'] not in done]
+        self._rewrite(records)
+
+        self._pending = OrderedDict((rec['id'], rec) for rec in records)
+        self._seq = max([rec['id'] for rec in records] or [0])
+        return [(rec['id'], rec['kind'], rec['req'], datetime.utcfromtimestamp(rec['t'])) for rec in records]
+
+    def _rewrite(self, records):
+        """ Atomically replace the journal with these records, and reopen it for appending """
+        path = self._journal_path
+        tmp = path + '.tmp'
+        with io.open(tmp, 'w', encoding='utf-8') as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + u'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal is not None:
+            self._journal.close()
+        os.rename(tmp, path)
+        self._journal = io.open(path, 'a', encoding='utf-8')
+        self._done_count = 0
+
+    def _compact(self):
+        """ Rewrite the journal with the pending requests. Called with the lock held """
+        records = list(self._pending.values())
+        records.extend({'done': id} for id in self._done_early)
+        self._rewrite(records)
+        self.compactions += 1
+
+    def _write(self, rec):
+        """ Append a record to the journal, and compact it when enough requests are done """
+        line = json.dumps(rec, ensure_ascii=False) + u'\n'
+        with self._lock:
+            if self._journal.closed:
+                return  # a worker that outlived close()
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+            # Keep track of the pending requests
+            if 'done' in rec:
+                if self._pending.pop(rec['done'], None) is None:
+                    self._done_early.add(rec['done'])
+                self._done_count += 1
+                if self.compact_every is not None and self._done_count >= self.compact_every:
+                    self._compact()
+            elif rec['id'] in self._done_early:
+                self._done_early.discard(rec['id'])
+            else:
+                self._pending[rec['id']] = rec
+
+    #endregion
+
+    def put(self, kind, req, obj=None):
+        """ Put a request into the queue
+
+            :type kind: str
+            :param kind: Request type: 'im', 'status'
+            :type req: dict
+            :param req: Request arguments
+            :param obj: Decoded object, if any
+            :rtype: bool
+            :returns: Whether the request was accepted. When `False`, respond with an error so Vianett retries it
+        """
+        if self._closed:
+            return False
+
+        rtime = datetime.utcnow()
+        with self._lock:
+            self._seq += 1
+            id = self._seq
+        item = (id, kind, req, obj, rtime)
+
+        # Enqueue
+        try:
+            if self.overflow == 'block':
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except Full:
+            self.rejected += 1
+            return False
+
+        # Journal
+        # The worker may pick it up before this is written: no problem, a 'done' record just goes first
+        if self._journal is not None:
+            self._write({'id': id, 'kind': kind, 'req': req, 't': time()})
+        self.accepted += 1
+        return True
+
+    def _worker(self):
+        """ Worker thread: process requests """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                id, kind, req, obj, rtime = item
+                try:
+                    self.handler(kind, req, obj, rtime)
+                    self.processed += 1
+                except Exception:
+                    self.failed += 1
+                    logger.exception('Vianett {} request failed: {}'.format(kind, req))
+                if self._journal is not None:
+                    self._write({'done': id})
+            finally:
+                self._queue.task_done()
+
+    def close(self, drain=True, timeout=None):
+        """ Stop accepting requests, and stop the workers
+
+            :type drain: bool
+            :param drain: Process the queued requests first?
+                Otherwise, queued requests are left in the journal (if any) and replayed on the next start.
+            :type timeout: float | None
+            :param timeout: Max time to wait for the workers, seconds
+        """
+        self._closed = True
+
+        # Discard
+        if not drain:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except Empty:
+                    break
+                self._queue.task_done()
+
+        # Stop the workers
+        for t in self._workers:
+            self._queue.put(None)
+        deadline = None if timeout is None else time() + timeout
+        for t in self._workers:
+            t.join(None if deadline is None else max(0, deadline - time()))
+
+        if self._journal is not None:
+            with self._lock:
+                self._journal.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import unicodedata
+
+
+def normalize_keyword(keyword):
+    """ Normalize a keyword for lookups: NFKC, case-folded, stripped
+
+        So 'STOP', 'stop', ' Stop ' and full-width 'ＳＴＯＰ' are the same keyword.
+
+        :type keyword: str
+        :rtype: str
+    """
+    keyword = unicodedata.normalize('NFKC', keyword).strip()
+    try:
+        return keyword.casefold()
+    except AttributeError: # Py2
+        return keyword.lower()
+
+
+class KeywordRouter(object):
+    """ Dispatches incoming messages to handlers by keyword
+
+        The keyword is Vianett's 'prefix' field: the first word of the message.
+        With `use_prefix=False`, it's the first word of the body.
+
+        Keywords are normalized once, when added, and go into a hash index:
+        a lookup costs one normalization and one dict lookup, whatever the number of keywords.
+    """
+
+    def __init__(self, handlers=None):
+        """ Create a router
+
+            :type handlers: dict | None
+            :param handlers: { keyword: handler(message) }
+        """
+        #: Hash index: { normalized keyword: handler }
+        self._index = {}
+
+        self._hits = None
+        #: Statistics: messages without a handler
+        self.misses = 0
+
+        for keyword, handler in (handlers or {}).items():
+            self.add(keyword, handler)
+
+    @property
+    def hits(self):
+        """ Statistics: dispatched messages by keyword
+
+            Created with the first keyword: routers without keywords don't load :mod:`smsframework_vianett.metrics`
+
+            :rtype: smsframework_vianett.metrics.Counter
+        """
+        if self._hits is None:
+            from .metrics import Counter
+            self._hits = Counter('keyword')
+        return self._hits
+
+    def add(self, keyword, handler):
+        """ Add a handler for a keyword
+
+            :type keyword: str
+            :type handler: callable
+            :param handler: Function that gets the `IncomingMessage`: handler(message).
+                `message.meta['keyword']` is the normalized keyword
+        """
+        self._index[normalize_keyword(keyword)] = handler
+        self.hits  # create the counter before anything is dispatched
+
+    def on(self, *keywords):
+        """ Decorator: add a handler for keywords
+
+            >>> @provider.keywords.on('STOP', 'UNSUBSCRIBE')
+            ... def stop(message): ...
+        """
+        def decorator(handler):
+            for keyword in keywords:
+                self.add(keyword, handler)
+            return handler
+        return decorator
+
+    def remove(self, keyword):
+        """ Remove the handler of a keyword """
+        self._index.pop(normalize_keyword(keyword), None)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, keyword):
+        return normalize_keyword(keyword) in self._index
+
+    @staticmethod
+    def keyword(message):
+        """ Get the keyword of a message
+
+            :type message: smsframework.data.IncomingMessage
+            :rtype: str
+        """
+        prefix = (message.meta or {}).get('prefix')
+        if prefix:
+            return prefix
+        words = message.body.split(None, 1)
+        return words[0] if words else ''
+
+    def dispatch(self, message):
+        """ Call the handler of the message's keyword, if any
+
+            :type message: smsframework.data.IncomingMessage
+            :rtype: bool
+            :returns: Whether a handler was called
+        """
+        if not self._index:
+            return False  # no keywords: no need to normalize
+
+        keyword = normalize_keyword(self.keyword(message))
+        handler = self._index.get(keyword)
+        if handler is None:
+            self.misses += 1
+            return False
+
+        self.hits.inc(keyword)
+        if message.meta is None:
+            message.meta = {}
+        message.meta['keyword'] = keyword
+        handler(message)
+        return True
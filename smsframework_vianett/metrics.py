@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+
+#: Default histogram buckets, seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """ Fixed-bucket histogram: constant memory, one bisect per observation """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        #: Upper bounds of the buckets
+        self.buckets = tuple(buckets)
+        #: Observations per bucket; the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        #: Sum of observed values
+        self.sum = 0.0
+        #: The number of observations
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """ Record a value """
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """ Get the current values
+
+            :rtype: dict
+            :returns: { buckets: [(upper bound, cumulative count)], sum, count }
+        """
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, buckets = 0, []
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            buckets.append((bound, cumulative))
+        return {'buckets': buckets, 'sum': total, 'count': count}
+
+
+class HistogramVec(object):
+    """ Histograms by label value """
+
+    __slots__ = ('label', 'buckets', 'histograms', '_lock')
+
+    def __init__(self, label, buckets=DEFAULT_BUCKETS):
+        #: Label name
+        self.label = label
+        self.buckets = tuple(buckets)
+        #: label value -> Histogram
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value):
+        """ Get the histogram for a label value
+
+            :rtype: Histogram
+        """
+        try:
+            return self.histograms[value]
+        except KeyError:
+            with self._lock:
+                return self.histograms.setdefault(value, Histogram(self.buckets))
+
+    def observe(self, label, value):
+        """ Record a value """
+        self.labels(label).observe(value)
+
+    def snapshot(self):
+        """ Get the current values
+
+            :rtype: dict
+            :returns: { label value: histogram snapshot }. See :meth:`Histogram.snapshot`
+        """
+        with self._lock:
+            histograms = dict(self.histograms)
+        return dict((v, h.snapshot()) for v, h in histograms.items())
+
+
+class Counter(object):
+    """ Counters by label value """
+
+    __slots__ = ('label', 'values', '_lock')
+
+    def __init__(self, label):
+        #: Label name
+        self.label = label
+        #: label value -> count
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label, n=1):
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+class Gauge(object):
+    """ A value that goes up and down """
+
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def dec(self, n=1):
+        with self._lock:
+            self.value -= n
+
+    def snapshot(self):
+        return self.value
+
+
+class Metrics(object):
+    """ Hot-path metrics of a provider
+
+        Collected only when enabled: a disabled provider has `metrics = None`, and skips the timing altogether.
+    """
+
+    #: name -> (type, help)
+    DESCRIPTIONS = {
+        'connect_seconds': ('histogram', 'TCP connection time'),
+        'tls_seconds': ('histogram', 'TLS handshake time'),
+        'request_seconds': ('histogram', 'API request time, from sending the request to reading the response'),
+        'parse_seconds': ('histogram', 'API response parsing time'),
+        'responses_total': ('counter', 'API responses by Vianett errorcode, HTTP status, or connection error'),
+        'inflight_requests': ('gauge', 'API requests in progress'),
+        'received_total': ('counter', 'Receiver requests by route'),
+        'receive_seconds': ('histogram', 'Receiver request handling time'),
+        'queue_seconds': ('histogram', 'Time messages wait in the scheduler, by priority lane'),
+    }
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, exporters=()):
+        """ Create the metrics
+
+            :type buckets: collections.Sequence
+            :param buckets: Histogram buckets, seconds
+            :type exporters: collections.Iterable
+            :param exporters: Exporters to start: e.g., :class:`CallbackExporter`
+        """
+        self.connect_seconds = Histogram(buckets)
+        self.tls_seconds = Histogram(buckets)
+        self.request_seconds = Histogram(buckets)
+        self.parse_seconds = Histogram(buckets)
+        self.responses_total = Counter('code')
+        self.inflight_requests = Gauge()
+        self.received_total = Counter('route')
+        self.receive_seconds = Histogram(buckets)
+        self.queue_seconds = HistogramVec('lane', buckets)
+
+        self.exporters = list(exporters)
+        for exporter in self.exporters:
+            exporter.start(self)
+
+    def snapshot(self):
+        """ Get the current values of all metrics
+
+            :rtype: dict
+        """
+        return dict((name, getattr(self, name).snapshot()) for name in self.DESCRIPTIONS)
+
+    def prometheus(self, prefix='vianett_'):
+        """ Render the metrics in Prometheus text exposition format
+
+            :rtype: str
+        """
+        lines = []
+        for key, value in sorted(self.snapshot().items()):
+            type, help = self.DESCRIPTIONS[key]
+            name = prefix + key
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, type))
+            if type == 'histogram':
+                metric = getattr(self, key)
+                if isinstance(metric, HistogramVec):
+                    for v, h in sorted(value.items()):
+                        self._prometheus_histogram(lines, name, h, '{}="{}",'.format(metric.label, v))
+                else:
+                    self._prometheus_histogram(lines, name, value)
+            elif type == 'counter':
+                label = getattr(self, key).label
+                for v, n in sorted(value.items()):
+                    lines.append('{}{{{}="{}"}} {}'.format(name, label, v, n))
+            else:
+                lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _prometheus_histogram(lines, name, value, labels=''):
+        """ Render a histogram snapshot, optionally with 'name="value",' labels """
+        for bound, n in value['buckets']:
+            lines.append('{}_bucket{{{}le="{}"}} {}'.format(name, labels, '+Inf' if bound == float('inf') else repr(bound), n))
+        labels = '{{{}}}'.format(labels.rstrip(',')) if labels else ''
+        lines.append('{}_sum{} {!r}'.format(name, labels, value['sum']))
+        lines.append('{}_count{} {}'.format(name, labels, value['count']))
+
+    def close(self):
+        """ Stop the exporters """
+        for exporter in self.exporters:
+            exporter.stop()
+
+
+class CallbackExporter(object):
+    """ Calls a function with a snapshot of the metrics every `interval` seconds """
+
+    def __init__(self, callback, interval=10.0):
+        """ Create the exporter
+
+            :type callback: callable
+            :param callback: Function that gets the snapshot: callback(dict). See :meth:`Metrics.snapshot`
+            :type interval: float
+            :param interval: Seconds between calls
+        """
+        self.callback = callback
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, metrics):
+        self._thread = threading.Thread(target=self._run, args=(metrics,), name='vianett-metrics')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, metrics):
+        """ Thread: export periodically, and once more on stop """
+        while True:
+            stopped = self._stop.wait(self.interval)
+            try:
+                self.callback(metrics.snapshot())
+            except Exception:
+                logger.exception('Metrics exporter failed')
+            if stopped:
+                return
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
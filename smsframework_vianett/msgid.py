@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import tempfile
+import warnings
+import threading
+from time import time
+from zlib import crc32
+
+try: # POSIX
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+
+#: Environment variable with the node id of the default generator, 0..1023
+NODE_ENV = 'VIANETT_MSGID_NODE'
+
+#: Name of the node id lease directory, in the temp directory
+LEASE_DIR = 'vianett-msgid-nodes'
+
+
+def lease_node(path, bits=10):
+    """ Lease a node id that no other process on this host holds
+
+        Every node id is a lock file in `path`, locked with `flock()` while a process holds it:
+        the lock is released when the process exits, even when it's killed.
+        The search starts at a node id derived from the hostname, so different hosts tend to get different ones;
+        only explicit node ids are guaranteed to be unique across hosts.
+
+        :type path: str
+        :param path: Lease directory. Created if missing
+        :type bits: int
+        :param bits: Node id bits
+        :rtype: (int, int)
+        :returns: (node id, file descriptor that holds the lease)
+        :raises RuntimeError: All node ids are taken
+        :raises OSError: The directory is not writable
+    """
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+    size = 1 << bits
+    start = crc32(socket.gethostname().encode('utf-8')) & (size - 1)
+    for i in range(size):
+        node = (start + i) % size
+        fd = os.open(os.path.join(path, '{}.lock'.format(node)), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            os.close(fd)  # held by another process
+            continue
+        return node, fd
+    raise RuntimeError('All {} msgid node ids are leased in {}'.format(size, path))
+
+
+class SnowflakeMsgidGenerator(object):
+    """ Unique, monotonic message id generator
+
+        Every id is a 63-bit integer, formatted as decimal digits (at most 19 of them):
+
+        * 41 bits: milliseconds since `epoch`
+        * 10 bits: node id: identifies the process
+        * 12 bits: sequence number within a millisecond
+
+        This gives 4096 ids per millisecond per process. When these run out, or when the system clock goes back,
+        the generator borrows the next millisecond instead of waiting, so it never blocks, and ids never repeat.
+
+        Ids are unique across processes as long as their node ids differ. Unless given a `node`,
+        or the :data:`NODE_ENV` environment variable, a generator leases a node id on first use (see :func:`lease_node`):
+        no two processes on a host get the same one, and forked children lease their own.
+        With more than one host, give every host its own node ids: the leases are only host-wide.
+        Where leases are not available (Windows, a read-only temp directory), the node id is derived
+        from the hostname and the pid, with a warning: two of 10 processes get the same one with a 4% chance.
+
+        Thread-safe.
+    """
+
+    #: Custom epoch: 2014-01-01 00:00:00 UTC, milliseconds
+    EPOCH = 1388534400000
+
+    NODE_BITS = 10
+    SEQUENCE_BITS = 12
+
+    def __init__(self, node=None, epoch=EPOCH, lease_dir=None):
+        """ Create a generator
+
+            :type node: int | None
+            :param node: Node id, 0..1023. Default: from the :data:`NODE_ENV` environment variable,
+                or leased on first use
+            :type epoch: int
+            :param epoch: Custom epoch, milliseconds since the UNIX epoch
+            :type lease_dir: str | None
+            :param lease_dir: Node id lease directory. Default: :data:`LEASE_DIR` in the temp directory
+        """
+        env = os.environ.get(NODE_ENV) if node is None else None
+        self._auto_node = node is None
+        self._node = int(env) if env else node
+        assert self._node is None or 0 <= self._node < 1 << self.NODE_BITS, 'Node id out of range: {}'.format(self._node)
+        self.epoch = epoch
+        self.lease_dir = lease_dir
+
+        self._lease = None  # file descriptor of the lease
+        self._pid = os.getpid()  # to notice forks without os.register_at_fork(): Py < 3.7
+        self._last = 0  # (ms << SEQUENCE_BITS) | sequence, of the last id
+        self._lock = threading.Lock()
+
+    @property
+    def node(self):
+        """ Node id: leased on first use, unless given
+
+            :rtype: int
+        """
+        with self._lock:
+            return self._get_node()
+
+    @node.setter
+    def node(self, node):
+        assert 0 <= node < 1 << self.NODE_BITS, 'Node id out of range: {}'.format(node)
+        with self._lock:
+            self._release()
+            self._node = node
+            self._auto_node = False
+
+    def _get_node(self):
+        """ Get the node id, or lease one. Called with the lock held """
+        if self._pid != os.getpid():
+            self._forked()
+        if self._node is None:
+            self._node = self._lease_node()
+        return self._node
+
+    def _lease_node(self):
+        """ Lease a node id, or derive one from the hostname and the pid """
+        if fcntl is not None:
+            try:
+                node, self._lease = lease_node(self.lease_dir or os.path.join(tempfile.gettempdir(), LEASE_DIR),
+                                               self.NODE_BITS)
+                return node
+            except (OSError, IOError, RuntimeError) as e:
+                error = e
+        else:
+            error = 'not supported on this platform'
+        warnings.warn('Failed to lease a msgid node id ({}): msgids may collide with other processes. '
+                      'Set the {} environment variable'.format(error, NODE_ENV), RuntimeWarning)
+        key = '{}:{}'.format(socket.gethostname(), os.getpid()).encode('utf-8')
+        return crc32(key) & ((1 << self.NODE_BITS) - 1)
+
+    def _release(self):
+        """ Give up the lease, if any """
+        if self._lease is not None:
+            os.close(self._lease)
+            self._lease = None
+
+    def _forked(self):
+        """ Drop the node id in a forked child
+
+            The child inherits the parent's node id and lease, and the environment variable:
+            it drops them, and leases its own on first use. Closing its copy of the lease keeps the parent's lock.
+        """
+        self._pid = os.getpid()
+        if self._auto_node:
+            self._release()
+            self._node = None
+
+    def _after_fork(self):
+        """ Reset the generator in a forked child """
+        self._lock = threading.Lock()
+        self._forked()
+
+    def next(self):
+        """ Generate an id
+
+            :rtype: int
+        """
+        tick = (int(time() * 1000) - self.epoch) << self.SEQUENCE_BITS
+        with self._lock:
+            node = self._get_node()
+            # Same millisecond, or the clock went back: take the next sequence number.
+            # Its overflow naturally carries into the millisecond.
+            self._last = tick if tick > self._last else self._last + 1
+            last = self._last
+        ms, seq = last >> self.SEQUENCE_BITS, last & ((1 << self.SEQUENCE_BITS) - 1)
+        return (((ms << self.NODE_BITS) | node) << self.SEQUENCE_BITS) | seq
+
+    def __call__(self):
+        """ Generate an id for the `msgid` request parameter
+
+            :rtype: str
+        """
+        return str(self.next())
+
+    def parse(self, msgid):
+        """ Split an id into its parts
+
+            :type msgid: str | int
+            :rtype: (int, int, int)
+            :returns: (UNIX time in milliseconds, node, sequence)
+        """
+        msgid = int(msgid)
+        seq = msgid & ((1 << self.SEQUENCE_BITS) - 1)
+        node = (msgid >> self.SEQUENCE_BITS) & ((1 << self.NODE_BITS) - 1)
+        ms = msgid >> (self.SEQUENCE_BITS + self.NODE_BITS)
+        return ms + self.epoch, node, seq
+
+
+#: Default generator, shared by all API clients in this process
+default_generator = SnowflakeMsgidGenerator()
+
+if hasattr(os, 'register_at_fork'):  # Py3.7+
+    os.register_at_fork(after_in_child=default_generator._after_fork)
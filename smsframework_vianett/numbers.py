@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+from collections import OrderedDict
+
+from . import const, encoding
+
+
+class InvalidNumberError(AssertionError):
+    """ Invalid phone number or sender address: rejected locally, without a request """
+    def __init__(self, number, reason):
+        self.number = number
+        self.reason = reason
+        super(InvalidNumberError, self).__init__('Invalid number {!r}: {}'.format(number, reason))
+
+
+#: Characters people put into phone numbers
+_SEPARATORS = re.compile(r'[\s\-./()]+', re.UNICODE)
+_DIGITS = re.compile(r'^[0-9]+$')
+
+
+class NumberNormalizer(object):
+    """ Normalizes and validates destination numbers and sender addresses before they're sent
+
+        * Destinations: separators and the international prefix ('+' or '00') are stripped,
+          so '+47 900-00 000' becomes '4790000000'. With `country_code`, national numbers get it prepended.
+        * Senders: classified into :class:`smsframework_vianett.const.SenderAddressType`.
+          Short codes are at most 6 digits long, so an 8-digit national MSISDN is not taken for one.
+
+        The same senders and recipients repeat all the time: results, errors included, are memoized in an LRU cache.
+
+        Thread-safe.
+    """
+
+    def __init__(self, min_digits=7, max_digits=15, country_code=None, short_code_digits=6, cache_size=10000,
+                 classify_senders=True):
+        """ Create a normalizer
+
+            :type min_digits: int
+            :param min_digits: Reject destinations shorter than this, with the country code. Default: 7, the shortest E.164 numbers
+            :type max_digits: int
+            :param max_digits: Reject destinations longer than this. Default: 15, the E.164 max
+            :type country_code: str | None
+            :param country_code: Country code for national numbers: those without '+' or '00'.
+                Their trunk prefix '0' is dropped. Default: numbers always include the country code
+            :type short_code_digits: int
+            :param short_code_digits: Numeric senders up to this long are short codes; longer ones are MSISDNs.
+                Default: 6, the longest short codes in use
+            :type cache_size: int
+            :param cache_size: Max number of results to remember
+            :type classify_senders: bool
+            :param classify_senders: Normalize, validate and classify senders: MSISDN, short code, alphanumeric.
+                Otherwise, senders are passed through as they are, and only alphanumeric ones are told apart
+        """
+        self.min_digits = min_digits
+        self.max_digits = max_digits
+        self.country_code = country_code
+        self.short_code_digits = short_code_digits
+        self.cache_size = cache_size
+        self.classify_senders = classify_senders
+
+        self._cache = OrderedDict()  # (kind, number) -> (result, error reason); the least recently used first
+        self._lock = threading.Lock()
+
+        #: Statistics: cache hits
+        self.hits = 0
+        #: Statistics: cache misses
+        self.misses = 0
+
+    #region Cache
+
+    def _cached(self, kind, number, func):
+        """ Get the result of `func(number)` from the cache, or compute and remember it
+
+            :raises InvalidNumberError: Invalid number
+        """
+        key = (kind, number)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                del self._cache[key]
+                self._cache[key] = entry  # most recently used
+                self.hits += 1
+        if entry is None:
+            try:
+                entry = func(number), None
+            except InvalidNumberError as e:
+                entry = None, e.reason
+            with self._lock:
+                self.misses += 1
+                self._cache[key] = entry
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        result, reason = entry
+        if reason is not None:
+            raise InvalidNumberError(number, reason)
+        return result
+
+    def clear(self):
+        """ Forget the cached results """
+        with self._lock:
+            self._cache.clear()
+
+    #endregion
+
+    #region Destinations
+
+    def _destination(self, number):
+        """ Normalize a destination number, without the cache """
+        digits = _SEPARATORS.sub('', number)
+        if digits.startswith('+'):
+            digits = digits[1:]
+        elif digits.startswith('00') and len(digits) > 2:
+            digits = digits[2:]
+        elif self.country_code is not None:
+            digits = self.country_code + (digits[1:] if digits.startswith('0') else digits)
+
+        if not _DIGITS.match(digits):
+            raise InvalidNumberError(number, 'not a phone number')
+        if len(digits) < self.min_digits:
+            raise InvalidNumberError(number, 'too short')
+        if len(digits) > self.max_digits:
+            raise InvalidNumberError(number, 'too long')
+        return digits
+
+    def destination(self, number):
+        """ Normalize a destination number
+
+            :type number: str
+            :rtype: str
+            :returns: Digits, with the country code
+            :raises InvalidNumberError: Invalid number
+        """
+        return self._cached('dst', number, self._destination)
+
+    def destinations(self, numbers):
+        """ Normalize a list of destination numbers
+
+            A failed number does not abort the batch: its exception is reported as the result.
+
+            :type numbers: collections.Iterable
+            :rtype: list
+            :returns: [ normalized number | InvalidNumberError ], in input order
+        """
+        ret = []
+        for number in numbers:
+            try:
+                ret.append(self.destination(number))
+            except InvalidNumberError as e:
+                ret.append(e)
+        return ret
+
+    def validate(self, numbers):
+        """ Validate a recipient list
+
+            :type numbers: collections.Iterable
+            :rtype: (list[str], dict)
+            :returns: (valid: unique normalized numbers, in input order; invalid: { number: InvalidNumberError })
+        """
+        valid, seen, invalid = [], set(), {}
+        for number in numbers:
+            try:
+                result = self.destination(number)
+            except InvalidNumberError as e:
+                invalid[number] = e
+                continue
+            if result not in seen:
+                seen.add(result)
+                valid.append(result)
+        return valid, invalid
+
+    #endregion
+
+    #region Senders
+
+    def _sender(self, address):
+        """ Normalize and classify a sender address, without the cache """
+        digits = _SEPARATORS.sub('', address)
+        if digits.startswith('+'):
+            digits = digits[1:]
+        if _DIGITS.match(digits):
+            if len(digits) > self.max_digits:
+                raise InvalidNumberError(address, 'too long')
+            if len(digits) <= self.short_code_digits:
+                return digits, const.SenderAddressType.SHORT_CODE
+            return digits, const.SenderAddressType.MSISN
+
+        # Alphanumeric: 11 GSM characters max
+        if not address or len(address) > 11:
+            raise InvalidNumberError(address, 'alphanumeric sender must be 1..11 characters')
+        if not encoding.GSM_CHARS.issuperset(address):
+            raise InvalidNumberError(address, 'alphanumeric sender must be GSM characters')
+        return address, const.SenderAddressType.ALPHANUMERIC
+
+    def sender(self, address):
+        """ Normalize and classify a sender address
+
+            Without `classify_senders`, the address is returned as it is, typed only when it's not a number.
+
+            :type address: str
+            :rtype: (str, int | None)
+            :returns: (address, `const.SenderAddressType`, or `None` to leave it to Vianett)
+            :raises InvalidNumberError: Invalid sender
+        """
+        if not self.classify_senders:
+            return address, None if address.lstrip('+').isdigit() else const.SenderAddressType.ALPHANUMERIC
+        return self._cached('src', address, self._sender)
+
+    #endregion
+
+
+#: Default normalizer: lenient, only rejects destinations that can't be a phone number.
+#: Senders are passed through, and only alphanumeric ones are typed: the full classification is opt-in,
+#: with the `numbers` provider option
+default_normalizer = NumberNormalizer(min_digits=1, classify_senders=False)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+import ssl
+import socket
+import select
+import threading
+from io import BytesIO
+from collections import deque
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+try: # Py3
+    from http.client import HTTPConnection, HTTPException, RemoteDisconnected as _ServerDisconnected
+    from urllib.request import HTTPError, URLError
+except ImportError: # Py2
+    from httplib import HTTPConnection, HTTPException, BadStatusLine as _ServerDisconnected
+    from urllib2 import HTTPError, URLError
+
+from .breaker import ConnectError
+
+
+class _Connection(HTTPConnection):
+    """ HTTP connection that reports its connection time to the pool metrics """
+
+    def __init__(self, host, pool, **kwargs):
+        HTTPConnection.__init__(self, host, **kwargs)
+        self._pool = pool
+
+    def _tcp_connect(self):
+        metrics = self._pool.metrics
+        t0 = monotonic()
+        HTTPConnection.connect(self)
+        if metrics is not None:
+            metrics.connect_seconds.observe(monotonic() - t0)
+
+    def connect(self):
+        self._tcp_connect()
+        self._pool._connected(self.sock)
+
+
+class _TLSConnection(_Connection):
+    """ HTTPS connection that resumes the TLS session shared by its pool """
+
+    default_port = 443
+
+    def connect(self):
+        self._tcp_connect()
+        metrics = self._pool.metrics
+        t0 = monotonic()
+        session = self._pool._tls_session
+        if session is not None and hasattr(ssl.SSLSocket, 'session'):  # Py3.6+
+            self.sock = self._pool._ssl_context.wrap_socket(self.sock, server_hostname=self.host, session=session)
+        else:
+            self.sock = self._pool._ssl_context.wrap_socket(self.sock, server_hostname=self.host)
+        if metrics is not None:
+            metrics.tls_seconds.observe(monotonic() - t0)
+        self._pool._remember_tls_session(self.sock)
+        self._pool._connected(self.sock)
+
+
+class _PooledConnection(object):
+    """ A connection with its bookkeeping """
+
+    __slots__ = ('conn', 'requests', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.requests = 0
+        self.last_used = monotonic()
+
+    def is_stale(self):
+        """ Did the server close this idle connection?
+
+            An idle keep-alive socket should never be readable: if it is, the server has sent EOF (or garbage).
+            Uses poll(): select() fails on descriptors above FD_SETSIZE, which busy processes get to.
+        """
+        sock = self.conn.sock
+        if sock is None:
+            return True
+        try:
+            if hasattr(select, 'poll'):
+                poll = select.poll()
+                poll.register(sock, select.POLLIN)
+                return bool(poll.poll(0))  # POLLIN, or POLLHUP/POLLERR/POLLNVAL
+            readable, _, _ = select.select([sock], [], [], 0)  # Windows: no FD_SETSIZE limit on descriptor numbers
+        except (ValueError, select.error):
+            return True
+        return bool(readable)
+
+
+class HttpConnectionPool(object):
+    """ Pool of persistent HTTP/1.1 keep-alive connections to a single host
+
+        Every request checks out a connection exclusively, so the pool can be shared by many threads.
+        Connections are reused across requests: this saves a TCP handshake (and a TLS handshake with HTTPS) per request.
+        When more than `size` requests are in flight, extra connections are opened, and closed once they're done.
+    """
+
+    def __init__(self, host, https=False, size=4, idle_timeout=30.0, max_requests=1000, timeout=None, ssl_context=None,
+                 metrics=None, connect_timeout=None):
+        """ Create a connection pool
+
+            :type host: str
+            :param host: Hostname to connect to, optionally with ':port'
+            :type https: bool
+            :param https: Use TLS?
+            :type size: int
+            :param size: Max number of idle connections to keep
+            :type idle_timeout: float
+            :param idle_timeout: Close connections that were idle for longer than this, seconds
+            :type max_requests: int | None
+            :param max_requests: Close connections that have served this many requests. `None`: unlimited
+            :type timeout: float | None
+            :param timeout: Socket timeout, seconds. `None`: the global default
+            :type ssl_context: ssl.SSLContext | None
+            :param ssl_context: Custom TLS context. Default: system defaults with certificate validation
+            :type metrics: smsframework_vianett.metrics.Metrics | None
+            :param metrics: Record connection and TLS handshake times
+            :type connect_timeout: float | None
+            :param connect_timeout: Timeout for connecting, including the TLS handshake, seconds.
+                `None`: same as `timeout`, which then applies to reading the response
+        """
+        self.host = host
+        self.https = https
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics
+
+        self._ssl_context = (ssl_context or ssl.create_default_context()) if https else None
+        self._tls_session = None
+
+        #: Idle connections: the most recently used one is on the right
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        """ Create a new (not yet connected) connection
+
+            :rtype: _PooledConnection
+        """
+        kwargs = {}
+        timeout = self.connect_timeout if self.connect_timeout is not None else self.timeout
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if self.https:
+            conn = _TLSConnection(self.host, self, **kwargs)
+        else:
+            conn = _Connection(self.host, self, **kwargs)
+        return _PooledConnection(conn)
+
+    def _connected(self, sock):
+        """ Switch a new connection from the connect timeout to the read timeout """
+        if self.connect_timeout is not None:
+            sock.settimeout(self.timeout if self.timeout is not None else socket.getdefaulttimeout())
+
+    def _remember_tls_session(self, sock):
+        """ Store the TLS session of a socket for resumption by new connections """
+        session = getattr(sock, 'session', None)
+        if session is not None:
+            self._tls_session = session
+
+    def _checkout(self):
+        """ Get an idle connection, or a new one
+
+            :rtype: _PooledConnection
+        """
+        now = monotonic()
+        discard = []
+        pc = None
+        with self._lock:
+            # Expire the oldest connections
+            while self._idle and now - self._idle[0].last_used > self.idle_timeout:
+                discard.append(self._idle.popleft())
+            # Take the warmest one
+            if self._idle:
+                pc = self._idle.pop()
+
+        for old in discard:
+            old.conn.close()
+
+        # Skip connections closed by the server while idle
+        if pc is not None and pc.is_stale():
+            pc.conn.close()
+            return self._checkout()
+        return pc or self._new_connection()
+
+    def _checkin(self, pc):
+        """ Return a connection to the pool """
+        pc.last_used = monotonic()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(pc)
+                return
+        pc.conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """ Make a request over a pooled connection
+
+            A reused connection may turn out to be closed by the server: then, the request is retried once
+            on a fresh connection. This only happens when the server has provably not responded to it.
+
+            :type method: str
+            :param method: HTTP method
+            :type path: str
+            :param path: Request path, with the query string
+            :type body: bytes | None
+            :param body: Request body
+            :type headers: dict | None
+            :param headers: Request headers
+            :rtype: bytes
+            :returns: Response body
+            :raises HTTPError: Http error code
+            :raises ConnectError: Connection failed before the request was sent
+            :raises URLError: Connection failed
+        """
+        headers = headers or {}
+        while True:
+            pc = self._checkout()
+            reused = pc.requests > 0
+            try:
+                try:
+                    pc.conn.request(method, path, body, headers)
+                except (socket.error, HTTPException) as e:
+                    # Nothing could have reached the server in a meaningful way: retry on a reused connection
+                    pc.conn.close()
+                    if reused:
+                        continue
+                    raise ConnectError(e)
+                try:
+                    res = pc.conn.getresponse()
+                except _ServerDisconnected:
+                    # Server has closed the keep-alive connection without responding
+                    pc.conn.close()
+                    if reused:
+                        continue
+                    raise
+                data = res.read()
+            except URLError:
+                raise  # ConnectError: Py3 URLError is a socket.error, too
+            except (socket.error, HTTPException) as e:
+                pc.conn.close()
+                raise URLError(e)
+            break
+
+        # Return the connection
+        pc.requests += 1
+        if self.https:
+            self._remember_tls_session(pc.conn.sock)
+        if res.will_close or (self.max_requests is not None and pc.requests >= self.max_requests):
+            pc.conn.close()
+        else:
+            self._checkin(pc)
+
+        # Error?
+        if res.status >= 400:
+            url = '{schema}://{host}{path}'.format(schema='https' if self.https else 'http', host=self.host, path=path)
+            raise HTTPError(url, res.status, res.reason, res.msg, BytesIO(data))
+        return data
+
+    def close(self):
+        """ Close all idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for pc in idle:
+            pc.conn.close()
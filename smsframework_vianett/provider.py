@@ -1,6 +1,15 @@
+from concurrent.futures import Future
+
 from smsframework import IProvider, exc
-from . import error
+from . import error, encoding
 from .api import VianettHttpApi, VianettApiError
+from .accounts import Account, AccountPool
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .batch import BatchEventHook, MicroBatcher, PartialBatchError
+from .keywords import KeywordRouter
+from .numbers import NumberNormalizer, default_normalizer
+from .decode import decode_message, decode_status
 
 try: # Py3
     from urllib.request import URLError, HTTPError
@@ -8,10 +17,41 @@ except ImportError: # Py2
     from urllib2 import URLError, HTTPError
 
 
+def translate_error(e):
+    """ Translate an API client exception into an `smsframework` exception
+
+        :type e: Exception
+        :param e: Exception raised by :class:`VianettHttpApi`
+        :rtype: Exception
+        :returns: The translated exception. Unknown exceptions are returned as is.
+    """
+    if isinstance(e, AssertionError):
+        return exc.RequestError(str(e))
+    if isinstance(e, HTTPError):
+        return exc.MessageSendError(str(e))
+    if isinstance(e, URLError):
+        return exc.ConnectionError(str(e))
+    if isinstance(e, VianettApiError):
+        return error.VianettProviderError(e.code, str(e))
+    return e
+
+
+def _options(value):
+    """ Get options from a config value: `True`, or a dict of options
+
+        :rtype: dict
+    """
+    return value if isinstance(value, dict) else {}
+
+
 class VianettProvider(IProvider):
     """ Vianett provider """
 
-    def __init__(self, gateway, name, user, password, https=False, use_prefix=True):
+    def __init__(self, gateway, name, user, password, https=False, use_prefix=True,
+                 keepalive=None, async_pool=None, rate_limit=None, retry=None, msgid_generator=None, max_segments=None,
+                 ingest=None, dedup=None, status_batch=None, spool=None, correlate=None, metrics=None,
+                 endpoints=None, breaker=None, connect_timeout=None, read_timeout=None, scheduler=None,
+                 accounts=None, sharding=None, keywords=None, processes=None, numbers=None, events=None):
         """ Configure Vianett provider
 
             :param user: Account username
@@ -21,18 +61,183 @@ class VianettProvider(IProvider):
                     Stupidly, Vianett splits all incoming messages by space, and the first part goes to 'Prefix'.
                     If you do not use prefixes, this can be very annoying!
                     Set `False`: then, the whole message contents goes to 'body'
+            :param keepalive: Reuse HTTP connections for outgoing messages?
+                    `True`, or a dict of connection pool options: `size`, `idle_timeout`, `max_requests`, `timeout`.
+                    See :class:`smsframework_vianett.pool.HttpConnectionPool`
+            :param async_pool: Connection pool options for :meth:`async_send`:
+                    `max_connections`, `size`, `idle_timeout`, `max_requests`, `timeout`.
+                    See :class:`smsframework_vianett.async_api.AsyncConnectionPool`
+            :param rate_limit: Pace outgoing messages?
+                    A dict of rate limiter options: `rate`, `burst`, `priorities`, `throttle_codes`, ...
+                    See :class:`smsframework_vianett.ratelimit.RateLimiter`
+            :param retry: Retry failed messages?
+                    `True`, or a dict of retry policy options: `attempts`, `base_delay`, `max_delay`, `retry_codes`, `budget`, `on_retry`.
+                    See :class:`smsframework_vianett.retry.RetryPolicy`
+            :param msgid_generator: Function that generates a unique `msgid` for every outgoing message.
+                    Default: :class:`smsframework_vianett.msgid.SnowflakeMsgidGenerator`
+            :param max_segments: Reject messages longer than this many SMS segments without sending them.
+                    See :mod:`smsframework_vianett.encoding`
+            :param ingest: Ack incoming messages and statuses right away, and process them in background threads?
+                    `True`, or a dict of ingest queue options: `maxsize`, `workers`, `overflow`, `journal`, `fsync`, `compact_every`.
+                    See :class:`smsframework_vianett.ingest.IngestQueue`
+            :param dedup: Ack repeated incoming messages and statuses without processing them again?
+                    `True`, or a dict of options: `maxsize`, `ttl`, `backend`.
+                    See :class:`smsframework_vianett.dedup.Deduplicator`
+            :param status_batch: Deliver status reports in micro-batches to `onStatusBatch` handlers?
+                    `True`, or a dict of options: `max_size`, `max_delay`, `retries`, `retry_delay`, `on_failure`.
+                    See :class:`smsframework_vianett.batch.MicroBatcher`
+            :param spool: Journal outgoing messages on disk, and send them in the background?
+                    Path to the SQLite database, or a dict of options: `path`, `batch_size`, `concurrency`, `synchronous`, `on_result`.
+                    See :class:`smsframework_vianett.spool.Spool`
+            :param correlate: Remember sent messages, and add them to their status reports?
+                    `True`, or a dict of options: `maxsize`, `ttl`, `path` (SQLite database), `backend`.
+                    See :class:`smsframework_vianett.correlate.Correlator`
+            :param metrics: Collect request and receiver metrics? Served at '<provider-name>/metrics'.
+                    `True`, or a dict of options: `buckets`, `exporters`.
+                    See :class:`smsframework_vianett.metrics.Metrics`
+            :param endpoints: API hosts, in the order of preference: e.g., `['smsc.vianett.no', 'backup.example.com:8080']`.
+                    A request that can't connect to a host goes to the next one
+            :param breaker: Fail fast when an endpoint is down?
+                    `True`, or a dict of circuit breaker options: `failure_rate`, `min_requests`, `window`, `open_timeout`, `probes`.
+                    See :class:`smsframework_vianett.breaker.CircuitBreaker`
+            :param connect_timeout: Timeout for connecting to the API, seconds
+            :param read_timeout: Timeout for an API response, seconds
+            :param scheduler: Send messages through a priority queue: escalated messages go first?
+                    `True`, or a dict of options: `concurrency`, `coalesce`.
+                    See :class:`smsframework_vianett.scheduler.Scheduler`
+            :param accounts: More accounts to send with: list of dicts: `user`, `password`, and optionally `rate_limit`.
+                    Every account gets its own connections and its own rate limiter (default: `rate_limit`)
+            :param sharding: How to distribute messages between the accounts: a routing strategy
+                    ('round-robin', 'least-loaded', 'hash'), or a dict of options: `routing`, `eject_after`, `eject_time`, `eject_codes`.
+                    See :class:`smsframework_vianett.accounts.AccountPool`
+            :param keywords: Handlers for incoming messages by keyword: { keyword: handler(message) }.
+                    Messages with other keywords go to `Gateway.onReceive`.
+                    See :class:`smsframework_vianett.keywords.KeywordRouter`
+            :param processes: Send messages from worker processes, to use all CPU cores?
+                    `True`, the max number of processes, or a dict of options: `processes`, `min_processes`, `concurrency`, `idle_timeout`, `start_method`.
+                    The rate limiter works in this process, for all accounts together.
+                    See :class:`smsframework_vianett.workers.ProcessPool`
+            :param numbers: Validate destination numbers strictly?
+                    `True`, or a dict of options: `min_digits`, `max_digits`, `country_code`, `short_code_digits`, `cache_size`, `classify_senders`.
+                    Destinations are always normalized; senders are validated and classified only with this option.
+                    See :class:`smsframework_vianett.numbers.NumberNormalizer`
+            :param events: Log sent messages and status reports into a compact binary log?
+                    Path to the log directory, or a dict of options: `path`, `segment_size`, `max_segments`, `buffer_size`, `flush_interval`.
+                    See :class:`smsframework_vianett.eventlog.EventLog`
         """
-        self.api = VianettHttpApi(user, password, https)
+        #: Rate limiter, shared by all API clients
+        self.limiter = RateLimiter(**rate_limit) if rate_limit else None
+
+        #: Retry policy, shared by all API clients
+        self.retry = None
+        if retry:
+            self.retry = RetryPolicy(**_options(retry))
+
+        #: Metrics, if enabled
+        self.metrics = None
+        if metrics:
+            from .metrics import Metrics
+            self.metrics = Metrics(**_options(metrics))
+
+        #: Number normalizer: validate recipient lists with `provider.numbers.validate(numbers)`
+        self.numbers = default_normalizer
+        if numbers:
+            self.numbers = NumberNormalizer(**_options(numbers))
+
+        #: Event log, if enabled
+        self.events = None
+        if events:
+            from .eventlog import EventLog
+            self.events = EventLog(**(events if isinstance(events, dict) else {'path': events}))
+
+        #: Accounts: [ (user, password, limiter) ]
+        self._accounts = [(user, password, self.limiter)]
+        for account in accounts or ():
+            limit = account.get('rate_limit', rate_limit)
+            self._accounts.append((account['user'], account['password'], RateLimiter(**limit) if limit else None))
+        self._sharding = sharding if isinstance(sharding, dict) else {'routing': sharding} if sharding else {}
+
+        api_args = dict(https=https, retry=self.retry, msgid_generator=msgid_generator, max_segments=max_segments,
+                        metrics=self.metrics, endpoints=endpoints, breaker=breaker,
+                        connect_timeout=connect_timeout, read_timeout=read_timeout, numbers=self.numbers,
+                        events=self.events)
+        if len(self._accounts) == 1:
+            self.api = VianettHttpApi(user, password, keepalive=keepalive, limiter=self.limiter, **api_args)
+        else:
+            self.api = AccountPool([Account(u, VianettHttpApi(u, p, keepalive=keepalive, limiter=l, **api_args))
+                                    for u, p, l in self._accounts], **self._sharding)
+        self._async_api = None
+        self._async_api_args = dict(async_pool or {}, **api_args)
         self.use_prefix = use_prefix
         super(VianettProvider, self).__init__(gateway, name)
 
-    def send(self, message):
-        """ Send a message
+        #: Receiver ingest queue, if enabled
+        self.ingest = None
+        if ingest:
+            from .ingest import IngestQueue
+            self.ingest = IngestQueue(self._ingest, **_options(ingest))
+
+        #: Receiver deduplicator, if enabled
+        self.dedup = None
+        if dedup:
+            from .dedup import Deduplicator
+            self.dedup = Deduplicator(**_options(dedup))
+
+        #: Keyword router for incoming messages: add handlers with `provider.keywords.add(keyword, handler)`
+        self.keywords = KeywordRouter(keywords)
+
+        #: Status batch event: handler(list of MessageStatus).
+        #: When nobody is subscribed, statuses go to `Gateway.onStatus` one by one
+        self.onStatusBatch = BatchEventHook()
+
+        #: Status batcher, if enabled
+        self.status_batcher = None
+        if status_batch:
+            self.status_batcher = MicroBatcher(self._receive_status_batch, **_options(status_batch))
+
+        #: Sent message index, if enabled
+        self.correlator = None
+        if correlate:
+            from .correlate import Correlator
+            self.correlator = Correlator(**_options(correlate))
+
+        #: Durable outbound spool, if enabled
+        self.spool = None
+        if spool:
+            from .spool import Spool
+            self.spool = Spool(self, **(spool if isinstance(spool, dict) else {'path': spool}))
+
+        #: Sender worker processes, if enabled
+        self.workers = None
+        if processes:
+            from .workers import ProcessPool
+            options = dict(accounts=[(u, p) for u, p, l in self._accounts], sharding=self._sharding,
+                           retry=_options(retry) if retry else None, keepalive=keepalive,
+                           https=https, max_segments=max_segments, endpoints=endpoints, breaker=breaker,
+                           connect_timeout=connect_timeout, read_timeout=read_timeout,
+                           numbers=_options(numbers) if numbers else None)
+            if not isinstance(processes, dict):
+                processes = {} if processes is True else {'processes': processes}
+            self.workers = ProcessPool(options, limiter=self.limiter, events=self.events, **processes)
+
+        #: Priority scheduler for outgoing messages, if enabled
+        self.scheduler = None
+        if scheduler:
+            from .scheduler import Scheduler
+            sendmsg = self.api.sendmsg if self.workers is None else self.workers.sendmsg
+            self.scheduler = Scheduler(sendmsg, metrics=self.metrics, **_options(scheduler))
+
+    def _message_params(self, message):
+        """ Get Vianett sending parameters for a message
+
+            Also populates `message.meta` with 'segments' and 'encoding': see :func:`encoding.plan`
 
             :type message: smsframework.data.OutgoingMessage.OutgoingMessage
-            :rtype: OutgoingMessage
-            """
-        # Parameters
+            :rtype: dict
+        """
+        plan = encoding.plan(message.body)
+        message.meta = dict(message.meta or {}, segments=plan.segments, encoding=plan.encoding)
+
         params = {}
         if message.src:
             params['SenderAddress'] = message.src
@@ -43,31 +248,225 @@ class VianettProvider(IProvider):
         if message.provider_options.allow_reply:
             params['ReplyPathValue'] = 60*24  # Should be enough?
         params.update(message.provider_params)
+        if 'msgid' not in params:
+            params['msgid'] = self.api.new_msgid()
+        return params
+
+    def _sent(self, message, msgid):
+        """ Remember a sent message, if correlation is enabled
+
+            :type message: smsframework.data.OutgoingMessage.OutgoingMessage
+            :param msgid: Our message id
+        """
+        if self.correlator is not None:
+            self.correlator.sent(msgid, message.msgid, message.dst, message.meta)
+
+    def send(self, message):
+        """ Send a message
+
+            :type message: smsframework.data.OutgoingMessage.OutgoingMessage
+            :rtype: OutgoingMessage
+            """
+        # Parameters
+        params = self._message_params(message)
 
         # Send
         try:
-            message.msgid = self.api.sendmsg(message.dst, message.body, **params)
-            return message
-        except AssertionError as e:
-            raise exc.RequestError(str(e))
-        except HTTPError as e:
-            raise exc.MessageSendError(str(e))
-        except URLError as e:
-            raise exc.ConnectionError(str(e))
-        except VianettApiError as e:
-            raise error.VianettProviderError(e.code, str(e))
+            if self.scheduler is not None:
+                message.msgid = self.scheduler.submit(message.dst, message.body, params).result()
+            elif self.workers is not None:
+                message.msgid = self.workers.submit(message.dst, message.body, params).result()
+            else:
+                message.msgid = self.api.sendmsg(message.dst, message.body, **params)
+        except (AssertionError, URLError, VianettApiError) as e:
+            raise translate_error(e)
+        self._sent(message, params['msgid'])
+        return message
+
+    def schedule(self, message):
+        """ Queue a message in the scheduler, without waiting for it to be sent
+
+            Requires the `scheduler` option. The sent message fires the `Gateway.onSend` event.
+
+            :type message: smsframework.data.OutgoingMessage.OutgoingMessage
+            :rtype: concurrent.futures.Future
+            :returns: Future that gets the sent `OutgoingMessage`, or the exception, translated just like :meth:`send` does
+        """
+        assert self.scheduler is not None, 'The scheduler is not enabled'
+        params = self._message_params(message)
+        future = Future()
+
+        def done(f):
+            e = f.exception()
+            if e is not None:
+                future.set_exception(translate_error(e))
+                return
+            message.provider = self.name
+            message.msgid = f.result()
+            self._sent(message, params['msgid'])
+            try:
+                self.gateway.onSend(message)
+            finally:
+                future.set_result(message)
+
+        self.scheduler.submit(message.dst, message.body, params).add_done_callback(done)
+        return future
+
+    def send_many(self, messages, concurrency=4, ordered=True):
+        """ Send many messages concurrently
+
+            A failed message does not abort the batch: its exception is reported as the result,
+            translated just like :meth:`send` does.
+            Successfully sent messages fire the `Gateway.onSend` event.
+
+            :type messages: collections.Iterable
+            :param messages: Iterable of messages: `OutgoingMessage` objects
+            :type concurrency: int
+            :param concurrency: The number of messages to send in parallel
+            :type ordered: bool
+            :param ordered: Report results in input order? Otherwise, in completion order.
+            :rtype: collections.Iterator
+            :returns: Iterator of `(message, result)` tuples,
+                where `result` is the sent `OutgoingMessage`, or an exception
+        """
+        pending = {}  # index -> (message, msgid), only for those in progress
+
+        def _records():
+            for index, message in enumerate(messages):
+                params = self._message_params(message)
+                pending[index] = message, params['msgid']
+                yield message.dst, message.body, params
+
+        api = self.api if self.workers is None else self.workers
+        for index, result in api.sendmsg_many(_records(), concurrency=concurrency, ordered=ordered):
+            message, msgid = pending.pop(index)
+            if isinstance(result, Exception):
+                yield message, translate_error(result)
+            else:
+                message.provider = self.name
+                message.msgid = result
+                self._sent(message, msgid)
+                self.gateway.onSend(message)
+                yield message, message
+
+    @property
+    def async_api(self):
+        """ asyncio API client, created on first use
+
+            :rtype: smsframework_vianett.async_api.AsyncVianettHttpApi | smsframework_vianett.async_api.AsyncAccountPool
+        """
+        if self._async_api is None:
+            from .async_api import AsyncVianettHttpApi, AsyncAccountPool
+            apis = [AsyncVianettHttpApi(u, p, limiter=l, **self._async_api_args) for u, p, l in self._accounts]
+            if len(apis) == 1:
+                self._async_api = apis[0]
+            else:
+                self._async_api = AsyncAccountPool([Account(u, api) for (u, p, l), api in zip(self._accounts, apis)],
+                                                   **self._sharding)
+        return self._async_api
+
+    def async_send(self, message):
+        """ Send a message without blocking the event loop
+
+            Works like :meth:`send`, and fires the `Gateway.onSend` event. Requires Python 3.5+.
+
+            :type message: smsframework.data.OutgoingMessage.OutgoingMessage
+            :rtype: collections.Awaitable
+            :returns: Coroutine that returns the sent `OutgoingMessage`
+        """
+        from .async_api import async_send
+        return async_send(self, message)
 
     def make_receiver_blueprint(self):
         """ Create the receiver blueprint """
         from . import receiver
         return receiver.bp
 
+    def make_asgi_app(self, executor=None, max_pending=None):
+        """ Create an ASGI receiver app: an alternative to the Flask blueprint. Requires Python 3.5+
+
+            :type executor: concurrent.futures.Executor | None
+            :param executor: Executor for gateway handlers. Default: the event loop's default executor
+            :type max_pending: int | None
+            :param max_pending: Max number of callbacks waiting for the executor; more get HTTP 503
+            :rtype: smsframework_vianett.asgi.ReceiverApp
+        """
+        from .asgi import ReceiverApp
+        return ReceiverApp(self, executor, max_pending)
+
+    def _ingest(self, kind, req, obj, rtime):
+        """ Process a request from the ingest queue """
+        if kind == 'im':
+            self._receive_message(obj or decode_message(req, self.use_prefix, rtime))
+        else:
+            self._receive_status(obj or decode_status(req, rtime))
+
+    def _receive_message(self, message):
+        """ Incoming message callback
+
+            Messages with a known keyword go to its handler; others go to `Gateway.onReceive`
+        """
+        message.provider = self.name
+        if self.keywords.dispatch(message):
+            return message
+        return super(VianettProvider, self)._receive_message(message)
+
+    def _receive_status(self, status):
+        """ Incoming status callback
+
+            With correlation, the status is enriched with the sent message: see :meth:`Correlator.enrich`.
+            With batching, the status is queued, and delivered later by :meth:`_receive_status_batch`
+        """
+        if self.events is not None:
+            self.events.status(status)
+        if self.correlator is not None:
+            self.correlator.enrich(status)
+
+        if self.status_batcher is None:
+            return super(VianettProvider, self)._receive_status(status)
+
+        status.provider = self.name
+        self.status_batcher.put(status)
+        return status
+
+    def _receive_status_batch(self, statuses):
+        """ Incoming status batch callback
+
+            Calls `onStatusBatch`, or `Gateway.onStatus` for every status when `onStatusBatch` has no handlers.
+            An exception from `onStatusBatch` fails the whole batch: the batcher retries it, so batch handlers
+            get statuses at least once. With `Gateway.onStatus`, only the failed statuses are retried.
+
+            :type statuses: list[MessageStatus]
+            :raises PartialBatchError: Some statuses have failed in `Gateway.onStatus`
+        """
+        delivered, failed, error = statuses, [], None
+        if self.onStatusBatch:
+            self.onStatusBatch(statuses)
+        else:
+            delivered = []
+            for status in statuses:
+                try:
+                    super(VianettProvider, self)._receive_status(status)
+                except Exception as e:
+                    failed.append(status)
+                    error = e
+                else:
+                    delivered.append(status)
+
+        # Delivered: now they're duplicates. `meta` has the request arguments
+        if self.dedup is not None:
+            for status in delivered:
+                self.dedup.remember('status', status.meta)
+
+        if failed:
+            raise PartialBatchError(failed, error)
+
     # region Public
 
     def api_request(self, method, **params):
         """ Raw request to Vianett API
 
-            :rtype: str
+            :rtype: smsframework_vianett.ack.Ack
             :raises RequestError: Request error
             :raises ConnectionError: Connection error
             :raises MessageSendError: HTTP error
@@ -75,13 +474,29 @@ class VianettProvider(IProvider):
         """
         try:
             return self.api.api_request(method, **params)
-        except AssertionError as e:
-            raise exc.RequestError(str(e))
-        except HTTPError as e:
-            raise exc.MessageSendError(str(e))
-        except URLError as e:
-            raise exc.ConnectionError(str(e))
-        except VianettApiError as e:
-            raise error.VianettProviderError(e.code, str(e))
+        except (AssertionError, URLError, VianettApiError) as e:
+            raise translate_error(e)
+
+    def close(self):
+        """ Release resources: stop the spool, the scheduler and the workers, close persistent connections, drain the ingest queue and the status batcher, write the event log """
+        if self.spool is not None:
+            self.spool.close()
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.workers is not None:
+            self.workers.close()
+        if self.ingest is not None:
+            self.ingest.close()
+        if self.status_batcher is not None:
+            self.status_batcher.close()
+        self.api.close()
+        if self._async_api is not None:
+            self._async_api.close()
+        if self.correlator is not None:
+            self.correlator.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.events is not None:
+            self.events.close()
 
     #endregion
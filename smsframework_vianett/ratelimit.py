@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from time import sleep
+from contextlib import contextmanager
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+from . import const
+
+
+class TokenBucket(object):
+    """ Token bucket: `rate` tokens per second, up to `burst` tokens saved up
+
+        Tokens can be reserved in advance: the bucket goes into debt,
+        and the caller is told how long to wait before its token is due.
+        Not thread-safe: :class:`RateLimiter` locks it.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst=None):
+        """ Create a full bucket
+
+            :type rate: float
+            :param rate: Tokens per second
+            :type burst: float | None
+            :param burst: Bucket capacity. Default: `rate`, i.e., one second worth of tokens
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.updated = monotonic()
+
+    def reserve(self, rate):
+        """ Take a token, possibly from the future
+
+            :type rate: float
+            :param rate: Current refill rate, tokens per second
+            :rtype: float
+            :returns: Time to wait until the token is due, seconds
+        """
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / rate if self.tokens < 0 else 0.0
+
+
+class RateLimiter(object):
+    """ Client-side rate limiter for outgoing messages
+
+        Paces requests with a token bucket, optionally a separate bucket for every :class:`const.Priority`.
+        The limiter adapts to the SMSC: every throttling error cuts the rate by `backoff`,
+        and every successful request restores it by `recovery`, up to the configured rate.
+
+        Thread-safe: share one instance between all threads (and :class:`AsyncVianettHttpApi`).
+    """
+
+    def __init__(self, rate, burst=None, priorities=None, throttle_codes=('429', '503'),
+                 backoff=0.5, recovery=0.02, min_factor=0.05):
+        """ Configure the limiter
+
+            :type rate: float
+            :param rate: Messages per second
+            :type burst: float | None
+            :param burst: The number of messages that can be sent at once after a period of inactivity. Default: `rate`
+            :type priorities: dict | None
+            :param priorities: Separate limits for priorities: { const.Priority: rate | (rate, burst) }.
+                Priorities not listed here share the default limit.
+            :type throttle_codes: collections.Iterable
+            :param throttle_codes: Vianett `errorcode`s and HTTP status codes that mean "slow down"
+            :type backoff: float
+            :param backoff: Multiply the rate by this on every throttling error
+            :type recovery: float
+            :param recovery: Increase the rate by this fraction on every success
+            :type min_factor: float
+            :param min_factor: The rate never goes below this fraction of the configured rate
+        """
+        self.throttle_codes = frozenset(str(c) for c in throttle_codes)
+        self.backoff = backoff
+        self.recovery = recovery
+        self.min_factor = min_factor
+
+        #: Buckets: { priority: bucket }, `None` is the default
+        self._buckets = {None: TokenBucket(rate, burst)}
+        for priority, limit in (priorities or {}).items():
+            self._buckets[priority] = TokenBucket(*limit) if isinstance(limit, (tuple, list)) else TokenBucket(limit)
+
+        #: Adaptive factor for the configured rates
+        self._factor = 1.0
+
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+        #: The number of throttling errors seen
+        self.throttled = 0
+
+    @property
+    def rate(self):
+        """ Current rate of the default limit, messages per second
+
+            :rtype: float
+        """
+        return self._buckets[None].rate * self._factor
+
+    @property
+    def queue_depth(self):
+        """ The number of requests currently waiting for their turn
+
+            :rtype: int
+        """
+        return self._waiting
+
+    def _bucket(self, priority):
+        """ Get the bucket for a `Priority` request parameter """
+        if priority is not None:
+            priority = const.Priority.HIGH if int(priority) > 0 else const.Priority.NORMAL
+        return self._buckets.get(priority, self._buckets[None])
+
+    def reserve(self, priority=None):
+        """ Reserve a slot for a request
+
+            :param priority: `Priority` request parameter
+            :rtype: float
+            :returns: Time to wait before making the request, seconds
+        """
+        with self._lock:
+            bucket = self._bucket(priority)
+            return bucket.reserve(bucket.rate * self._factor)
+
+    def acquire(self, priority=None):
+        """ Wait for a slot for a request
+
+            :param priority: `Priority` request parameter
+        """
+        delay = self.reserve(priority)
+        if delay > 0:
+            with self.queued():
+                sleep(delay)
+
+    @contextmanager
+    def queued(self):
+        """ Context manager: count a request as waiting in the queue, for :attr:`queue_depth`
+
+            For callers that wait for the delay from :meth:`reserve` themselves: e.g., with `asyncio.sleep()`
+        """
+        with self._lock:
+            self._waiting += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def report(self, code=None):
+        """ Report the result of a request
+
+            :type code: str | int | None
+            :param code: Error code: Vianett `errorcode`, or HTTP status code. `None` for success
+        """
+        with self._lock:
+            if code is None:
+                self._factor = min(1.0, self._factor * (1 + self.recovery))
+            elif str(code) in self.throttle_codes:
+                self.throttled += 1
+                self._factor = max(self.min_factor, self._factor * self.backoff)
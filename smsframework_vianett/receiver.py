@@ -1,15 +1,38 @@
-from datetime import datetime, timedelta
+from functools import wraps
 
-from flask import Blueprint
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+from flask import Blueprint, Response, abort
 from flask.globals import request, g
 
-from smsframework.data import IncomingMessage
-from smsframework.data import MessageAccepted, MessageDelivered, MessageExpired, MessageError
+from . import callbacks
 
 bp = Blueprint('smsframework-vianett', __name__, url_prefix='/')
 
 
+def _measured(route):
+    """ Record receiver metrics for a route, if enabled """
+    def decorator(f):
+        @wraps(f)
+        def wrapper():
+            metrics = g.provider.metrics
+            if metrics is None:
+                return f()
+            t0 = monotonic()
+            try:
+                return f()
+            finally:
+                metrics.received_total.inc(route)
+                metrics.receive_seconds.observe(monotonic() - t0)
+        return wrapper
+    return decorator
+
+
 @bp.route('/im')
+@_measured('im')
 def im():
     """ Incoming message handler
 
@@ -25,41 +48,11 @@ def im():
         * password: Optional password.
         * replypathid: Only used for two-way dialogue, default 0.
     """
-    req = request.args.to_dict()
-
-    # Check
-    for n in ('sourceaddr', 'message', 'refno', 'destinationaddr', 'prefix', 'retrycount', 'operator', 'replypathid'):
-        assert n in req, 'Vianett message with missing "{}" field: {}'.format(n, req)
-
-    # Prefixes
-    if not g.provider.use_prefix:
-        req['message'] = ' '.join(filter(lambda x: x, (req['prefix'], req['message'])))
-        req['prefix'] = ''
-
-    # IncomingMessage
-    message = IncomingMessage(
-        src=req['sourceaddr'],
-        body=req['message'],
-        msgid=req['refno'],
-        dst=req['destinationaddr'],
-        rtime=datetime.utcnow(),
-        meta = {
-            'prefix': req['prefix'],
-            'retrycount': req['retrycount'],
-            'operator': req['operator'],
-            'replypathid': req['replypathid']
-        }
-    )
-
-    # Process it
-    " :type: smsframework.IProvider.IProvider "
-    g.provider._receive_message(message)  # any exceptions will respond with 500, and Vianett will happily retry later
-
-    # Ack
-    return '<ack refno="{msgid}" errorcode="0" />'.format(msgid=message.msgid)
+    return _handle('im')
 
 
 @bp.route('/status')
+@_measured('status')
 def status():
     """ Incoming status report
 
@@ -84,55 +77,39 @@ def status():
 
             'notificationstatus': Sent to phone
                 * Status:
-                    'ACCEPTD' or 'BUFFERD' -- queued
+                    'ENROUTE', 'ACCEPTD' or 'BUFFERD' -- queued
                     'DELIVRD' -- delivered to the terminal
+                    'EXPIRED' -- expired
+                    'UNDELIV', 'REJECTD', 'DELETED' -- failed
+                    See :data:`smsframework_vianett.decode.NOTIFICATION_STATUSES`
                 * StatusDescription: Description of the 'Status' field (not always provided)
                 * StatusCode: Code representing the status of the message
     """
-    req = request.args.to_dict()
+    return _handle('status')
+
 
-    def _check_fields(*fields):
-        for n in fields:
-            assert n in req, 'Vianett status with missing "{}" field: {}'.format(n, req)
-
-    _check_fields('requesttype')
-    if req['requesttype'] == 'notificationstatus':
-        _check_fields('Status', 'StatusDescription', 'StatusCode')
-
-        # Create status
-        status = {
-            'DELIVRD': MessageDelivered,
-            'ACCEPTD': MessageAccepted,
-            'BUFFERD': MessageAccepted
-        }[req['Status']](req['refno'], meta=req)
-        status.status_code = req['StatusCode']
-        status.status = '{0[Status]}: {0[StatusDescription]}'.format(req)
-    elif req['requesttype'] == 'mtstatus':
-        if 'ErrorCode' in req:
-            _check_fields('ErrorCode', 'ErrorDescription', 'Status', 'Msg')
-
-            # Create status
-            status = {
-                True: MessageDelivered,
-                False: MessageError
-            }[req['ErrorCode'] == '200'](req['refno'], meta=req)
-            status.status_code = req['ErrorCode']
-            status.status = '{0[ErrorDescription]}: {0[Status]}: {0[Msg]}'.format(req)
-        else:
-            _check_fields('errorcode')
-
-            # Simple
-            status = {
-                True: MessageDelivered,
-                False: MessageError
-            }[req['errorcode'] == '0'](req['refno'], meta=req)
-            status.status_code = req['errorcode']
-            status.status = '{} and {}'.format(req['errorcode'], req['msgok'] if 'msgok' in req else '?')
-    else:
-        raise AssertionError('Vianett status with an unsupported `requesttype`: {}'.format(req))
+@bp.route('/metrics')
+def metrics():
+    """ Provider metrics in Prometheus text format, if enabled """
+    if g.provider.metrics is None:
+        abort(404)
+    return Response(g.provider.metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def _handle(kind):
+    """ Handle a callback: see :mod:`smsframework_vianett.callbacks` """
+    provider = g.provider
+    " :type: smsframework_vianett.provider.VianettProvider "
+    req = request.args.to_dict()
+    obj = callbacks.decode(provider, kind, req)
 
     # Process it
-    g.provider._receive_status(status)  # exception respond with http 500
+    action = callbacks.accept(provider, kind, req, obj)
+    if action == callbacks.REJECTED:
+        return callbacks.OVERLOADED
+    if action == callbacks.PROCESS:
+        callbacks.process(provider, kind, obj)  # any exceptions will respond with 500, and Vianett will happily retry later
+    callbacks.processed(provider, kind, req)
 
     # Ack
-    return '<?xml version="1.0"?><ack refno="1234" errorcode="0" />'
+    return callbacks.ack(kind, obj)
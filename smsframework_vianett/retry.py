@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+from time import sleep
+
+try: # Py3
+    from time import monotonic
+    from urllib.request import URLError, HTTPError
+except ImportError: # Py2
+    from time import time as monotonic
+    from urllib2 import URLError, HTTPError
+
+from .api import VianettApiError
+from .breaker import CircuitOpenError
+
+
+class RetryBudget(object):
+    """ Retry budget: limits retries to a fraction of requests
+
+        Every request earns `ratio` of a retry, and every retry spends one.
+        In addition, `min_per_second` retries are always allowed, so that low-traffic clients can retry too.
+        When the budget is spent, failures are not retried: this prevents retry storms during outages.
+
+        Thread-safe.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, max_balance=100.0):
+        """ Configure the budget
+
+            :type ratio: float
+            :param ratio: Retries allowed per request
+            :type min_per_second: float
+            :param min_per_second: Retries allowed per second regardless of the traffic
+            :type max_balance: float
+            :param max_balance: Max number of retries that can be saved up
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+
+        self._balance = 0.0
+        self._reserve = min_per_second
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """ Record a request """
+        with self._lock:
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def withdraw(self):
+        """ Try to spend a retry
+
+            :rtype: bool
+            :returns: Is the retry allowed?
+        """
+        with self._lock:
+            now = monotonic()
+            self._reserve = min(self.min_per_second, self._reserve + (now - self._updated) * self.min_per_second)
+            self._updated = now
+
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            if self._reserve >= 1:
+                self._reserve -= 1
+                return True
+            return False
+
+
+#: Retry budget shared by all policies in this process
+default_budget = RetryBudget()
+
+#: Vianett `errorcode`s retried by default.
+#: Vianett's codes follow HTTP ('200' is ok): these are the ones for a temporary problem on their side,
+#: rate limiting and server errors. Anything else, e.g. an invalid number or no credit, is permanent
+TRANSIENT_CODES = frozenset(('429', '500', '502', '503', '504'))
+
+
+class RetryPolicy(object):
+    """ Retry policy for failed requests: exponential backoff with full jitter
+
+        Retries connection failures, HTTP 5xx and 429 errors, and Vianett errors with codes from `retry_codes`.
+        Invalid responses and other Vianett errors are not retried.
+        By default, only the conservative :data:`TRANSIENT_CODES` are retried:
+        add the codes you see to be transient, or pass `retry_codes=()` to retry no Vianett errors.
+
+        :meth:`VianettHttpApi.sendmsg` keeps the same `msgid` across attempts, so resends are idempotent.
+    """
+
+    def __init__(self, attempts=3, base_delay=0.2, max_delay=10.0, retry_codes=TRANSIENT_CODES, budget=None, on_retry=None):
+        """ Configure the policy
+
+            :type attempts: int
+            :param attempts: Max number of attempts, including the first one
+            :type base_delay: float
+            :param base_delay: Backoff delay before the first retry, seconds. Doubles with every attempt.
+            :type max_delay: float
+            :param max_delay: Max backoff delay, seconds
+            :type retry_codes: collections.Iterable
+            :param retry_codes: Vianett `errorcode`s that are safe to retry. Default: :data:`TRANSIENT_CODES`
+            :type budget: RetryBudget | None
+            :param budget: Retry budget. Default: :data:`default_budget`, shared by the whole process
+            :type on_retry: callable | None
+            :param on_retry: Callback invoked before every retry: on_retry(attempt, delay, error)
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = frozenset(str(c) for c in retry_codes)
+        self.budget = budget or default_budget
+        self.on_retry = on_retry
+
+        #: Statistics: the number of retries made
+        self.retries = 0
+        #: Statistics: the total backoff delay, seconds
+        self.delay_total = 0.0
+        #: Statistics: the number of requests that failed after all attempts
+        self.exhausted = 0
+        #: Statistics: the number of retries denied by the budget
+        self.denied = 0
+
+    def retryable(self, e):
+        """ Can the request be retried after this error?
+
+            :type e: Exception
+            :rtype: bool
+        """
+        if isinstance(e, HTTPError):
+            return e.code >= 500 or e.code == 429
+        if isinstance(e, CircuitOpenError):
+            return False  # fail fast
+        if isinstance(e, URLError):
+            return True
+        if isinstance(e, VianettApiError):
+            return str(e.code) in self.retry_codes
+        return False
+
+    def next_delay(self, attempt, e):
+        """ Decide whether to retry a failed attempt
+
+            :type attempt: int
+            :param attempt: The failed attempt number, starting with 1
+            :type e: Exception
+            :param e: The error
+            :rtype: float | None
+            :returns: Backoff delay before the next attempt, seconds, or `None` to give up
+        """
+        if not self.retryable(e):
+            return None
+        if attempt >= self.attempts:
+            self.exhausted += 1
+            return None
+        if not self.budget.withdraw():
+            self.denied += 1
+            return None
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        self.retries += 1
+        self.delay_total += delay
+        if self.on_retry is not None:
+            self.on_retry(attempt, delay, e)
+        return delay
+
+    def call(self, f, *args, **kwargs):
+        """ Call a function, retrying it on failures
+
+            :rtype: *
+            :returns: The function's result
+            :raises Exception: The last error
+        """
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                return f(*args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(attempt, e)
+                if delay is None:
+                    raise
+            sleep(delay)
+            attempt += 1
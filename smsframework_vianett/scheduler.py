@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+try: # Py3
+    from time import monotonic
+except ImportError: # Py2
+    from time import time as monotonic
+
+from . import const
+
+logger = logging.getLogger(__name__)
+
+
+#: Lane names by priority, for metrics: { const.Priority value: 'name' }
+LANE_NAMES = dict((v, k.lower()) for k, v in vars(const.Priority).items() if not k.startswith('_'))
+
+
+class _Job(object):
+    """ A queued request, and the futures of everyone waiting for it """
+
+    __slots__ = ('dst', 'body', 'params', 'lane', 'key', 'queued', 'futures')
+
+    def __init__(self, dst, body, params, lane, key):
+        self.dst = dst
+        self.body = body
+        self.params = params
+        self.lane = lane
+        #: Coalescing key, if coalescing
+        self.key = key
+        #: Monotonic time the job was queued
+        self.queued = monotonic()
+        self.futures = []
+
+
+class _Lane(object):
+    """ Jobs of one priority, round-robin between destinations """
+
+    __slots__ = ('priority', 'name', 'destinations', 'size')
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.name = LANE_NAMES.get(priority, str(priority))
+        #: dst -> deque of jobs; the first destination is the next one to go
+        self.destinations = OrderedDict()
+        #: The number of queued jobs
+        self.size = 0
+
+    def put(self, job):
+        jobs = self.destinations.get(job.dst)
+        if jobs is None:
+            jobs = self.destinations[job.dst] = deque()
+        jobs.append(job)
+        self.size += 1
+
+    def pop(self):
+        """ Take the oldest job of the next destination, and put the destination at the end of the line """
+        dst, jobs = self.destinations.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            self.destinations[dst] = jobs
+        self.size -= 1
+        return job
+
+
+class Scheduler(object):
+    """ Priority queue in front of the API client
+
+        * Lanes: a job with a higher `Priority` request parameter (see :class:`const.Priority`) always goes first.
+          Under saturation, normal traffic waits, and urgent messages (e.g., OTPs) don't.
+        * Fairness: within a lane, destinations take turns, so one busy destination can't hold up the others.
+        * Coalescing: an identical message to the same destination that is still queued is not sent twice:
+          both callers get the result of the one request.
+
+        A pool of worker threads sends the jobs. Thread-safe.
+    """
+
+    def __init__(self, send, concurrency=4, coalesce=False, metrics=None):
+        """ Create the scheduler and start the workers
+
+            :type send: callable
+            :param send: Function that sends a message: send(dst, body, params) -> refno.
+                E.g., :meth:`VianettHttpApi.sendmsg`
+            :type concurrency: int
+            :param concurrency: The number of messages to send in parallel
+            :type coalesce: bool
+            :param coalesce: Send identical queued messages only once? A message is identical
+                when it has the same destination, body and parameters, except `msgid`
+            :type metrics: smsframework_vianett.metrics.Metrics | None
+            :param metrics: Record queue latency per lane: `queue_seconds`
+        """
+        self.send = send
+        self.coalesce = coalesce
+        self.metrics = metrics
+
+        #: Lanes, the highest priority first
+        self._lanes = []
+        #: priority -> lane
+        self._lanes_by_priority = {}
+        #: Coalescing index: key -> queued job
+        self._pending = {}
+
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        #: Statistics: messages coalesced into a queued one
+        self.coalesced = 0
+
+        self._workers = [threading.Thread(target=self._worker, name='vianett-scheduler-{}'.format(i))
+                         for i in range(concurrency)]
+        for t in self._workers:
+            t.daemon = True
+            t.start()
+
+    @property
+    def depth(self):
+        """ The number of queued messages by lane
+
+            :rtype: dict
+            :returns: { lane name: count }
+        """
+        with self._cond:
+            return dict((lane.name, lane.size) for lane in self._lanes)
+
+    def _lane(self, priority):
+        """ Get the lane for a priority, creating it if necessary """
+        lane = self._lanes_by_priority.get(priority)
+        if lane is None:
+            lane = self._lanes_by_priority[priority] = _Lane(priority)
+            self._lanes.append(lane)
+            self._lanes.sort(key=lambda l: l.priority, reverse=True)
+        return lane
+
+    @staticmethod
+    def _key(dst, body, params):
+        """ Coalescing key of a message, or `None` if it can't have one """
+        try:
+            return dst, body, tuple(sorted((k, v) for k, v in params.items() if k != 'msgid'))
+        except TypeError:
+            return None  # unhashable or unorderable parameters
+
+    def submit(self, dst, body, params):
+        """ Queue a message
+
+            A coalesced message takes the `msgid` of the queued one: `params['msgid']` is updated.
+
+            :param dst: Destination number
+            :param body: Message text
+            :type params: dict
+            :param params: Request parameters. The `Priority` parameter selects the lane
+            :rtype: concurrent.futures.Future
+            :returns: Future that gets the result of `send()`: the refno, or the exception
+            :raises RuntimeError: The scheduler is closed
+        """
+        future = Future()
+        priority = int(params.get('Priority', const.Priority.NORMAL))
+        key = self._key(dst, body, params) if self.coalesce else None
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('The scheduler is closed')
+
+            # Coalesce
+            job = self._pending.get(key) if key is not None else None
+            if job is not None:
+                self.coalesced += 1
+                if 'msgid' in job.params:
+                    params['msgid'] = job.params['msgid']
+                job.futures.append(future)
+                return future
+
+            # Queue
+            job = _Job(dst, body, params, self._lane(priority), key)
+            job.futures.append(future)
+            job.lane.put(job)
+            if key is not None:
+                self._pending[key] = job
+            self._size += 1
+            self._cond.notify()
+        return future
+
+    def _take(self):
+        """ Wait for a job, and take it from the highest-priority lane
+
+            :rtype: _Job | None
+            :returns: The job, or `None` when closed and empty
+        """
+        with self._cond:
+            while not self._size:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            for lane in self._lanes:
+                if lane.size:
+                    job = lane.pop()
+                    break
+            self._size -= 1
+            if job.key is not None:
+                del self._pending[job.key]
+            return job
+
+    def _worker(self):
+        """ Worker thread: send jobs """
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            if self.metrics is not None:
+                self.metrics.queue_seconds.observe(job.lane.name, monotonic() - job.queued)
+
+            futures = [f for f in job.futures if f.set_running_or_notify_cancel()]
+            if not futures:
+                continue  # everyone has cancelled
+            try:
+                result = self.send(job.dst, job.body, **job.params)
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+            else:
+                for f in futures:
+                    f.set_result(result)
+
+    def close(self, timeout=None):
+        """ Stop accepting messages, send the queued ones, and stop the workers
+
+            :type timeout: float | None
+            :param timeout: Max time to wait for every worker, seconds
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._workers:
+            t.join(timeout)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+import logging
+import threading
+from time import time
+
+try: # Py3
+    from urllib.request import URLError, HTTPError
+except ImportError: # Py2
+    from urllib2 import URLError, HTTPError
+
+logger = logging.getLogger(__name__)
+
+
+class Spool(object):
+    """ Durable outbound spool: an SQLite journal of messages to send
+
+        :meth:`enqueue` writes a message to the journal, and returns once it's on disk.
+        Concurrent writes are grouped into a single transaction (group commit), so many writers cost one fsync.
+        A background sender submits pending messages, and marks them with the returned `refno`, or an error.
+
+        Every message gets its `msgid` when it's journaled, so a message that was submitted right before a crash
+        is resubmitted with the same `msgid` on restart. The spool resumes with the first pending message.
+
+        Connection failures and server errors (HTTP 5xx, 429) are retried until they succeed;
+        other errors mark the message as failed.
+    """
+
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+    def __init__(self, provider, path, batch_size=100, concurrency=4, synchronous='FULL', retry_delay=5.0,
+                 on_result=None):
+        """ Open the spool, and start the sender
+
+            :type provider: smsframework_vianett.provider.VianettProvider
+            :param provider: The provider to send messages with
+            :type path: str
+            :param path: Path to the SQLite database
+            :type batch_size: int
+            :param batch_size: Max number of messages in a transaction: both for writing, and for sending
+            :type concurrency: int
+            :param concurrency: The number of messages to submit in parallel
+            :type synchronous: str
+            :param synchronous: SQLite synchronous mode: 'FULL' survives an OS crash, 'NORMAL' only a process crash
+            :type retry_delay: float
+            :param retry_delay: Delay before retrying messages after a connection failure, seconds
+            :type on_result: callable | None
+            :param on_result: Callback for processed messages: on_result(id, msgid, refno, error)
+        """
+        self.provider = provider
+        self.path = path
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.synchronous = synchronous
+        self.retry_delay = retry_delay
+        self.on_result = on_result
+
+        # Schema
+        db = self._connect()
+        db.execute('''CREATE TABLE IF NOT EXISTS spool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            msgid TEXT NOT NULL,
+            dst TEXT NOT NULL,
+            body TEXT NOT NULL,
+            params TEXT NOT NULL,
+            state INTEGER NOT NULL DEFAULT 0,
+            refno TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            processed REAL
+        )''')
+        db.execute('CREATE INDEX IF NOT EXISTS spool_pending ON spool (state, id)')
+        db.commit()
+        db.close()
+
+        self._closed = False
+
+        # Writer: group commit
+        self._writes = []  # [(rows, event, result)]
+        self._write_cond = threading.Condition()
+
+        # Sender
+        self._send_cond = threading.Condition()
+
+        self._threads = [
+            threading.Thread(target=self._writer, name='vianett-spool-writer'),
+            threading.Thread(target=self._sender, name='vianett-spool-sender'),
+        ]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def _connect(self):
+        """ Open a database connection for the current thread """
+        db = sqlite3.connect(self.path)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous={}'.format(self.synchronous))
+        return db
+
+    #region Writing
+
+    def enqueue(self, message):
+        """ Journal a message for sending
+
+            :type message: smsframework.data.OutgoingMessage.OutgoingMessage
+            :rtype: int
+            :returns: Spool id of the message
+        """
+        return self.enqueue_many([message])[0]
+
+    def enqueue_many(self, messages):
+        """ Journal many messages for sending, in one transaction
+
+            :type messages: collections.Iterable
+            :rtype: list[int]
+            :returns: Spool ids of the messages
+        """
+        now = time()
+        rows = []
+        for message in messages:
+            params = self.provider._message_params(message)
+            msgid = params.pop('msgid', None) or self.provider.api.new_msgid()
+            rows.append((msgid, message.dst, message.body, json.dumps(params), now))
+        if not rows:
+            return []
+
+        # Wait for the group commit
+        write = (rows, threading.Event(), [])
+        with self._write_cond:
+            assert not self._closed, 'Spool is closed'
+            self._writes.append(write)
+            self._write_cond.notify()
+        write[1].wait()
+
+        result = write[2]
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result
+
+    def _writer(self):
+        """ Thread: write journal records, many writers in one transaction """
+        db = self._connect()
+        while True:
+            with self._write_cond:
+                while not self._writes and not self._closed:
+                    self._write_cond.wait()
+                if not self._writes:
+                    break
+                writes, self._writes = self._writes, []
+
+            try:
+                with db:
+                    for rows, event, result in writes:
+                        for row in rows:
+                            result.append(db.execute(
+                                'INSERT INTO spool (msgid, dst, body, params, created) VALUES (?, ?, ?, ?, ?)', row
+                            ).lastrowid)
+            except Exception as e:
+                for rows, event, result in writes:
+                    result[:] = [e]
+            for rows, event, result in writes:
+                event.set()
+
+            # Wake up the sender
+            with self._send_cond:
+                self._send_cond.notify()
+        db.close()
+
+    #endregion
+
+    #region Sending
+
+    def _sender(self):
+        """ Thread: submit pending messages """
+        db = self._connect()
+        while not self._closed:
+            rows = db.execute('SELECT id, msgid, dst, body, params FROM spool WHERE state=? ORDER BY id LIMIT ?',
+                              (self.PENDING, self.batch_size)).fetchall()
+
+            # Nothing to do: wait
+            if not rows:
+                with self._send_cond:
+                    if self._closed:
+                        break
+                    self._send_cond.wait(1.0)
+                continue
+
+            # Submit
+            records = []
+            for id, msgid, dst, body, params in rows:
+                params = json.loads(params)
+                params['msgid'] = msgid
+                records.append((dst, body, params))
+            results = self.provider.api.sendmsg_many(records, concurrency=self.concurrency, ordered=False)
+
+            # Results
+            now = time()
+            updates, outage = [], False
+            for index, result in results:
+                id = rows[index][0]
+                if self._outage(result):
+                    outage = True  # keep it pending
+                    continue
+                if isinstance(result, Exception):
+                    error = str(self.provider_error(result))
+                    updates.append((self.FAILED, None, error, now, id))
+                else:
+                    updates.append((self.SENT, result, None, now, id))
+                    if self.provider.correlator is not None:
+                        self.provider.correlator.sent(rows[index][1], result, rows[index][2], sent=now)
+            with db:
+                db.executemany('UPDATE spool SET state=?, refno=?, error=?, processed=? WHERE id=?', updates)
+
+            # Report
+            if self.on_result is not None:
+                msgids = dict((row[0], row[1]) for row in rows)
+                for state, refno, error, processed, id in updates:
+                    try:
+                        self.on_result(id, msgids[id], refno, error)
+                    except Exception:
+                        logger.exception('Spool on_result callback failed')
+
+            # Outage: wait before retrying
+            if outage:
+                with self._send_cond:
+                    if self._closed:
+                        break
+                    self._send_cond.wait(self.retry_delay)
+        db.close()
+
+    @staticmethod
+    def _outage(result):
+        """ Is the result a temporary failure, which keeps the message pending? """
+        if isinstance(result, HTTPError):
+            return result.code >= 500 or result.code == 429
+        return isinstance(result, URLError)
+
+    @staticmethod
+    def provider_error(e):
+        """ Translate an API error, like the provider does """
+        from .provider import translate_error
+        return translate_error(e)
+
+    #endregion
+
+    def status(self, id):
+        """ Get the state of a spooled message
+
+            :type id: int
+            :param id: Spool id
+            :rtype: dict | None
+            :returns: { msgid, state, refno, error }, or `None` if not found
+        """
+        db = self._connect()
+        try:
+            row = db.execute('SELECT msgid, state, refno, error FROM spool WHERE id=?', (id,)).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        return dict(zip(('msgid', 'state', 'refno', 'error'), row))
+
+    def pending(self):
+        """ Count pending messages
+
+            :rtype: int
+        """
+        db = self._connect()
+        try:
+            return db.execute('SELECT COUNT(*) FROM spool WHERE state=?', (self.PENDING,)).fetchone()[0]
+        finally:
+            db.close()
+
+    def close(self, timeout=None):
+        """ Stop the spool
+
+            Pending messages stay in the journal, and are sent after a restart.
+        """
+        with self._write_cond:
+            self._closed = True
+            self._write_cond.notify()
+        with self._send_cond:
+            self._send_cond.notify()
+        for t in self._threads:
+            t.join(timeout)
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import multiprocessing
+from itertools import count
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from multiprocessing.connection import wait
+
+try: # Py3
+    from time import monotonic
+    from urllib.request import URLError, HTTPError
+except ImportError: # Py2
+    from time import time as monotonic
+    from urllib2 import URLError, HTTPError
+
+from smsframework import exc
+
+from . import error, encoding
+from .api import VianettApiError, send_many
+
+logger = logging.getLogger(__name__)
+
+
+#region Records
+
+def _error_record(e):
+    """ Compact, picklable record of an API client exception
+
+        :rtype: (str, str | None, str)
+        :returns: (kind, code, text)
+    """
+    if isinstance(e, AssertionError):
+        return 'request', None, str(e)
+    if isinstance(e, HTTPError):
+        return 'http', str(e.code), str(e)
+    if isinstance(e, URLError):
+        return 'connection', None, str(e)
+    if isinstance(e, VianettApiError):
+        return 'vianett', str(e.code), str(e)
+    return 'error', None, '{}: {}'.format(type(e).__name__, e)
+
+
+def _error_from_record(record):
+    """ Reconstruct the translated exception from an error record
+
+        Same exceptions as :func:`smsframework_vianett.provider.translate_error` gives
+
+        :rtype: Exception
+    """
+    kind, code, text = record
+    if kind == 'request':
+        return exc.RequestError(text)
+    if kind == 'http':
+        return exc.MessageSendError(text)
+    if kind == 'connection':
+        return exc.ConnectionError(text)
+    if kind == 'vianett':
+        return error.VianettProviderError(code, text)
+    return RuntimeError(text)
+
+#endregion
+
+
+#region Worker process
+
+def _make_api(options):
+    """ Create the API client of a worker process
+
+        :type options: dict
+        :param options: `VianettHttpApi` options, plus: `accounts`: [(user, password)], `sharding`, `retry` (options),
+            `numbers` (options)
+    """
+    from .api import VianettHttpApi
+    from .retry import RetryPolicy
+    from .numbers import NumberNormalizer
+    from .accounts import Account, AccountPool
+
+    options = dict(options)
+    accounts = options.pop('accounts')
+    sharding = options.pop('sharding', None) or {}
+    retry = options.pop('retry', None)
+    if retry:
+        options['retry'] = RetryPolicy(**(retry if isinstance(retry, dict) else {}))
+    numbers = options.pop('numbers', None)
+    if numbers is not None:
+        options['numbers'] = NumberNormalizer(**numbers)
+
+    if len(accounts) == 1:
+        return VianettHttpApi(*accounts[0], **options)
+    return AccountPool([Account(user, VianettHttpApi(user, password, **options)) for user, password in accounts],
+                       **sharding)
+
+
+def _worker(options, concurrency, jobs, results):
+    """ Worker process: send jobs from `jobs` with `concurrency` threads, and send the results to `results`
+
+        Jobs: (id, dst, body, params); `None` to stop.
+        Results: (id, refno, None) or (id, None, error record)
+
+        Every worker has its own results pipe: a crashed worker can't leave a shared lock locked.
+    """
+    api = _make_api(options)
+    lock = threading.Lock()
+
+    def send(id, dst, body, params):
+        try:
+            result = (id, api.sendmsg(dst, body, **params), None)
+        except Exception as e:
+            result = (id, None, _error_record(e))
+        with lock:
+            results.send(result)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            executor.submit(send, *job)
+    finally:
+        executor.shutdown(wait=True)
+        api.close()
+
+#endregion
+
+
+class _Job(object):
+    __slots__ = ('id', 'dst', 'body', 'params', 'future', 'worker', 'started')
+
+    def __init__(self, id, dst, body, params):
+        self.id = id
+        self.dst = dst
+        self.body = body
+        self.params = params
+        self.future = Future()
+        #: The worker that has the job, if any
+        self.worker = None
+        #: Monotonic time when the job was submitted
+        self.started = monotonic()
+
+    @property
+    def record(self):
+        """ Compact record for the worker process """
+        return self.id, self.dst, self.body, self.params
+
+
+class _Worker(object):
+    __slots__ = ('process', 'jobs', 'results', 'pending', 'idle_since')
+
+    def __init__(self, process, jobs, results):
+        self.process = process
+        #: Job queue of the process
+        self.jobs = jobs
+        #: Results pipe of the process; `None` once closed
+        self.results = results
+        #: Jobs sent to the process: { id: job }
+        self.pending = {}
+        #: Monotonic time since when the worker has no jobs
+        self.idle_since = monotonic()
+
+
+class ProcessPool(object):
+    """ Sends messages from a pool of worker processes, each with its own API client
+
+        Spreads URL-encoding, response parsing and error handling over all CPU cores.
+        Messages go to the workers as compact records over pipes, and the results stream back
+        to a collector thread that resolves the futures.
+        Requires Python 3.
+
+        * Autoscaling: starts with `min_processes`. When every worker has `concurrency` messages in progress,
+          another one is started, up to `processes`. Workers idle for `idle_timeout` seconds are stopped.
+        * Crashed workers are replaced, and their messages are sent again (with the same `msgid`).
+        * The rate limiter, if any, works in this process: the limit is global. So does the event log.
+
+        Has the same sending methods as :class:`smsframework_vianett.api.VianettHttpApi`,
+        but failed messages raise translated exceptions: see :func:`smsframework_vianett.provider.translate_error`.
+    """
+
+    def __init__(self, options, processes=None, min_processes=1, concurrency=8, idle_timeout=30.0, limiter=None,
+                 start_method=None, events=None):
+        """ Create the pool, and start `min_processes` workers
+
+            :type options: dict
+            :param options: API client options for the workers: `VianettHttpApi` options (picklable),
+                plus `accounts`: [(user, password)], `sharding` (options), `retry` (options), `numbers` (options)
+            :type processes: int | None
+            :param processes: Max number of worker processes. Default: the number of CPUs
+            :type min_processes: int
+            :param min_processes: The number of worker processes to keep running
+            :type concurrency: int
+            :param concurrency: The number of messages a worker sends in parallel
+            :type idle_timeout: float
+            :param idle_timeout: Stop workers idle for this many seconds, down to `min_processes`
+            :type limiter: smsframework_vianett.ratelimit.RateLimiter | None
+            :param limiter: Rate limiter for all workers
+            :type start_method: str | None
+            :param start_method: multiprocessing start method: 'fork', 'spawn', 'forkserver'. Default: the platform's default
+            :type events: smsframework_vianett.eventlog.EventLog | None
+            :param events: Log sent messages
+        """
+        self.options = options
+        self.processes = processes or multiprocessing.cpu_count()
+        self.min_processes = max(1, min(min_processes, self.processes))
+        self.concurrency = concurrency
+        self.idle_timeout = idle_timeout
+        self.limiter = limiter
+        self.events = events
+        self._mp = multiprocessing.get_context(start_method) if start_method else multiprocessing
+
+        self._ids = count(1)
+        self._workers = []
+        self._stopping = []  # stopped workers, until they exit
+        self._backlog = deque()  # jobs waiting for a worker
+        self._jobs = {}  # id -> job, until resolved
+        self._cond = threading.Condition()
+        self._closed = False
+
+        #: Statistics: workers replaced after a crash
+        self.restarts = 0
+
+        with self._cond:
+            for i in range(self.min_processes):
+                self._start_worker()
+        self._collector = threading.Thread(target=self._collect, name='vianett-workers')
+        self._collector.daemon = True
+        self._collector.start()
+
+    @property
+    def size(self):
+        """ The number of running worker processes
+
+            :rtype: int
+        """
+        with self._cond:
+            return len(self._workers)
+
+    #region Workers
+
+    def _start_worker(self):
+        """ Start a worker process. Called with the lock held
+
+            :rtype: _Worker
+        """
+        jobs = self._mp.Queue()
+        results, results_writer = self._mp.Pipe(duplex=False)
+        process = self._mp.Process(target=_worker, args=(self.options, self.concurrency, jobs, results_writer),
+                                   name='vianett-worker')
+        process.daemon = True
+        process.start()
+        results_writer.close()
+        worker = _Worker(process, jobs, results)
+        self._workers.append(worker)
+        return worker
+
+    def _stop_worker(self, worker):
+        """ Stop an idle worker. Called with the lock held """
+        self._workers.remove(worker)
+        self._stopping.append(worker)
+        worker.jobs.put(None)
+
+    def _dispatch(self, job):
+        """ Send a job to the least busy worker, starting a new one if all are busy, or put it into the backlog.
+            Called with the lock held
+        """
+        worker = min(self._workers, key=lambda w: len(w.pending)) if self._workers else None
+        if worker is None or len(worker.pending) >= self.concurrency:
+            if len(self._workers) < self.processes:
+                worker = self._start_worker()
+            elif len(worker.pending) >= 2 * self.concurrency:
+                self._backlog.append(job)
+                return
+        job.worker = worker
+        worker.pending[job.id] = job
+        worker.jobs.put(job.record)
+
+    def _maintain(self):
+        """ Replace crashed workers, and stop idle ones. Called with the lock held
+
+            :rtype: list
+            :returns: Resolved jobs: [(job, refno, error record)]
+        """
+        resolved = []
+        for worker in list(self._workers):
+            if worker.process.exitcode is None:
+                continue
+            logger.error('Vianett worker process died with exit code {}, restarting'.format(worker.process.exitcode))
+            self._workers.remove(worker)
+            self.restarts += 1
+            resolved.extend(self._receive(worker))  # sent before the crash
+            if len(self._workers) < self.min_processes:
+                self._start_worker()
+            for job in list(worker.pending.values()):
+                self._dispatch(job)  # again, with the same msgid
+
+        for worker in list(self._stopping):
+            if worker.process.exitcode is not None:  # reaps it
+                self._stopping.remove(worker)
+                worker.results.close()
+
+        now = monotonic()
+        for worker in list(self._workers):
+            if len(self._workers) <= self.min_processes:
+                break
+            if not worker.pending and now - worker.idle_since > self.idle_timeout:
+                self._stop_worker(worker)
+        return resolved
+
+    def _receive(self, worker):
+        """ Receive the available results of a worker. Called with the lock held
+
+            :rtype: list
+            :returns: Resolved jobs: [(job, refno, error record)]
+        """
+        resolved = []
+        try:
+            while worker.results is not None and worker.results.poll():
+                id, refno, err = worker.results.recv()
+                job = self._jobs.pop(id, None)
+                if job is None:
+                    continue  # sent twice: a worker died after sending it
+                job.worker.pending.pop(id, None)
+                resolved.append((job, refno, err))
+        except (EOFError, OSError):
+            worker.results.close()
+            worker.results = None  # the process has exited
+
+        if not worker.pending:
+            worker.idle_since = monotonic()
+        for w in self._workers:
+            while self._backlog and len(w.pending) < 2 * self.concurrency:
+                self._dispatch(self._backlog.popleft())
+        if not self._jobs:
+            self._cond.notify_all()
+        return resolved
+
+    def _resolve(self, resolved):
+        """ Resolve the futures of jobs, and report to the rate limiter
+
+            :type resolved: list
+            :param resolved: [(job, refno, error record)]
+        """
+        for job, refno, err in resolved:
+            e = None if err is None else _error_from_record(err)
+            if self.events is not None:
+                self.events.sent(job.params['msgid'], refno, encoding.plan(job.body).segments,
+                                 monotonic() - job.started, e, None if err is None else err[1])
+
+            if err is None:
+                if self.limiter is not None:
+                    self.limiter.report()
+                job.future.set_result(refno)
+            else:
+                if self.limiter is not None and err[0] in ('http', 'vianett'):
+                    self.limiter.report(err[1])
+                job.future.set_exception(e)
+
+    def _collect(self):
+        """ Thread: resolve futures with the results from the workers """
+        maintained = monotonic()
+        while True:
+            with self._cond:
+                workers = dict((w.results, w) for w in self._workers if w.results is not None)
+            ready = wait(list(workers), timeout=0.5)
+
+            resolved = []
+            with self._cond:
+                for conn in ready:
+                    resolved.extend(self._receive(workers[conn]))
+                if not ready or monotonic() - maintained > 0.5:
+                    maintained = monotonic()
+                    resolved.extend(self._maintain())
+                    if self._closed and not self._jobs:
+                        self._cond.notify_all()
+                        return
+            self._resolve(resolved)
+
+    #endregion
+
+    def submit(self, dst, body, params):
+        """ Queue a message for the workers
+
+            Waits for the rate limiter, if any.
+
+            :param dst: Destination number
+            :param body: Message text
+            :type params: dict
+            :param params: Request parameters, with `msgid`
+            :rtype: concurrent.futures.Future
+            :returns: Future that gets the refno, or the translated exception
+        """
+        if self.limiter is not None:
+            self.limiter.acquire(params.get('Priority'))
+        job = _Job(next(self._ids), dst, body, params)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('The process pool is closed')
+            self._jobs[job.id] = job
+            self._dispatch(job)
+        return job.future
+
+    def sendmsg(self, to, text, **params):
+        """ Send SMS message with a worker process, and wait for the result
+
+            :rtype: str
+            :returns: refno
+            :raises smsframework.exc.ProviderError: Translated errors
+        """
+        return self.submit(to, text, params).result()
+
+    def sendmsg_many(self, messages, concurrency=None, ordered=True):
+        """ Send many SMS messages with the worker processes
+
+            See :meth:`smsframework_vianett.api.VianettHttpApi.sendmsg_many`
+
+            :type concurrency: int | None
+            :param concurrency: The number of messages in progress. Default: enough to keep every worker busy
+        """
+        return send_many(self.sendmsg, messages, concurrency or self.processes * self.concurrency, ordered)
+
+    def close(self, timeout=None):
+        """ Wait for the messages in progress, and stop the workers
+
+            :type timeout: float | None
+            :param timeout: Max time to wait, seconds
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            while self._jobs:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Give up on the rest
+            jobs, self._jobs = list(self._jobs.values()), {}
+            self._backlog.clear()
+            workers, self._workers = self._workers + self._stopping, []
+            for worker in workers:
+                worker.jobs.put(None)
+        for job in jobs:
+            job.future.set_exception(RuntimeError('The process pool was closed'))
+        for worker in workers:
+            worker.process.join(timeout)
+        self._collector.join(timeout)
+        for worker in workers:
+            if worker.results is not None:
+                worker.results.close()
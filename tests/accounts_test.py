@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from collections import Counter
+
+try: # Py3
+    from urllib.request import URLError
+except ImportError: # Py2
+    from urllib2 import URLError
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.api import VianettApiError
+from smsframework_vianett.accounts import Account, AccountPool
+from smsframework_vianett.decode import decode_status
+
+
+class FakeApi(object):
+    """ Records sent messages; fails with `error` if set """
+
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+        self.sent = []
+
+    def sendmsg(self, to, text, **params):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(to)
+        return '{}-{}'.format(self.name, len(self.sent))
+
+
+class AccountPoolTest(unittest.TestCase):
+    def _pool(self, n=3, **options):
+        return AccountPool([Account('acc{}'.format(i), FakeApi('acc{}'.format(i))) for i in range(n)], **options)
+
+    def test_round_robin(self):
+        """ Accounts take turns """
+        pool = self._pool()
+        self.assertEqual([pool.sendmsg('1', 'a') for i in range(4)], ['acc0-1', 'acc1-1', 'acc2-1', 'acc0-2'])
+        self.assertEqual([a.sent for a in pool.accounts], [2, 1, 1])
+
+    def test_least_loaded(self):
+        """ The account with the fewest requests in progress goes first """
+        pool = self._pool(routing='least-loaded')
+        busy = [pool.choose('1'), pool.choose('1')]
+        self.assertEqual(sorted(a.name for a in busy), ['acc0', 'acc1'])
+        self.assertEqual(pool.choose('1').name, 'acc2')
+        pool.release(busy[0])
+        self.assertEqual(pool.choose('1').name, busy[0].name)
+
+    def test_hash(self):
+        """ A destination sticks to its account; ejection moves only the ejected account's destinations """
+        pool = self._pool(routing='hash', eject_after=1)
+        dsts = [str(4790000000 + i) for i in range(300)]
+        before = dict((dst, pool.choose(dst)) for dst in dsts)
+        for account in before.values():
+            pool.release(account)
+        self.assertEqual(set(a.name for a in before.values()), set(['acc0', 'acc1', 'acc2']))
+        self.assertTrue(all(pool.choose(dst) is before[dst] for dst in dsts[:10]))
+
+        # Eject acc1
+        acc1 = pool.accounts[1]
+        acc1.inflight = 1
+        pool.release(acc1, URLError('down'))
+        self.assertTrue(acc1.ejected)
+        for dst in dsts:
+            account = pool.choose(dst)
+            if before[dst] is acc1:
+                self.assertIsNot(account, acc1)
+            else:
+                self.assertIs(account, before[dst])
+
+    def test_eject(self):
+        """ Failing accounts are ejected, and come back """
+        pool = self._pool(n=2, eject_after=2, eject_time=60, eject_codes=['105'])
+        acc0, acc1 = pool.accounts
+
+        # Message errors are not account failures
+        acc0.api.error = VianettApiError('101', 'Invalid number')
+        for i in range(4):
+            try:
+                pool.sendmsg('1', 'a')
+            except VianettApiError:
+                pass
+        self.assertFalse(acc0.ejected)
+
+        # Account errors are
+        acc0.api.error = VianettApiError('105', 'Authentication failed')
+        for i in range(4):
+            try:
+                pool.sendmsg('1', 'a')
+            except VianettApiError:
+                pass
+        self.assertTrue(acc0.ejected)
+        self.assertEqual(acc0.ejections, 1)
+        self.assertEqual(Counter(pool.sendmsg('1', 'a')[:4] for i in range(4)), {'acc1': 4})
+
+        # Everyone is ejected: use them anyway
+        acc1.ejected_until = acc0.ejected_until
+        self.assertEqual(len(set(pool.choose('1').name for i in range(4))), 2)
+
+        # Back
+        acc0.ejected_until = 0
+        acc0.api.error = None
+        self.assertFalse(acc0.ejected)
+        pool.sendmsg('1', 'a')
+        self.assertEqual(acc0.errors, 0)
+
+
+class ProviderAccountsTest(unittest.TestCase):
+    def test_provider(self):
+        """ Provider sends with every account, and correlates statuses no matter the account """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='a', password='1', correlate=True,
+                                   rate_limit=dict(rate=100),
+                                   accounts=[dict(user='b', password='2'), dict(user='c', password='3', rate_limit=dict(rate=5))],
+                                   sharding='round-robin')
+        pool = provider.api
+        self.assertEqual([a.name for a in pool.accounts], ['a', 'b', 'c'])
+        self.assertIs(pool.accounts[0].api.limiter, provider.limiter)
+        self.assertEqual([a.api.limiter.rate for a in pool.accounts], [100, 100, 5])
+        for account in pool.accounts:
+            account.api.sendmsg = FakeApi(account.name).sendmsg
+
+        messages = [gw.send(OutgoingMessage('+1', 'a')) for i in range(3)]
+        self.assertEqual([m.msgid for m in messages], ['a-1', 'b-1', 'c-1'])
+
+        results = list(provider.send_many([OutgoingMessage('+2', 'b'), OutgoingMessage('+3', 'c')]))
+        self.assertEqual(sorted(m.msgid for m, r in results), ['a-2', 'b-2'])
+
+        # Status reports of any account find their message
+        statuses = []
+        gw.onStatus += statuses.append
+        provider._receive_status(decode_status({'refno': 'b-1', 'requesttype': 'mtstatus', 'errorcode': '0',
+                                                'username': 'b'}))
+        self.assertEqual(statuses[0].meta['sent'].dst, '1')
+        self.assertEqual(statuses[0].meta['username'], 'b')
+        provider.close()
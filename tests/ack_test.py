@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from smsframework_vianett.ack import Ack, parse_ack, parse_ack_xml
+
+
+class AckParserTest(unittest.TestCase):
+    def assertAck(self, response, refno, errorcode, text, extra=None):
+        ack = parse_ack(response)
+        self.assertEqual((ack.refno, ack.errorcode, ack.text, ack.extra), (refno, errorcode, text, extra))
+        # Same result as the XML parser
+        self.assertEqual(ack, parse_ack_xml(response))
+
+    def test_fast(self):
+        """ Known shapes """
+        self.assertAck(b'<?xml version="1.0"?><ack refno="1" errorcode="200">OK</ack>', '1', '200', 'OK')
+        self.assertAck('<ack refno="1" errorcode="200">OK</ack>\r\n', '1', '200', 'OK')
+        self.assertAck(b'<ack refno="" errorcode="400" />', '', '400', None)
+        self.assertAck(b'<ack refno="2" errorcode="400"></ack>', '2', '400', None)
+        self.assertAck(u'<ack refno="3" errorcode="400">Файл</ack>'.encode('utf-8'), '3', '400', u'Файл')
+
+    def test_fallback(self):
+        """ Unusual shapes """
+        self.assertAck(b'<ack errorcode="200" refno="1">OK</ack>', '1', '200', 'OK')
+        self.assertAck(b'<ack refno="1" errorcode="400">A &amp; B</ack>', '1', '400', 'A & B')
+        self.assertAck(b'<ack refno="1" errorcode="200" x="y">OK</ack>', '1', '200', 'OK', {'x': 'y'})
+
+    def test_invalid(self):
+        """ Invalid responses """
+        self.assertRaises(AssertionError, parse_ack, b'<html>Error</html>')
+        self.assertRaises(AssertionError, parse_ack, b'Error')
+        self.assertRaises(AssertionError, parse_ack, b'<ack refno="1" />')
+
+    def test_dict(self):
+        """ Ack works like a dict """
+        ack = Ack('1', '200', 'OK', {'x': 'y'})
+        self.assertEqual(ack['refno'], '1')
+        self.assertEqual(ack['x'], 'y')
+        self.assertEqual(ack.get('z'), None)
+        self.assertIn('text', ack)
+        self.assertEqual(ack, {'refno': '1', 'errorcode': '200', 'text': 'OK', 'x': 'y'})
+        self.assertRaises(KeyError, lambda: ack['z'])
+        self.assertRaises(AttributeError, setattr, ack, 'z', 1)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+""" ASGI receiver test cases: Python 3.5+ syntax, imported by `asgi_test` on Python 3.5+ """
+
+import asyncio
+import threading
+import unittest
+
+from flask import Flask
+from smsframework import Gateway
+
+from smsframework_vianett import VianettProvider
+
+from async_cases import run
+
+
+IM_QUERY = ('refno=19194091&requesttype=mo&sourceaddr=47580008000626&destinationaddr=4794041334&replypathid=0'
+            '&prefix=TEST&message=Hi,%20man&retrycount=0&operator=435&username=&password=')
+STATUS_QUERY = ('refno=1234&Status=ACCEPTD&requesttype=notificationstatus&StatusDescription=Absent+subscriber'
+                '&StatusCode=107&now=06%2E10%2E2005+11%3A24%3A07&')
+
+
+async def call(app, path, query='', method='GET'):
+    """ Make a request to an ASGI app
+
+        :returns: (status, headers, body)
+    """
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode('ascii'), 'headers': []}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start, body = messages
+    return start['status'], dict(start['headers']), body['body']
+
+
+class AsgiReceiverTest(unittest.TestCase):
+    def setUp(self):
+        self.gw = Gateway()
+        self.received = []
+        self.gw.onReceive += self.received.append
+        self.gw.onStatus += self.received.append
+
+    def _provider(self, **options):
+        return self.gw.add_provider('main', VianettProvider, user='kolypto', password='1234', **options)
+
+    def test_same_as_flask(self):
+        """ Same responses as the Flask blueprint """
+        provider = self._provider(metrics=True)
+        asgi = provider.make_asgi_app()
+        flask_app = Flask(__name__)
+        self.gw.receiver_blueprints_register(flask_app, prefix='/a/b/')
+
+        with flask_app.test_client() as c:
+            for route, query in (('im', IM_QUERY), ('status', STATUS_QUERY), ('im', 'refno=1')):
+                res = c.get('/a/b/main/{}?{}'.format(route, query))
+                status, headers, body = run(call(asgi, '/a/b/main/' + route, query))
+                self.assertEqual((status, headers[b'content-type'].decode()), (res.status_code, res.content_type))
+                if status == 200:
+                    self.assertEqual(body, res.data)
+
+        # Both delivered the same objects
+        self.assertEqual(len(self.received), 4)
+        self.assertEqual(self.received[0].body, self.received[1].body)
+        self.assertEqual(self.received[0].meta, self.received[1].meta)
+        self.assertEqual(self.received[2].status, self.received[3].status)
+        self.assertEqual(self.received[1].provider, 'main')
+
+        # Metrics, other routes
+        status, headers, body = run(call(asgi, '/main/metrics'))
+        self.assertIn(b'vianett_received_total{route="im"} 4', body)
+        self.assertEqual(run(call(asgi, '/main/im', IM_QUERY, method='POST'))[0], 405)
+        self.assertEqual(run(call(asgi, '/main/nothing'))[0], 404)
+
+    def test_concurrency(self):
+        """ Gateway handlers don't block the event loop; many callbacks run concurrently """
+        provider = self._provider(dedup=True)
+        release = threading.Event()
+        self.gw.onStatus += lambda status: release.wait()
+        app = provider.make_asgi_app(max_pending=10)
+
+        async def main():
+            # Blocked handlers fill `max_pending`, and the rest get 503
+            blocked = [asyncio.ensure_future(call(app, '/status', 'refno={}&requesttype=mtstatus&errorcode=0'.format(i)))
+                       for i in range(10)]
+            while app.pending < 10:
+                await asyncio.sleep(0.001)
+            overloaded = await call(app, '/status', 'refno=100&requesttype=mtstatus&errorcode=0')
+            release.set()
+            done = await asyncio.gather(*blocked)
+
+            # Duplicates are acked without processing
+            duplicate = await call(app, '/status', 'refno=1&requesttype=mtstatus&errorcode=0')
+            return overloaded, done, duplicate
+
+        overloaded, done, duplicate = run(main())
+        self.assertEqual(overloaded[0], 503)
+        self.assertEqual([r[0] for r in done], [200] * 10)
+        self.assertEqual(duplicate[0], 200)
+        self.assertEqual(len(self.received), 10)
+
+    def test_ingest(self):
+        """ With the ingest queue, callbacks are acked right away """
+        provider = self._provider(ingest=dict(workers=2))
+        app = provider.make_asgi_app()
+
+        async def main():
+            return await asyncio.gather(*[call(app, '/im', IM_QUERY.replace('19194091', str(i))) for i in range(1000)])
+
+        self.assertEqual(set(r[0] for r in run(main())), set([200]))
+        provider.close()
+        self.assertEqual(len(self.received), 1000)
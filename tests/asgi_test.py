@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+if sys.version_info >= (3, 5):
+    from asgi_cases import AsgiReceiverTest
+else:
+    @unittest.skip('The ASGI receiver needs Python 3.5+')
+    class AsgiReceiverTest(unittest.TestCase):
+        pass
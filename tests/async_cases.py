@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+""" asyncio client test cases: Python 3.5+ syntax, imported by `async_test` on Python 3.5+ """
+
+import unittest
+import asyncio
+import threading
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett import error
+
+from pool_test import AckServer
+
+
+def run(coro):
+    """ Run a coroutine in a new event loop: `asyncio.run()` is Py3.7+ """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class AsyncVianettHttpApiTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AckServer()
+        threading.Thread(target=self.server.serve_forever).start()
+
+        self.gw = Gateway()
+        self.provider = self.gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                             endpoints=[self.server.host], async_pool=dict(max_connections=4))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_async_send(self):
+        """ Test async send """
+        sent = []
+        self.gw.onSend += sent.append
+
+        async def main():
+            messages = [OutgoingMessage(str(i), 'hey') for i in range(20)]
+            return await asyncio.gather(*[self.provider.async_send(m) for m in messages])
+
+        messages = run(main())
+        self.assertEqual([m.msgid for m in messages], ['1'] * 20)
+        self.assertEqual(len(sent), 20)
+        self.assertEqual(sent[0].provider, 'main')
+
+        # Connections were reused
+        self.assertLessEqual(len(set(self.server.ports)), 4)
+
+    def test_stale(self):
+        """ Connections closed by the server are replaced transparently """
+        self.server.close_every = 1
+
+        async def main():
+            for i in range(3):
+                await self.provider.async_send(OutgoingMessage('123', 'hey'))
+        run(main())
+        self.assertEqual(len(set(self.server.ports)), 3)
+
+    def test_loops(self):
+        """ The client works in one event loop after another """
+        async def main():
+            return await self.provider.async_send(OutgoingMessage('123', 'hey'))
+
+        for i in range(3):
+            self.assertEqual(run(main()).msgid, '1')
+
+    def test_error(self):
+        """ Test error translation """
+        self.server.status = 500
+
+        async def main():
+            await self.provider.async_send(OutgoingMessage('123', 'hey'))
+        self.assertRaises(error.MessageSendError, run, main())
+
+    def test_accounts(self):
+        """ Async sends are distributed between the accounts """
+        provider = self.gw.add_provider('sharded', VianettProvider, user='a', password='1',
+                                        accounts=[dict(user='b', password='2')],
+                                        endpoints=[self.server.host], async_pool=dict(max_connections=2))
+
+        async def main():
+            return await asyncio.gather(*[provider.async_send(OutgoingMessage(str(i), 'hey')) for i in range(6)])
+
+        self.assertEqual(len(run(main())), 6)
+        self.assertEqual([account.sent for account in provider.async_api.accounts], [3, 3])
+
+    def test_sendmsg_many(self):
+        """ Bounded concurrency, per-message results """
+        provider = self.gw.add_provider('sharded', VianettProvider, user='a', password='1',
+                                        accounts=[dict(user='b', password='2')],
+                                        endpoints=[self.server.host], async_pool=dict(max_connections=2))
+        api = provider.async_api
+        messages = [(str(i), 'hey', {'msgid': str(i)}) for i in range(10)] + [('', 'hey', {})]
+
+        results = run(api.sendmsg_many(iter(messages), concurrency=3))
+        self.assertEqual([index for index, result in results], list(range(11)))
+        self.assertEqual([result for index, result in results[:10]], ['1'] * 10)
+        self.assertIsInstance(results[10][1], AssertionError)  # invalid number
+        self.assertEqual(sum(account.sent for account in api.accounts), 10)
+
+    def test_stale_connection(self):
+        """ Stale connections are detected without StreamWriter.is_closing(), which is Py3.7+ """
+        from smsframework_vianett.async_api import _Connection
+
+        class Transport(object):
+            closing = False
+
+            def is_closing(self):
+                return self.closing
+
+        class Writer(object):  # a Py3.5 StreamWriter: no is_closing()
+            transport = Transport()
+
+        async def main():
+            reader = asyncio.StreamReader()
+            conn = _Connection(reader, Writer())
+            fresh = conn.is_stale()
+            Writer.transport.closing = True
+            closed = conn.is_stale()
+            Writer.transport.closing = False
+            reader.feed_eof()
+            return fresh, closed, conn.is_stale()
+
+        self.assertEqual(run(main()), (False, True, True))
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+if sys.version_info >= (3, 5):
+    from async_cases import AsyncVianettHttpApiTest
+else:
+    @unittest.skip('The asyncio client needs Python 3.5+')
+    class AsyncVianettHttpApiTest(unittest.TestCase):
+        pass
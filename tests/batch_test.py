@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from flask import Flask
+
+from smsframework import Gateway
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.batch import MicroBatcher
+
+
+class StatusBatchTest(unittest.TestCase):
+    def setUp(self):
+        gw = self.gw = Gateway()
+        self.provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                        status_batch=dict(max_size=3, max_delay=60))
+        self.app = Flask(__name__)
+        gw.receiver_blueprints_register(self.app, prefix='/a/b/')
+
+    def _report(self, n):
+        with self.app.test_client() as c:
+            for i in range(n):
+                res = c.get('/a/b/main/status?refno={}&requesttype=mtstatus&errorcode=0'.format(i))
+                self.assertEqual(res.status_code, 200)
+
+    def test_batch(self):
+        """ Batch handlers get batches """
+        batches = []
+        self.provider.onStatusBatch += batches.append
+        self._report(7)
+        self.provider.close()
+        self.assertEqual([len(b) for b in batches], [3, 3, 1])
+        self.assertEqual([s.msgid for b in batches for s in b], [str(i) for i in range(7)])
+        self.assertEqual(batches[0][0].provider, 'main')
+
+    def test_fallback(self):
+        """ Without batch handlers, statuses go to onStatus """
+        statuses = []
+        self.gw.onStatus += statuses.append
+        self._report(4)
+        self.provider.close()
+        self.assertEqual([s.msgid for s in statuses], ['0', '1', '2', '3'])
+
+    def test_delay(self):
+        """ Incomplete batches are flushed after max_delay """
+        batches = []
+        batcher = MicroBatcher(batches.append, max_size=100, max_delay=0.05)
+        batcher.put(1)
+        batcher.put(2)
+        batcher._thread.join(0.5)  # the thread keeps running
+        self.assertEqual(batches, [[1, 2]])
+        batcher.close()
+
+    def test_failure(self):
+        """ Failed batches are retried, then handed over; dedup only remembers delivered statuses """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', dedup=True,
+                                   status_batch=dict(max_size=2, max_delay=60, retries=1, retry_delay=0.01))
+        app = Flask(__name__)
+        gw.receiver_blueprints_register(app, prefix='/a/b/')
+
+        failed, batches = [], []
+        fail = [3]  # fail the first batch twice, then the next one once
+
+        def handler(statuses):
+            if fail[0]:
+                fail[0] -= 1
+                raise RuntimeError('Database is down')
+            batches.append(statuses)
+        provider.onStatusBatch += handler
+        provider.status_batcher.on_failure = lambda batch, e: failed.append((batch, e))
+
+        with app.test_client() as c:
+            for i in (0, 1, 0, 2, 3):
+                res = c.get('/a/b/main/status?refno={}&requesttype=mtstatus&errorcode=0'.format(i))
+                self.assertEqual(res.status_code, 200)
+        provider.close()
+
+        # 0 and 1 failed all retries: the repeated 0 wasn't a duplicate. The next batch got through on a retry
+        self.assertEqual([[s.msgid for s in b] for b, e in failed], [['0', '1']])
+        self.assertIsInstance(failed[0][1], RuntimeError)
+        self.assertEqual([[s.msgid for s in b] for b in batches], [['0', '2'], ['3']])
+        self.assertEqual((provider.status_batcher.retried, provider.status_batcher.failed), (2, 1))
+
+        # Delivered statuses are duplicates now
+        self.assertTrue(provider.dedup.seen('status', {'requesttype': 'mtstatus', 'refno': '2', 'errorcode': '0'}))
+        self.assertFalse(provider.dedup.seen('status', {'requesttype': 'mtstatus', 'refno': '1', 'errorcode': '0'}))
+
+    def test_partial_failure(self):
+        """ Without batch handlers, only the statuses that failed in onStatus are retried """
+        self.provider.status_batcher.retry_delay = 0.01
+        seen = []
+        fail = ['2']
+
+        def handler(status):
+            seen.append(status.msgid)
+            if status.msgid in fail:
+                fail.remove(status.msgid)
+                raise RuntimeError('Database is down')
+        self.gw.onStatus += handler
+
+        self._report(3)
+        self.provider.close()
+        self.assertEqual(seen, ['0', '1', '2', '2'])
+        self.assertEqual((self.provider.status_batcher.retried, self.provider.status_batcher.failed), (1, 0))
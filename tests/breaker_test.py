@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import time
+import socket
+import unittest
+import threading
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett import error
+from smsframework_vianett.breaker import CircuitBreaker
+from smsframework_vianett.retry import RetryBudget
+
+from pool_test import AckServer
+
+
+def _dead_host():
+    """ Get a host:port that refuses connections """
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return '127.0.0.1:{}'.format(port)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_states(self):
+        """ Closed -> open -> half-open -> closed """
+        b = CircuitBreaker(failure_rate=0.5, min_requests=4, open_timeout=0.05)
+        for ok in (True, False, True, False):
+            self.assertTrue(b.allow())
+            b.success() if ok else b.failure()
+        self.assertEqual(b.state, CircuitBreaker.OPEN)
+        self.assertFalse(b.allow())
+        self.assertEqual(b.rejected, 1)
+
+        # Half-open: one probe at a time
+        time.sleep(0.06)
+        self.assertTrue(b.allow())
+        self.assertFalse(b.allow())
+        b.failure()
+        self.assertEqual(b.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(b.allow())
+        b.success()
+        self.assertEqual(b.state, CircuitBreaker.CLOSED)
+        self.assertEqual(b.opened, 2)
+
+
+class FailoverTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AckServer()
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_failover(self):
+        """ Requests fail over to the next endpoint, and open circuits are skipped """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   endpoints=[_dead_host(), self.server.host], connect_timeout=1.0,
+                                   breaker=dict(min_requests=2, open_timeout=60))
+        for i in range(3):
+            self.assertEqual(gw.send(OutgoingMessage('+123456', 'hey', provider='main')).msgid, '1')
+        primary, backup = provider.api.endpoints
+        self.assertEqual(primary.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(primary.breaker.rejected, 1)
+        self.assertEqual(backup.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(len(self.server.ports), 3)
+        provider.close()
+
+    def test_all_down(self):
+        """ With all circuits open, requests fail fast """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   endpoints=[_dead_host()], connect_timeout=1.0, breaker=dict(min_requests=1),
+                                   retry=dict(attempts=5, base_delay=0))
+        self.assertRaises(error.ConnectionError, gw.send, OutgoingMessage('+123456', 'hey', provider='main'))
+        self.assertEqual(provider.api.endpoints[0].breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(provider.retry.retries, 1)  # the open circuit is not retried
+        provider.close()
+
+    def test_read_timeout(self):
+        """ A request that has timed out waiting for the response is not repeated on another endpoint """
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(1)
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   endpoints=['127.0.0.1:{}'.format(silent.getsockname()[1]), self.server.host],
+                                   read_timeout=0.1)
+        try:
+            self.assertRaises(error.ConnectionError, gw.send, OutgoingMessage('+123456', 'hey', provider='main'))
+            self.assertEqual(self.server.ports, [])
+        finally:
+            provider.close()
+            silent.close()
+
+    def test_read_timeout_urlopen(self):
+        """ A response timeout without a connection pool is a connection error: counted by the breaker, and retried """
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(5)
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   endpoints=['127.0.0.1:{}'.format(silent.getsockname()[1])], read_timeout=0.2,
+                                   breaker=dict(min_requests=2),
+                                   retry=dict(attempts=2, base_delay=0, budget=RetryBudget(ratio=10, min_per_second=0)))
+        try:
+            self.assertIsNone(provider.api.endpoints[0].pool)
+            self.assertRaises(error.ConnectionError, gw.send, OutgoingMessage('+123456', 'hey', provider='main'))
+            self.assertEqual(provider.retry.retries, 1)
+            self.assertEqual(provider.api.endpoints[0].breaker.state, CircuitBreaker.OPEN)
+        finally:
+            provider.close()
+            silent.close()
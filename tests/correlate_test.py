@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from time import time
+from datetime import datetime
+
+from flask import Flask
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.correlate import Correlator, MemoryCorrelationBackend, SqliteCorrelationBackend, SentMessage
+
+
+class CorrelatorTest(unittest.TestCase):
+    def test_receiver(self):
+        """ Status reports are enriched with the sent message """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', correlate=True)
+        app = Flask(__name__)
+        gw.receiver_blueprints_register(app, prefix='/a/b/')
+
+        msgids = []
+        def _api_request(method, **params):
+            msgids.append(params['msgid'])
+            return '<ack refno="555" errorcode="200">OK</ack>'
+        provider.api._api_request = _api_request
+        gw.send(OutgoingMessage('+123456', 'hey', provider='main'))
+
+        statuses = []
+        gw.onStatus += statuses.append
+        with app.test_client() as c:
+            c.get('/a/b/main/status?refno=555&requesttype=mtstatus&errorcode=0')
+            c.get('/a/b/main/status?refno=666&requesttype=mtstatus&errorcode=0')
+
+        sent = statuses[0].meta['sent']
+        self.assertEqual((sent.msgid, sent.refno, sent.dst), (msgids[0], '555', '123456'))
+        self.assertEqual(sent.meta['segments'], 1)
+        self.assertGreaterEqual(statuses[0].meta['latency'], 0)
+        self.assertNotIn('sent', statuses[1].meta)
+        self.assertEqual((provider.correlator.hits, provider.correlator.misses), (1, 1))
+        self.assertIs(provider.correlator.find(msgids[0]), sent)
+
+    def test_memory_eviction(self):
+        """ Memory backend evicts the oldest and expired messages """
+        backend = MemoryCorrelationBackend(maxsize=2, ttl=60)
+        backend.add(SentMessage('a', '1', '123', time() - 120))
+        backend.add(SentMessage('b', '2', '123', time()))
+        backend.add(SentMessage('c', '3', '123', time()))
+        backend.add(SentMessage('d', '4', '123', time()))
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get('2'))
+        self.assertIsNone(backend.find('a'))
+        self.assertEqual(backend.find('d').refno, '4')
+
+    def test_sqlite(self):
+        """ SQLite backend survives a restart """
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'correlation.db')
+            c = Correlator(path=path)
+            c.sent('a', '1', '123', {'segments': 2})
+            c.close()
+
+            c = Correlator(path=path)
+            self.assertIsInstance(c.backend, SqliteCorrelationBackend)
+            self.assertEqual(c.get('1').meta, {'segments': 2})
+            self.assertEqual(c.find('a').refno, '1')
+            self.assertIsNone(c.get('2'))
+            c.close()
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_errors(self):
+        """ A sent message is not failed by the correlator; any metadata is stored """
+        tmp = tempfile.mkdtemp()
+        try:
+            c = Correlator(path=os.path.join(tmp, 'correlation.db'))
+            c.sent('a', '1', '123', {'when': datetime(2020, 1, 2), 1: 'skipped', 'obj': object})
+            self.assertEqual(c.get('1').meta['when'], '2020-01-02 00:00:00')
+            c.close()
+        finally:
+            shutil.rmtree(tmp)
+
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', correlate=True)
+        provider.api._api_request = lambda method, **params: '<ack refno="1" errorcode="200">OK</ack>'
+
+        def add(sent):
+            raise sqlite3.OperationalError('database is locked')
+        provider.correlator.backend.add = add
+        self.assertEqual(gw.send(OutgoingMessage('+123456', 'hey')).msgid, '1')
+        self.assertEqual(provider.correlator.errors, 1)
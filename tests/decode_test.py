@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from smsframework.data import MessageStatus, MessageAccepted, MessageDelivered, MessageExpired, MessageError
+from smsframework_vianett.decode import decode_status, StatusMeta
+
+
+class DecodeStatusTest(unittest.TestCase):
+    def _notification(self, status):
+        return decode_status({'refno': '1', 'requesttype': 'notificationstatus',
+                              'Status': status, 'StatusDescription': 'desc', 'StatusCode': '1'})
+
+    def test_notificationstatus(self):
+        """ All notification statuses """
+        for status, cls in (('ACCEPTD', MessageAccepted), ('BUFFERD', MessageAccepted), ('ENROUTE', MessageAccepted),
+                            ('DELIVRD', MessageDelivered), ('EXPIRED', MessageExpired),
+                            ('UNDELIV', MessageError), ('REJECTD', MessageError), ('DELETED', MessageError),
+                            ('UNKNOWN', MessageStatus), ('WHATEVER', MessageStatus)):
+            st = self._notification(status)
+            self.assertIs(type(st), cls, status)
+            self.assertEqual(st.status, status + ': desc')
+
+        st = self._notification('EXPIRED')
+        self.assertEqual((st.accepted, st.delivered, st.expired, st.error), (True, False, True, False))
+
+    def test_mtstatus(self):
+        """ Delivery reports """
+        st = decode_status({'refno': '1', 'requesttype': 'mtstatus', 'errorcode': '5'})
+        self.assertIs(type(st), MessageError)
+        self.assertEqual(st.status, '5 and ?')
+
+        st = decode_status({'refno': '1', 'requesttype': 'mtstatus', 'ErrorCode': '500',
+                            'ErrorDescription': 'Failed', 'Status': 'x', 'Msg': 'y'})
+        self.assertIs(type(st), MessageError)
+        self.assertEqual(st.status, 'Failed: x: y')
+
+    def test_invalid(self):
+        """ Invalid reports """
+        self.assertRaises(AssertionError, decode_status, {'refno': '1'})
+        self.assertRaises(AssertionError, decode_status, {'refno': '1', 'requesttype': 'mo'})
+        self.assertRaises(AssertionError, decode_status, {'requesttype': 'mtstatus', 'errorcode': '0'})
+        self.assertRaises(AssertionError, decode_status, {'refno': '1', 'requesttype': 'notificationstatus'})
+
+    def test_meta(self):
+        """ StatusMeta works like a dict """
+        req = {'refno': '1', 'now': 'today', 'Custom': 'field'}
+        meta = StatusMeta(req)
+        self.assertEqual(dict(meta), req)
+        self.assertEqual(len(meta), 3)
+        self.assertIn('Custom', meta)
+        self.assertNotIn('CPACost', meta)
+        self.assertEqual(meta.get('CPACost'), None)
+
+        meta['CPACost'] = '1'
+        meta['other'] = '2'
+        del meta['now']
+        self.assertEqual(dict(meta), {'refno': '1', 'Custom': 'field', 'CPACost': '1', 'other': '2'})
+        self.assertRaises(KeyError, lambda: meta['now'])
+        self.assertFalse(hasattr(meta, '__dict__'))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from flask import Flask
+
+from smsframework import Gateway
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.dedup import MemoryDedupBackend
+
+
+class DeduplicatorTest(unittest.TestCase):
+    def setUp(self):
+        gw = self.gw = Gateway()
+        self.provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', dedup=True)
+        self.app = Flask(__name__)
+        gw.receiver_blueprints_register(self.app, prefix='/a/b/')
+
+    def test_im(self):
+        """ Repeated messages are acked, but not processed """
+        messages = []
+        fail = [True]
+
+        def receiver(message):
+            if fail.pop():
+                raise RuntimeError('DB is down')
+            messages.append(message)
+        self.gw.onReceive += receiver
+
+        url = ('/a/b/main/im?refno=1&requesttype=mo&sourceaddr=123&destinationaddr=456'
+               '&replypathid=0&prefix=TEST&message=Hi&retrycount={}&operator=435')
+        with self.app.test_client() as c:
+            # Failed: Vianett retries
+            self.assertEqual(c.get(url.format(0)).status_code, 500)
+            fail.append(False)
+            self.assertEqual(c.get(url.format(1)).status_code, 200)
+            self.assertEqual(len(messages), 1)
+
+            # Duplicate
+            res = c.get(url.format(2))
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data, b'<ack refno="1" errorcode="0" />')
+            self.assertEqual(len(messages), 1)
+
+        self.assertEqual((self.provider.dedup.hits, self.provider.dedup.misses), (1, 2))
+
+    def test_status(self):
+        """ Repeated statuses are dropped, but new statuses of the same message are not """
+        statuses = []
+        self.gw.onStatus += statuses.append
+
+        url = ('/a/b/main/status?refno=1234&requesttype=notificationstatus&Status={}'
+               '&StatusDescription=&StatusCode=0')
+        with self.app.test_client() as c:
+            for s in ('ACCEPTD', 'ACCEPTD', 'DELIVRD', 'DELIVRD'):
+                self.assertEqual(c.get(url.format(s)).status_code, 200)
+        self.assertEqual([s.status for s in statuses], ['ACCEPTD: ', 'DELIVRD: '])
+
+    def test_backend(self):
+        """ Keys expire, and the oldest are evicted """
+        backend = MemoryDedupBackend(maxsize=2, ttl=100)
+        for key in 'abc':
+            backend.add(key)
+        self.assertEqual(len(backend), 2)
+        self.assertFalse(backend.contains('a'))
+        self.assertTrue(backend.contains('c'))
+
+        backend = MemoryDedupBackend(ttl=-1)
+        backend.add('a')
+        self.assertFalse(backend.contains('a'))
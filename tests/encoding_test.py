@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett import error
+from smsframework_vianett.encoding import plan, plan_many, split, GSM7, UCS2
+
+
+class EncodingTest(unittest.TestCase):
+    def assertPlan(self, text, encoding, units, segments):
+        p = plan(text)
+        self.assertEqual((p.encoding, p.units, p.segments), (encoding, units, segments))
+
+    def test_plan(self):
+        """ Encoding and segments """
+        self.assertPlan('', GSM7, 0, 1)
+        self.assertPlan('Hello, @£$!', GSM7, 11, 1)
+        self.assertPlan('a' * 160, GSM7, 160, 1)
+        self.assertPlan('a' * 161, GSM7, 161, 2)
+        self.assertPlan('a' * 306, GSM7, 306, 2)
+        self.assertPlan('a' * 307, GSM7, 307, 3)
+        self.assertPlan('€' * 80, GSM7, 160, 1)
+        self.assertPlan('[x]', GSM7, 5, 1)
+        self.assertPlan('Привет', UCS2, 6, 1)
+        self.assertPlan('я' * 71, UCS2, 71, 2)
+        self.assertPlan('\U0001F600', UCS2, 2, 1)
+
+    def test_plan_many(self):
+        """ Vectorised """
+        plans = plan_many(['a', 'я', 'a'])
+        self.assertEqual([p.encoding for p in plans], [GSM7, UCS2, GSM7])
+        self.assertIs(plans[0], plans[2])
+
+    def test_split(self):
+        """ Split into parts """
+        self.assertEqual(split('abc'), ['abc'])
+        self.assertEqual([len(p) for p in split('a' * 307)], [153, 153, 1])
+        parts = split('a' * 152 + '€' + 'b' * 10)
+        self.assertEqual(parts, ['a' * 152, '€' + 'b' * 10])
+        self.assertEqual([len(p) for p in split('я' * 135)], [67, 67, 1])
+
+    def test_provider(self):
+        """ Messages are annotated, and limited """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', max_segments=2)
+        provider.api._api_request = lambda method, **params: '<ack refno="1" errorcode="200">OK</ack>'
+
+        message = gw.send(OutgoingMessage('+123456', 'я' * 100))
+        self.assertEqual(message.meta, {'segments': 2, 'encoding': UCS2})
+        self.assertRaises(error.RequestError, gw.send, OutgoingMessage('+123456', 'я' * 135))
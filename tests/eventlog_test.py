@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from smsframework import Gateway, OutgoingMessage
+
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.decode import decode_status
+from smsframework_vianett import eventlog
+from smsframework_vianett.eventlog import EventLog, EventLogReader, RECORD, HEADER
+
+
+class EventLogTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_segments(self):
+        """ Records go into rotating segments, and are read back in order """
+        log = EventLog(self.path, segment_size=HEADER.size + 10 * RECORD.size, max_segments=3, buffer_size=7)
+        for i in range(45):
+            log.sent(i + 1, 1000 + i, segments=1, latency=0.01)
+        log.close()
+
+        # 5 segments of 10 records, the 2 oldest deleted
+        self.assertEqual([os.path.basename(f) for f in eventlog.list_segments(self.path)],
+                         ['events-00000003.log', 'events-00000004.log', 'events-00000005.log'])
+        events = list(EventLogReader(self.path))
+        self.assertEqual([e.msgid for e in events], list(range(21, 46)))
+        self.assertEqual(events[0].refno, 1020)
+
+        # A new writer starts a new segment; a partial record is skipped
+        log = EventLog(self.path)
+        log.close()
+        with open(eventlog.list_segments(self.path)[-1], 'ab') as f:
+            f.write(b'\0' * 10)
+        self.assertEqual(len(list(EventLogReader(self.path))), 25)
+
+    def test_provider(self):
+        """ Sent messages and status reports are logged, and aggregated by operator """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', events=self.path)
+
+        def _api_request(method, **params):
+            errorcode = '101' if params['msg'] == 'bad' else '200'
+            return '<ack refno="{}" errorcode="{}">OK</ack>'.format(params['msgid'], errorcode)
+        provider.api._api_request = _api_request
+
+        for msgid, body in (('1', 'hey'), ('2', 'hey'), ('3', 'x' * 200), ('4', 'bad')):
+            try:
+                gw.send(OutgoingMessage('+4790000000', body).params(msgid=msgid))
+            except Exception:
+                pass
+
+        for refno, code, operator in (('1', '200', '1'), ('2', '200', '2'), ('3', '300', '2')):
+            provider._receive_status(decode_status({
+                'requesttype': 'mtstatus', 'refno': refno, 'ErrorCode': code, 'ErrorDescription': 'Desc',
+                'Status': 'Status', 'Msg': 'Msg', 'OperatorID': operator, 'CPACost': '0,50', 'NetPrice': '0.25'}))
+        provider.close()
+
+        reader = EventLogReader(self.path)
+        sent = list(reader.events(eventlog.SENT))
+        self.assertEqual([(e.msgid, e.state, e.code, e.segments) for e in sent],
+                         [(1, eventlog.OK, -1, 1), (2, eventlog.OK, -1, 1), (3, eventlog.OK, -1, 2),
+                          (4, eventlog.FAILED, 101, 1)])
+
+        stats = reader.aggregate()
+        self.assertEqual(sorted(stats), [1, 2])
+        self.assertEqual((stats[1].delivery_rate, stats[2].delivery_rate), (1.0, 0.5))
+        self.assertEqual((stats[2].reports, stats[2].cost, stats[2].net_price), (2, 1.0, 0.5))
+        self.assertGreaterEqual(stats[2].latency, 0)
+
+    def test_ids(self):
+        """ Non-numeric ids are stored as a hash; foreign files are rejected """
+        log = EventLog(self.path)
+        log.sent('6b2f0c1e-uuid', '123')
+        log.sent('', None)
+        log.close()
+        events = list(EventLogReader(self.path))
+        self.assertEqual([(e.msgid, e.refno) for e in events], [(eventlog.id_key('6b2f0c1e-uuid'), 123), (0, 0)])
+        self.assertNotEqual(eventlog.id_key('6b2f0c1e-uuid'), 0)
+        self.assertEqual(eventlog.id_key(u'6b2f0c1e-uuid'), eventlog.id_key(b'6b2f0c1e-uuid'))
+
+        with open(os.path.join(self.path, 'events-00000099.log'), 'wb') as f:
+            f.write(b'NOPE' + b'\0' * 100)
+        self.assertRaises(ValueError, list, EventLogReader(self.path))
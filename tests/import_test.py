@@ -0,0 +1,70 @@
+import sys
+import json
+import unittest
+import subprocess
+
+
+def _modules_after(statement):
+    """ Run `statement` in a fresh interpreter
+
+        :returns: the names of the modules it imported
+        :rtype: set
+    """
+    code = 'import sys; {}; import json; print(json.dumps(sorted(sys.modules)))'.format(statement)
+    return set(json.loads(subprocess.check_output([sys.executable, '-c', code]).decode('ascii')))
+
+
+class ImportTest(unittest.TestCase):
+    """ Importing the package stays cheap """
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Imports eagerly without PEP 562')
+    def test_lazy(self):
+        """ Constants don't load the provider """
+        modules = _modules_after('import smsframework_vianett.const')
+        for name in ('smsframework', 'smsframework_vianett.provider', 'smsframework_vianett.api',
+                     'urllib.request', 'xml.etree', 'flask'):
+            self.assertNotIn(name, modules)
+
+    def test_provider(self):
+        """ The provider does not load the receiver """
+        modules = _modules_after('from smsframework_vianett import VianettProvider, VianettHttpApi, parse_ack')
+        self.assertIn('smsframework_vianett.provider', modules)
+        self.assertNotIn('smsframework_vianett.receiver', modules)
+        self.assertNotIn('flask', modules)
+        self.assertNotIn('xml.etree', modules)
+
+    def test_features(self):
+        """ Optional features are loaded when enabled """
+        features = ('sqlite3', 'mmap', 'smsframework_vianett.spool', 'smsframework_vianett.correlate',
+                    'smsframework_vianett.eventlog', 'smsframework_vianett.ingest', 'smsframework_vianett.dedup',
+                    'smsframework_vianett.scheduler', 'smsframework_vianett.metrics', 'smsframework_vianett.pool')
+        modules = _modules_after('from smsframework_vianett.provider import VianettProvider')
+        for name in features:
+            self.assertNotIn(name, modules)
+        modules = _modules_after('from smsframework import Gateway; from smsframework_vianett.provider import VianettProvider; '
+                                 "Gateway().add_provider('main', VianettProvider, user='a', password='b')")
+        for name in features:
+            self.assertNotIn(name, modules)
+
+        modules = _modules_after('from smsframework import Gateway; from smsframework_vianett.provider import VianettProvider; '
+                                 "Gateway().add_provider('main', VianettProvider, user='a', password='b', keepalive=True, "
+                                 "keywords={'STOP': len})")
+        self.assertIn('smsframework_vianett.pool', modules)
+        self.assertIn('smsframework_vianett.metrics', modules)
+
+        modules = _modules_after('from smsframework import Gateway; from smsframework_vianett.provider import VianettProvider; '
+                                 "Gateway().add_provider('main', VianettProvider, user='a', password='b', correlate=True)")
+        self.assertIn('sqlite3', modules)
+        self.assertNotIn('mmap', modules)
+
+    def test_attributes(self):
+        """ Lazy attributes are the real ones """
+        import smsframework_vianett
+        from smsframework_vianett.provider import VianettProvider
+        from smsframework_vianett.ack import parse_ack
+
+        self.assertIs(smsframework_vianett.VianettProvider, VianettProvider)
+        self.assertIs(smsframework_vianett.parse_ack, parse_ack)
+        self.assertIn('VianettHttpApi', dir(smsframework_vianett))
+        with self.assertRaises(AttributeError):
+            smsframework_vianett.NoSuchThing
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+
+from flask import Flask
+
+from smsframework import Gateway
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.ingest import IngestQueue
+
+
+class IngestQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_receiver(self):
+        """ Receiver acks right away, and the queue processes requests """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', ingest=dict(workers=2))
+        app = Flask(__name__)
+        gw.receiver_blueprints_register(app, prefix='/a/b/')
+
+        messages, statuses = [], []
+        gw.onReceive += messages.append
+        gw.onStatus += statuses.append
+
+        with app.test_client() as c:
+            for i in range(10):
+                res = c.get('/a/b/main/im?refno={}&requesttype=mo&sourceaddr=123&destinationaddr=456'
+                            '&replypathid=0&prefix=TEST&message=Hi&retrycount=0&operator=435'.format(i))
+                self.assertEqual(res.status_code, 200)
+            res = c.get('/a/b/main/status?refno=1&requesttype=mtstatus&errorcode=0')
+            self.assertEqual(res.status_code, 200)
+
+            # Invalid requests are still rejected
+            res = c.get('/a/b/main/im?refno=1')
+            self.assertEqual(res.status_code, 500)
+
+        provider.close()
+        self.assertEqual(sorted(int(m.msgid) for m in messages), list(range(10)))
+        self.assertEqual(messages[0].provider, 'main')
+        self.assertEqual(len(statuses), 1)
+        self.assertEqual(provider.ingest.processed, 11)
+
+    def test_overflow(self):
+        """ Full queue rejects requests """
+        release = threading.Event()
+        q = IngestQueue(lambda *args: release.wait(), maxsize=1, workers=1, overflow='reject')
+        results = [q.put('im', {}) for i in range(5)]
+        self.assertEqual(results[:1], [True])
+        self.assertIn(False, results)
+        self.assertEqual(q.rejected, results.count(False))
+        release.set()
+        q.close()
+
+    def test_journal(self):
+        """ Unprocessed requests are replayed after a restart """
+        journal = os.path.join(self.tmp, 'ingest.journal')
+        release = threading.Event()
+        started = threading.Event()
+        first = []
+
+        def blocked(kind, req, obj, rtime):
+            started.set()
+            release.wait()
+            first.append(req['refno'])
+
+        # Process dies with requests in the queue
+        q = IngestQueue(blocked, workers=1, journal=journal)
+        for i in range(3):
+            q.put('im', {'refno': str(i)})
+        started.wait()
+        q.close(drain=False, timeout=0.1)
+        release.set()
+
+        # Restart
+        replayed = []
+        q = IngestQueue(lambda kind, req, obj, rtime: replayed.append(req['refno']), journal=journal)
+        q.close()
+        self.assertEqual(sorted(replayed), ['0', '1', '2'])
+
+        # Nothing left
+        replayed = []
+        q = IngestQueue(lambda kind, req, obj, rtime: replayed.append(req['refno']), journal=journal)
+        q.close()
+        self.assertEqual(replayed, [])
+
+    def test_journal_compact(self):
+        """ The journal is compacted at runtime, and keeps the pending requests """
+        journal = os.path.join(self.tmp, 'ingest.journal')
+        release = threading.Event()
+
+        def handler(kind, req, obj, rtime):
+            if req['refno'] == '0':
+                release.wait()
+
+        q = IngestQueue(handler, workers=2, journal=journal, compact_every=10)
+        for i in range(100):
+            q.put('im', {'refno': str(i), 'message': 'x' * 100})
+        for i in range(100):
+            if q.processed == 99:
+                break
+            time.sleep(0.05)
+        self.assertEqual(q.processed, 99)
+        self.assertGreaterEqual(q.compactions, 9)
+
+        # 200 records were written, but the file only has the pending request, and the records since the last compaction
+        with open(journal) as f:
+            self.assertLess(len(f.readlines()), 50)
+
+        # The pending request survives a restart
+        q.close(drain=False, timeout=0.1)
+        release.set()
+        replayed = []
+        q = IngestQueue(lambda kind, req, obj, rtime: replayed.append(req['refno']), journal=journal)
+        q.close()
+        self.assertEqual(replayed, ['0'])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime
+
+from smsframework import Gateway
+from smsframework.data import IncomingMessage
+
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.keywords import KeywordRouter, normalize_keyword
+
+
+def message(body, prefix=''):
+    return IncomingMessage('4790000000', body, msgid='1', dst='2021', rtime=datetime.utcnow(), meta={'prefix': prefix})
+
+
+class KeywordRouterTest(unittest.TestCase):
+    def test_normalize(self):
+        """ Case-folded, NFKC-normalized """
+        for keyword in (u'STOP', u'stop', u' Stop ', u'ＳＴＯＰ'):
+            self.assertEqual(normalize_keyword(keyword), u'stop')
+        self.assertEqual(normalize_keyword(u'STRASSE'), normalize_keyword(u'straße'))
+
+    def test_dispatch(self):
+        """ Messages go to their keyword's handler """
+        calls = []
+        router = KeywordRouter({u'STOP': lambda m: calls.append(('stop', m.body))})
+
+        @router.on(u'Info', u'HELP')
+        def info(m):
+            calls.append(('info', m.body))
+
+        self.assertTrue(router.dispatch(message(u'now', prefix=u'stop')))
+        self.assertTrue(router.dispatch(message(u'ＳＴＯＰ now')))  # use_prefix=False: the first word
+        self.assertTrue(router.dispatch(message(u'me', prefix=u'help')))
+        self.assertFalse(router.dispatch(message(u'hello there')))
+        self.assertFalse(router.dispatch(message(u'')))
+
+        self.assertEqual(calls, [('stop', u'now'), ('stop', u'ＳＴＯＰ now'), ('info', u'me')])
+        self.assertEqual(router.hits.snapshot(), {u'stop': 2, u'help': 1})
+        self.assertEqual(router.misses, 2)
+        self.assertIn(u'INFO', router)
+
+        router.remove(u'stop')
+        self.assertFalse(router.dispatch(message(u'now', prefix=u'STOP')))
+
+    def test_provider(self):
+        """ Unmatched messages go to onReceive """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234')
+        received, stopped = [], []
+        gw.onReceive += received.append
+        provider.keywords.add(u'STOP', stopped.append)
+
+        provider._receive_message(message(u'', prefix=u'Stop'))
+        provider._receive_message(message(u'hi', prefix=u'HELLO'))
+        self.assertEqual([m.meta['keyword'] for m in stopped], [u'stop'])
+        self.assertEqual(stopped[0].provider, 'main')
+        self.assertEqual([m.body for m in received], [u'hi'])
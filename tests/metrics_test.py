@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import threading
+
+from flask import Flask
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett import error
+from smsframework_vianett.metrics import Histogram, CallbackExporter
+
+from pool_test import AckServer
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AckServer()
+        threading.Thread(target=self.server.serve_forever).start()
+
+        self.snapshots = []
+        gw = self.gw = Gateway()
+        self.provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', keepalive=True,
+                                        endpoints=[self.server.host],
+                                        metrics=dict(exporters=[CallbackExporter(self.snapshots.append, 60)]))
+        self.app = Flask(__name__)
+        gw.receiver_blueprints_register(self.app, prefix='/a/b/')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_api(self):
+        """ API requests are measured """
+        self.gw.send(OutgoingMessage('+123456', 'hey', provider='main'))
+        self.server.status = 503
+        self.assertRaises(error.MessageSendError, self.gw.send, OutgoingMessage('+123456', 'hey', provider='main'))
+        self.provider.close()
+
+        metrics = self.provider.metrics
+        self.assertEqual(metrics.connect_seconds.count, 1)
+        self.assertEqual(metrics.request_seconds.count, 2)
+        self.assertEqual(metrics.parse_seconds.count, 1)
+        self.assertEqual(metrics.responses_total.values, {'200': 1, 'http_503': 1})
+        self.assertEqual(metrics.inflight_requests.value, 0)
+
+        # Exported on close
+        self.assertEqual(self.snapshots[-1]['responses_total'], {'200': 1, 'http_503': 1})
+
+    def test_receiver(self):
+        """ Receiver requests are counted, and metrics are served """
+        with self.app.test_client() as c:
+            c.get('/a/b/main/status?refno=1&requesttype=mtstatus&errorcode=0')
+            c.get('/a/b/main/status?refno=2&requesttype=mtstatus&errorcode=0')
+            res = c.get('/a/b/main/metrics')
+        self.assertEqual(res.status_code, 200)
+        text = res.get_data(as_text=True)
+        self.assertIn('vianett_received_total{route="status"} 2', text)
+        self.assertIn('vianett_receive_seconds_count 2', text)
+        self.assertIn('# TYPE vianett_request_seconds histogram', text)
+        self.provider.close()
+
+    def test_disabled(self):
+        """ Without metrics, the endpoint does not exist """
+        gw = Gateway()
+        gw.add_provider('main', VianettProvider, user='kolypto', password='1234')
+        app = Flask(__name__)
+        gw.receiver_blueprints_register(app, prefix='/a/b/')
+        with app.test_client() as c:
+            self.assertEqual(c.get('/a/b/main/metrics').status_code, 404)
+
+    def test_histogram(self):
+        """ Histogram buckets are cumulative """
+        h = Histogram((0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 5):
+            h.observe(v)
+        self.assertEqual(h.snapshot()['buckets'], [(0.1, 2), (1.0, 3), (float('inf'), 4)])
+        self.assertEqual(h.count, 4)
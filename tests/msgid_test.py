@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+from time import time
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.msgid import SnowflakeMsgidGenerator, NODE_ENV
+
+
+class SnowflakeMsgidGeneratorTest(unittest.TestCase):
+    def setUp(self):
+        self.leases = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.leases)
+
+    def test_unique(self):
+        """ Ids are unique and monotonic across threads """
+        gen = SnowflakeMsgidGenerator(node=5)
+        results = [[] for i in range(4)]
+
+        def worker(ids):
+            for i in range(10000):
+                ids.append(gen.next())
+        threads = [threading.Thread(target=worker, args=(ids,)) for ids in results]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        all_ids = sum(results, [])
+        self.assertEqual(len(set(all_ids)), 40000)
+        for ids in results:
+            self.assertEqual(ids, sorted(ids))
+
+    def test_format(self):
+        """ Ids are digits that decode back """
+        gen = SnowflakeMsgidGenerator(node=1023)
+        msgid = gen()
+        self.assertTrue(msgid.isdigit())
+        self.assertLessEqual(len(msgid), 19)
+        self.assertLess(int(msgid), 2 ** 63)
+
+        ms, node, seq = gen.parse(msgid)
+        self.assertAlmostEqual(ms / 1000.0, time(), delta=5)
+        self.assertEqual(node, 1023)
+
+    def test_clock_back(self):
+        """ Clock going back does not break monotonicity """
+        gen = SnowflakeMsgidGenerator(node=1)
+        first = gen.next()
+        gen._last += 10000 << gen.SEQUENCE_BITS  # as if the clock was ahead
+        self.assertGreater(gen.next(), first)
+
+    def test_provider(self):
+        """ Custom generator """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   msgid_generator=lambda: 'custom')
+        requests = []
+
+        def _api_request(method, **params):
+            requests.append(params)
+            return '<ack refno="1" errorcode="200">OK</ack>'
+        provider.api._api_request = _api_request
+        gw.send(OutgoingMessage('+123456', 'hey'))
+        self.assertEqual(requests[0]['msgid'], 'custom')
+
+    def test_node_env(self):
+        """ Node id from the environment; forked children lease their own """
+        os.environ[NODE_ENV] = '42'
+        try:
+            gen = SnowflakeMsgidGenerator(lease_dir=self.leases)
+        finally:
+            del os.environ[NODE_ENV]
+        self.assertEqual(gen.parse(gen())[1], 42)
+
+        gen._after_fork()
+        self.assertNotEqual(gen.node, 42)
+        self.assertIsNotNone(gen._lease)
+        gen = SnowflakeMsgidGenerator(node=7)
+        gen._after_fork()
+        self.assertEqual(gen.node, 7)
+
+        os.environ[NODE_ENV] = '1024'
+        try:
+            self.assertRaises(AssertionError, SnowflakeMsgidGenerator)
+        finally:
+            del os.environ[NODE_ENV]
+
+    def test_lease(self):
+        """ Processes on a host lease different node ids """
+        gens = [SnowflakeMsgidGenerator(lease_dir=self.leases) for i in range(50)]
+        nodes = [gen.parse(gen())[1] for gen in gens]
+        self.assertEqual(len(set(nodes)), 50)
+
+        # A released node id is leased again
+        node = gens[0].node
+        gens[0].node = 5
+        self.assertEqual(gens[0]._lease, None)
+        self.assertEqual(SnowflakeMsgidGenerator(lease_dir=self.leases).node, node)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'No fork()')
+    def test_fork(self):
+        """ A forked child leases a node id of its own """
+        gen = SnowflakeMsgidGenerator(lease_dir=self.leases)
+        parent = gen.node
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # child
+            try:
+                os.write(w, str(gen.parse(gen())[1]).encode('ascii'))
+            finally:
+                os._exit(0)
+        os.close(w)
+        child = int(os.read(r, 10))
+        os.close(r)
+        os.waitpid(pid, 0)
+        self.assertNotEqual(child, parent)
+        self.assertEqual(gen.node, parent)
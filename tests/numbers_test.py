@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from smsframework import Gateway, OutgoingMessage, exc
+
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.const import SenderAddressType
+from smsframework_vianett.numbers import NumberNormalizer, InvalidNumberError
+
+
+class NumberNormalizerTest(unittest.TestCase):
+    def test_destination(self):
+        """ Separators and the international prefix are stripped """
+        numbers = NumberNormalizer()
+        for number in ('+47 900-00 000', '0047 (900) 00.000', '4790000000'):
+            self.assertEqual(numbers.destination(number), '4790000000')
+
+        for number in ('', '+47 abc', '+47 900', '+4790000000000000'):
+            self.assertRaises(InvalidNumberError, numbers.destination, number)
+
+        # National numbers
+        numbers = NumberNormalizer(country_code='47')
+        self.assertEqual(numbers.destination('900 00 000'), '4790000000')
+        self.assertEqual(numbers.destination('0900 00 000'), '4790000000')
+        self.assertEqual(numbers.destination('+46 700000000'), '46700000000')
+
+    def test_sender(self):
+        """ Senders are classified """
+        numbers = NumberNormalizer()
+        self.assertEqual(numbers.sender('2021'), ('2021', SenderAddressType.SHORT_CODE))
+        self.assertEqual(numbers.sender('123456'), ('123456', SenderAddressType.SHORT_CODE))
+        self.assertEqual(numbers.sender('900 00 000'), ('90000000', SenderAddressType.MSISN))  # 8-digit national MSISDN
+        self.assertEqual(numbers.sender('+47 900 00 000'), ('4790000000', SenderAddressType.MSISN))
+        self.assertEqual(numbers.sender('Kolypto'), ('Kolypto', SenderAddressType.ALPHANUMERIC))
+        self.assertRaises(InvalidNumberError, numbers.sender, 'A very long sender')
+        self.assertRaises(InvalidNumberError, numbers.sender, u'Привет')
+
+    def test_cache(self):
+        """ Results and errors are cached, the least recently used are evicted """
+        numbers = NumberNormalizer(cache_size=2)
+        numbers.destination('+4790000000')
+        numbers.destination('+4790000000')
+        self.assertRaises(InvalidNumberError, numbers.destination, 'nope')
+        self.assertRaises(InvalidNumberError, numbers.destination, 'nope')
+        self.assertEqual((numbers.hits, numbers.misses), (2, 2))
+
+        numbers.destination('+4790000000')
+        numbers.destination('+4790000001')  # evicts 'nope'
+        numbers.destination('+4790000000')
+        self.assertEqual((numbers.hits, numbers.misses), (4, 3))
+        self.assertRaises(InvalidNumberError, numbers.destination, 'nope')
+        self.assertEqual(numbers.misses, 4)
+
+    def test_validate(self):
+        """ Recipient lists: unique valid numbers, and the invalid ones """
+        numbers = NumberNormalizer()
+        valid, invalid = numbers.validate(['+47 900 00 000', '4790000000', '123', '+4790000001', 'x'])
+        self.assertEqual(valid, ['4790000000', '4790000001'])
+        self.assertEqual(sorted(invalid), ['123', 'x'])
+        self.assertEqual(invalid['123'].reason, 'too short')
+
+        results = numbers.destinations(['+4790000000', 'x'])
+        self.assertEqual(results[0], '4790000000')
+        self.assertIsInstance(results[1], InvalidNumberError)
+
+    def test_provider(self):
+        """ Invalid numbers are rejected without a request """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234', numbers=dict(country_code='47'))
+        requests = []
+
+        def _api_request(method, **params):
+            requests.append(params)
+            return '<ack refno="1" errorcode="200">OK</ack>'
+        provider.api._api_request = _api_request
+
+        gw.send(OutgoingMessage('900 00 000', 'hey').options(senderId='Kolypto'))
+        self.assertEqual(requests[0]['tel'], '4790000000')
+        self.assertEqual(requests[0]['SenderAddressType'], SenderAddressType.ALPHANUMERIC)
+
+        gw.send(OutgoingMessage('900 00 000', 'hey').options(senderId='900 00 000'))
+        self.assertEqual(requests[1]['SenderAddressType'], SenderAddressType.MSISN)
+
+        self.assertRaises(exc.RequestError, gw.send, OutgoingMessage('12', 'hey'))
+        self.assertEqual(len(requests), 2)
+
+        # Without the option, senders are passed through, and not classified
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234')
+        provider.api._api_request = _api_request
+        gw.send(OutgoingMessage('+4790000000', 'hey').options(senderId='+4790000000'))
+        self.assertEqual(requests[2]['SenderAddress'], '+4790000000')
+        self.assertNotIn('SenderAddressType', requests[2])
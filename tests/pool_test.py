@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+import threading
+
+try: # Py3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.request import HTTPError
+except ImportError: # Py2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urllib2 import HTTPError
+
+from smsframework_vianett.api import VianettHttpApi
+from smsframework_vianett.pool import HttpConnectionPool
+
+
+class AckServer(ThreadingMixIn, HTTPServer):
+    """ Keep-alive HTTP server that responds with an <ack> and remembers client ports """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), AckHandler)
+        self.ports = []
+        #: Close the connection after every N requests
+        self.close_every = None
+        #: Respond with this status code
+        self.status = 200
+
+    @property
+    def host(self):
+        return '127.0.0.1:{}'.format(self.server_address[1])
+
+
+class AckHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.ports.append(self.client_address[1])
+        body = b'<ack refno="1" errorcode="200">OK</ack>'
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.close_every and len(self.server.ports) % self.server.close_every == 0:
+            self.close_connection = True
+
+
+class HttpConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AckServer()
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        """ Connections are reused """
+        pool = HttpConnectionPool(self.server.host)
+        for i in range(5):
+            self.assertEqual(pool.request('POST', '/', b'a=1'), b'<ack refno="1" errorcode="200">OK</ack>')
+        self.assertEqual(len(set(self.server.ports)), 1)
+        pool.close()
+
+    def test_max_requests(self):
+        """ Connections are recycled after max_requests """
+        pool = HttpConnectionPool(self.server.host, max_requests=2)
+        for i in range(6):
+            pool.request('POST', '/', b'a=1')
+        self.assertEqual(len(set(self.server.ports)), 3)
+
+    def test_stale(self):
+        """ Connections closed by the server are replaced transparently """
+        self.server.close_every = 1
+        pool = HttpConnectionPool(self.server.host)
+        for i in range(3):
+            pool.request('POST', '/', b'a=1')
+        self.assertEqual(len(self.server.ports), 3)
+        self.assertEqual(len(set(self.server.ports)), 3)
+
+    @unittest.skipUnless(hasattr(os, 'dup'), 'No dup()')
+    def test_high_fd(self):
+        """ Connections are reused when their descriptors are above FD_SETSIZE (1024) """
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        fds = []
+        try:
+            try:
+                while len(fds) < 1100:
+                    fds.append(os.dup(devnull))
+            except OSError:
+                self.skipTest('Too few file descriptors allowed')
+
+            pool = HttpConnectionPool(self.server.host)
+            for i in range(3):
+                pool.request('POST', '/', b'a=1')
+            self.assertGreaterEqual(pool._idle[0].conn.sock.fileno(), 1024)
+            self.assertEqual(len(set(self.server.ports)), 1)
+            pool.close()
+        finally:
+            for fd in fds + [devnull]:
+                os.close(fd)
+
+    def test_http_error(self):
+        """ HTTP errors are raised like urlopen() does """
+        self.server.status = 500
+        pool = HttpConnectionPool(self.server.host)
+        self.assertRaises(HTTPError, pool.request, 'POST', '/', b'a=1')
+
+    def test_api(self):
+        """ VianettHttpApi over a pool """
+        api = VianettHttpApi('kolypto', '1234', keepalive=True, endpoints=[self.server.host])
+        self.assertEqual(api.sendmsg('123456', 'hey'), '1')
+        self.assertEqual(api.sendmsg('123456', 'hey'), '1')
+        self.assertEqual(len(set(self.server.ports)), 1)
+        api.close()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import threading
+from time import time
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett import error, const
+from smsframework_vianett.ratelimit import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_pacing(self):
+        """ Requests are paced, and shared between threads """
+        limiter = RateLimiter(100, burst=1)
+        limiter.acquire()  # the only token in the bucket
+
+        start = time()
+        threads = [threading.Thread(target=limiter.acquire) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(time() - start, 0.09)
+        self.assertEqual(limiter.queue_depth, 0)
+
+    def test_priorities(self):
+        """ Priorities have separate buckets """
+        limiter = RateLimiter(1, burst=1, priorities={const.Priority.HIGH: (1000, 10)})
+        self.assertEqual(limiter.reserve(), 0)
+        self.assertGreater(limiter.reserve(), 0)  # default bucket is empty
+        self.assertEqual(limiter.reserve(1), 0)  # HIGH is not
+        self.assertEqual(limiter.reserve('1'), 0)
+
+    def test_adaptive(self):
+        """ Throttling errors slow the limiter down """
+        limiter = RateLimiter(100, throttle_codes=('429',), backoff=0.5, recovery=1.0)
+        limiter.report('400')
+        self.assertEqual(limiter.rate, 100)
+        limiter.report('429')
+        limiter.report(429)
+        self.assertEqual(limiter.rate, 25)
+        self.assertEqual(limiter.throttled, 2)
+        limiter.report()
+        self.assertEqual(limiter.rate, 50)
+        limiter.report()
+        limiter.report()
+        self.assertEqual(limiter.rate, 100)
+
+    def test_provider(self):
+        """ Provider reports errors to the limiter """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   rate_limit=dict(rate=1000, throttle_codes=('123',)))
+        provider.api._api_request = lambda method, **params: '<ack refno="1" errorcode="123">Slow down</ack>'
+        self.assertRaises(error.VianettProviderError, gw.send, OutgoingMessage('+123456', 'hey'))
+        self.assertEqual(provider.limiter.rate, 500)
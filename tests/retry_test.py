@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+try: # Py3
+    from urllib.request import URLError
+except ImportError: # Py2
+    from urllib2 import URLError
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett import error
+from smsframework_vianett.api import VianettApiError
+from smsframework_vianett.retry import RetryBudget, RetryPolicy, TRANSIENT_CODES
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        self.gw = Gateway()
+        self.budget = RetryBudget(ratio=10, min_per_second=0)
+        self.retries = []
+        self.provider = self.gw.add_provider('main', VianettProvider, user='kolypto', password='1234', retry=dict(
+            attempts=3, base_delay=0, retry_codes=('500',), budget=self.budget,
+            on_retry=lambda attempt, delay, e: self.retries.append(attempt)
+        ))
+
+    def _mock_responses(self, *responses):
+        """ Mock API responses: an exception to raise, or an errorcode """
+        self.requests = []
+        responses = list(responses)
+
+        def _api_request(method, **params):
+            self.requests.append(params)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return '<ack refno="1" errorcode="{}">text</ack>'.format(response)
+        self.provider.api._api_request = _api_request
+
+    def test_retry(self):
+        """ Transient failures are retried with the same msgid """
+        self._mock_responses(URLError('timeout'), '500', '200')
+        message = self.gw.send(OutgoingMessage('+123456', 'hey'))
+        self.assertEqual(message.msgid, '1')
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(len(set(r['msgid'] for r in self.requests)), 1)
+        self.assertEqual(self.retries, [1, 2])
+        self.assertEqual(self.provider.retry.retries, 2)
+
+    def test_exhausted(self):
+        """ Give up after all attempts """
+        self._mock_responses('500', '500', '500', '200')
+        self.assertRaises(error.VianettProviderError, self.gw.send, OutgoingMessage('+123456', 'hey'))
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.provider.retry.exhausted, 1)
+
+    def test_not_retryable(self):
+        """ Permanent failures are not retried """
+        self._mock_responses('400', '200')
+        self.assertRaises(error.VianettProviderError, self.gw.send, OutgoingMessage('+123456', 'hey'))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_budget(self):
+        """ Retries are limited by the budget """
+        self.budget.ratio = 0.5
+        self._mock_responses(URLError('timeout'), URLError('timeout'), '200')
+        self.assertRaises(error.ConnectionError, self.gw.send, OutgoingMessage('+123456', 'hey'))
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.provider.retry.denied, 1)
+
+    def test_default_codes(self):
+        """ By default, transient Vianett errors are retried, and permanent ones are not """
+        policy = RetryPolicy()
+        self.assertEqual(policy.retry_codes, TRANSIENT_CODES)
+        self.assertTrue(policy.retryable(URLError('timeout')))
+        for code in ('429', '500', '503'):
+            self.assertTrue(policy.retryable(VianettApiError(code, 'Error')))
+        for code in ('105', '400', '401'):
+            self.assertFalse(policy.retryable(VianettApiError(code, 'Error')))
+
+        self.assertFalse(RetryPolicy(retry_codes=()).retryable(VianettApiError('500', 'Error')))
+        self.assertTrue(RetryPolicy(retry_codes=(105,)).retryable(VianettApiError('105', 'Error')))
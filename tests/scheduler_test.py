@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import unittest
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.api import VianettApiError
+from smsframework_vianett.scheduler import Scheduler
+from smsframework_vianett.const import Priority
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []  # (dst, body)
+        self.gate = threading.Event()
+
+    def _send(self, dst, body, **params):
+        """ Blocks until the gate opens, so that the queue fills up """
+        self.gate.wait()
+        if body == 'bad':
+            raise VianettApiError('101', 'Invalid')
+        self.sent.append((dst, body))
+        return str(len(self.sent))
+
+    def _scheduler(self, **options):
+        scheduler = Scheduler(self._send, concurrency=1, **options)
+        # Occupy the worker: everything submitted next is queued
+        busy = scheduler.submit('0', 'busy', {})
+        while not busy.running():
+            time.sleep(0.001)
+        return scheduler
+
+    def test_priority(self):
+        """ High priority goes first """
+        scheduler = self._scheduler()
+        futures = [scheduler.submit('1', 'a', {}),
+                   scheduler.submit('2', 'b', {'Priority': Priority.NORMAL}),
+                   scheduler.submit('3', 'otp', {'Priority': Priority.HIGH})]
+        self.assertEqual(scheduler.depth, {'high': 1, 'normal': 2})
+        self.gate.set()
+        scheduler.close()
+
+        self.assertEqual(self.sent, [('0', 'busy'), ('3', 'otp'), ('1', 'a'), ('2', 'b')])
+        self.assertEqual([f.result() for f in futures], ['3', '4', '2'])
+
+    def test_fairness(self):
+        """ Destinations take turns """
+        scheduler = self._scheduler()
+        for body in 'abc':
+            scheduler.submit('1', body, {})
+        scheduler.submit('2', 'x', {})
+        self.gate.set()
+        scheduler.close()
+
+        self.assertEqual(self.sent[1:], [('1', 'a'), ('2', 'x'), ('1', 'b'), ('1', 'c')])
+
+    def test_coalesce(self):
+        """ Identical queued messages are sent once """
+        scheduler = self._scheduler(coalesce=True)
+        p1, p2, p3 = {'msgid': '1'}, {'msgid': '2'}, {'msgid': '3', 'Priority': Priority.HIGH}
+        f1 = scheduler.submit('1', 'a', p1)
+        f2 = scheduler.submit('1', 'a', p2)
+        f3 = scheduler.submit('1', 'a', p3)  # different parameters
+        f4 = scheduler.submit('1', 'bad', {})
+        self.gate.set()
+        scheduler.close()
+
+        self.assertEqual(self.sent, [('0', 'busy'), ('1', 'a'), ('1', 'a')])
+        self.assertEqual(scheduler.coalesced, 1)
+        self.assertEqual(f1.result(), f2.result())
+        self.assertEqual(p2['msgid'], '1')
+        self.assertEqual(p3['msgid'], '3')
+        self.assertNotEqual(f3.result(), f1.result())
+        self.assertIsInstance(f4.exception(), VianettApiError)
+
+        with self.assertRaises(RuntimeError):
+            scheduler.submit('1', 'a', {})
+
+    def test_provider(self):
+        """ Provider sends through the scheduler """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   scheduler=dict(concurrency=2), metrics=True)
+        provider.scheduler.send = self._send
+        self.gate.set()
+        sent = []
+        gw.onSend += sent.append
+
+        message = gw.send(OutgoingMessage('+1', 'a'))
+        self.assertEqual(message.msgid, '1')
+
+        otp = OutgoingMessage('+2', 'otp').options(escalate=True)
+        self.assertIs(provider.schedule(otp).result(), otp)
+        self.assertEqual(otp.msgid, '2')
+
+        with self.assertRaises(Exception) as e:
+            provider.schedule(OutgoingMessage('+3', 'bad')).result()
+        self.assertIn('Invalid', str(e.exception))
+        provider.close()
+
+        self.assertEqual(sent, [message, otp])
+        lanes = provider.metrics.queue_seconds.snapshot()
+        self.assertEqual((lanes['normal']['count'], lanes['high']['count']), (2, 1))
+        self.assertIn('vianett_queue_seconds_count{lane="high"} 1', provider.metrics.prometheus())
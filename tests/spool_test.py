@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+try: # Py3
+    from urllib.request import URLError
+except ImportError: # Py2
+    from urllib2 import URLError
+
+from smsframework import Gateway, OutgoingMessage
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.api import VianettApiError
+from smsframework_vianett.spool import Spool
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'spool.db')
+        self.sent = []  # (to, text, msgid)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _provider(self, sendmsg, **options):
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   spool=dict(options, path=self.path, retry_delay=0.01))
+        provider.api.sendmsg = sendmsg
+        return provider
+
+    def _sendmsg(self, to, text, **params):
+        if text == 'bad':
+            raise VianettApiError(101, 'Invalid')
+        self.sent.append((to, text, params['msgid']))
+        return str(1000 + len(self.sent))
+
+    def _wait(self, spool):
+        for i in range(200):
+            if not spool.pending():
+                return
+            time.sleep(0.01)
+        self.fail('Spool did not drain')
+
+    def test_send(self):
+        """ Spooled messages are sent, and marked with refno or an error """
+        results = []
+        provider = self._provider(self._sendmsg, on_result=lambda *args: results.append(args))
+        ids = provider.spool.enqueue_many([OutgoingMessage('+1', 'a'), OutgoingMessage('+2', 'bad')])
+        self._wait(provider.spool)
+        provider.close()
+
+        ok, bad = provider.spool.status(ids[0]), provider.spool.status(ids[1])
+        self.assertEqual(ok['state'], Spool.SENT)
+        self.assertEqual(ok['refno'], '1001')
+        self.assertEqual(self.sent, [('1', 'a', ok['msgid'])])
+        self.assertEqual(bad['state'], Spool.FAILED)
+        self.assertIn('Invalid', bad['error'])
+        self.assertEqual(sorted(r[0] for r in results), ids)
+
+    def test_resume(self):
+        """ Messages that failed to connect are resumed after a restart, with the same msgid """
+        def down(to, text, **params):
+            raise URLError('down')
+        provider = self._provider(down)
+        id = provider.spool.enqueue(OutgoingMessage('+1', 'a'))
+        msgid = provider.spool.status(id)['msgid']
+        provider.close()
+        self.assertEqual(provider.spool.status(id)['state'], Spool.PENDING)
+
+        # Restart
+        provider = self._provider(self._sendmsg)
+        self._wait(provider.spool)
+        provider.close()
+        self.assertEqual(self.sent, [('1', 'a', msgid)])
+        self.assertEqual(provider.spool.status(id)['refno'], '1001')
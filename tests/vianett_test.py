@@ -10,7 +10,7 @@ from smsframework import Gateway, OutgoingMessage
 from smsframework.providers import NullProvider
 from smsframework_vianett import VianettProvider
 
-from smsframework_vianett import error
+from smsframework_vianett import error, const
 
 
 class VianettProviderTest(unittest.TestCase):
@@ -64,6 +64,54 @@ class VianettProviderTest(unittest.TestCase):
         self._mock_response(22222222, '400', 'FAIL')
         self.assertRaises(error.VianettProviderError, gw.send, OutgoingMessage('+123456', 'hey', provider='main'))
 
+    def test_sender(self):
+        """ Senders are sent as they are; alphanumeric ones are typed """
+        provider = self.gw.get_provider('main')
+        requests = []
+
+        def _api_request(method, **params):
+            requests.append(params)
+            return '<ack refno="1" errorcode="200">OK</ack>'
+        provider.api._api_request = _api_request
+
+        for sender in ('MyShop', 'MyLongShopName', u'Привет', '+4790000000', '2021'):
+            provider.api.sendmsg('+4790000000', 'hey', SenderAddress=sender)
+        self.assertEqual([(r['SenderAddress'], r.get('SenderAddressType')) for r in requests], [
+            ('MyShop', const.SenderAddressType.ALPHANUMERIC),
+            ('MyLongShopName', const.SenderAddressType.ALPHANUMERIC),
+            (u'Привет', const.SenderAddressType.ALPHANUMERIC),
+            ('+4790000000', None),
+            ('2021', None),
+        ])
+
+    def test_send_many(self):
+        """ Test bulk send """
+        gw = self.gw
+        provider = gw.get_provider('main')
+
+        # Mock: refno is the destination number; '0' fails
+        def _api_request(method, **params):
+            errorcode = '400' if params['tel'] == '0' else '200'
+            return '<ack refno="{}" errorcode="{}">OK</ack>'.format(params['tel'], errorcode)
+        provider.api._api_request = _api_request
+
+        sent = []
+        gw.onSend += sent.append
+
+        # Ordered
+        messages = [OutgoingMessage(str(i), 'hey') for i in range(50)]
+        results = list(provider.send_many(messages, concurrency=8))
+        self.assertEqual([m for m, r in results], messages)
+        self.assertIsInstance(results[0][1], error.VianettProviderError)
+        self.assertEqual([r.msgid for m, r in results[1:]], [str(i) for i in range(1, 50)])
+        self.assertEqual(len(sent), 49)
+        self.assertEqual(sent[0].provider, 'main')
+
+        # Unordered
+        messages = [OutgoingMessage(str(i), 'hey') for i in range(1, 20)]
+        results = list(provider.send_many(iter(messages), concurrency=3, ordered=False))
+        self.assertEqual(sorted(r.msgid for m, r in results), sorted(m.dst for m in messages))
+
     @freeze_time('2014-07-01 12:00:00')
     def test_receive_message(self):
         """ Test message receipt """
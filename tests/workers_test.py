@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import signal
+import threading
+import unittest
+
+from smsframework import Gateway, OutgoingMessage, exc
+
+from smsframework_vianett import VianettProvider
+from smsframework_vianett.api import VianettApiError
+from smsframework_vianett.error import VianettProviderError
+
+from pool_test import AckServer
+
+if sys.version_info >= (3, 3):
+    from smsframework_vianett.workers import ProcessPool, _error_record, _error_from_record
+
+
+@unittest.skipIf(sys.version_info < (3, 3), 'Worker processes need Python 3')
+class ProcessPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AckServer()
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _pool(self, **options):
+        return ProcessPool(dict(accounts=[('kolypto', '1234')], endpoints=[self.server.host], keepalive=True), **options)
+
+    def _wait(self, condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.05)
+        return condition()
+
+    def test_provider(self):
+        """ Messages are sent from the worker processes """
+        gw = Gateway()
+        provider = gw.add_provider('main', VianettProvider, user='kolypto', password='1234',
+                                   endpoints=[self.server.host], processes=dict(processes=2, concurrency=4))
+        sent = []
+        gw.onSend += sent.append
+
+        message = gw.send(OutgoingMessage('+123', 'hey'))
+        self.assertEqual(message.msgid, '1')
+
+        results = list(provider.send_many([OutgoingMessage('+123', str(i)) for i in range(50)], concurrency=8))
+        self.assertEqual([r.body for m, r in results], [str(i) for i in range(50)])
+        self.assertEqual(len(sent), 51)
+        self.assertEqual(len(self.server.ports), 51)
+
+        # Errors are translated
+        self.server.status = 500
+        self.assertRaises(exc.MessageSendError, gw.send, OutgoingMessage('+123', 'hey'))
+        provider.close()
+        self.assertEqual(provider.workers.size, 0)
+
+    def test_errors(self):
+        """ Error records become the same exceptions as translate_error() gives """
+        e = _error_from_record(_error_record(VianettApiError('105', 'Invalid destination')))
+        self.assertIsInstance(e, VianettProviderError)
+        self.assertEqual(e.code, '105')
+        self.assertIsInstance(_error_from_record(_error_record(AssertionError('bad'))), exc.RequestError)
+
+    def test_restart(self):
+        """ Crashed workers are replaced, and their messages are sent again """
+        pool = self._pool(processes=1)
+        self.assertEqual(pool.sendmsg('+123', 'a', msgid='1'), '1')
+
+        os.kill(pool._workers[0].process.pid, signal.SIGKILL)
+        self.assertEqual(pool.sendmsg('+123', 'b', msgid='2'), '1')
+        self.assertEqual(pool.restarts, 1)
+        self.assertEqual(pool.size, 1)
+        pool.close()
+
+    def test_autoscale(self):
+        """ Workers are started under load, and stopped when idle """
+        pool = self._pool(processes=3, concurrency=1, idle_timeout=0.2)
+        self.assertEqual(pool.size, 1)
+
+        futures = [pool.submit('+123', str(i), {'msgid': str(i)}) for i in range(6)]
+        self.assertEqual(pool.size, 3)
+        self.assertEqual([f.result() for f in futures], ['1'] * 6)
+
+        self.assertTrue(self._wait(lambda: pool.size == 1))
+        pool.close()